@@ -0,0 +1,88 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam
+from werkzeug.local import LocalProxy
+from database import db, APIKey
+
+logger = logging.getLogger(__name__)
+
+class AccessTracker:
+    """Accumulates key reads in memory and writes them back in batches.
+
+    Read routes only touch a Counter; a timer thread turns the accumulated
+    counts into one executemany UPDATE every ACCESS_FLUSH_INTERVAL seconds
+    and once more at shutdown.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._counts = Counter()
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._timer = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['access_tracker'] = self
+        app.config.setdefault('ACCESS_FLUSH_INTERVAL', 30)
+        atexit.register(self.flush)
+
+    def record(self, key_ids):
+        now = datetime.utcnow()
+        with self._lock:
+            for key_id in key_ids:
+                self._counts[key_id] += 1
+                self._last_seen[key_id] = now
+            if self._timer is None:
+                self._schedule()
+
+    def _schedule(self):
+        self._timer = threading.Timer(self.app.config['ACCESS_FLUSH_INTERVAL'], self._run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run(self):
+        self.flush()
+        with self._lock:
+            self._timer = None
+            if self._counts:
+                self._schedule()
+
+    def flush(self):
+        """Write pending counts in one batched statement. Returns the number of keys updated."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            last_seen, self._last_seen = self._last_seen, {}
+        if not counts:
+            return 0
+
+        table = APIKey.__table__
+        stmt = table.update().where(table.c.id == bindparam('b_id')).values(
+            access_count=table.c.access_count + bindparam('b_count'),
+            last_accessed_at=bindparam('b_seen'),
+            # Keep the onupdate hook from touching updated_at for a read
+            updated_at=table.c.updated_at
+        )
+        params = [{'b_id': key_id, 'b_count': n, 'b_seen': last_seen[key_id]} for key_id, n in counts.items()]
+        try:
+            # Straight on the engine: access stats are not data changes and must not bump the revision
+            with self.app.app_context(), db.engine.begin() as conn:
+                conn.execute(stmt, params)
+            return len(params)
+        except Exception as e:
+            logger.error("Error flushing key access counts: %s", e)
+            with self._lock:
+                self._counts.update(counts)
+                for key_id, seen in last_seen.items():
+                    self._last_seen.setdefault(key_id, seen)
+            return 0
+
+# The tracker of the app in context
+access_tracker = LocalProxy(lambda: current_app.extensions['access_tracker'])
+# Write-behind key access tracking
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Run a command with a project's keys injected as environment variables.
+
+The agent pulls the project from a running manager (GET /v1/secrets/<project>)
+and keeps an encrypted copy on disk. Later runs send the cached revision, so an
+unchanged project costs one 304. When the manager cannot be reached the cached
+copy is used instead, so process startup does not depend on the network.
+
+Usage:
+    python agent.py --project my-service -- ./server --port 8080
+    flask agent --project my-service -- ./server --port 8080
+    python agent.py --project my-service              # print NAME=value lines
+
+Keys stored encrypted in the manager stay encrypted in the cache and are
+decrypted only in memory, with the password from --password-env.
+"""
+import argparse
+import base64
+import json
+import logging
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+logger = logging.getLogger('agent')
+
+DEFAULT_URL = os.environ.get('API_KEY_MANAGER_URL', 'http://localhost:5000')
+DEFAULT_CACHE_DIR = os.environ.get('AGENT_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'api-key-manager'))
+
+class AgentError(Exception):
+    pass
+
+class SecretCache:
+    """Fernet-encrypted copies of project payloads, one file per project.
+
+    The encryption key comes from AGENT_CACHE_KEY, or is generated once into
+    a key file readable only by the current user.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self.fernet = Fernet(self._load_key())
+
+    def _load_key(self):
+        if os.environ.get('AGENT_CACHE_KEY'):
+            return os.environ['AGENT_CACHE_KEY'].encode()
+        path = os.path.join(self.directory, 'cache.key')
+        try:
+            with open(path, 'rb') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            key = Fernet.generate_key()
+            # O_EXCL: if another agent created the key first, use theirs
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                return self._load_key()
+            with os.fdopen(fd, 'wb') as f:
+                f.write(key)
+            return key
+
+    def _path(self, project):
+        return os.path.join(self.directory, urllib.parse.quote(project, safe='') + '.cache')
+
+    def load(self, project):
+        try:
+            with open(self._path(project), 'rb') as f:
+                return json.loads(self.fernet.decrypt(f.read()))
+        except FileNotFoundError:
+            return None
+        except (InvalidToken, ValueError):
+            logger.warning("Ignoring unreadable cache for project %s", project)
+            return None
+
+    def save(self, project, payload):
+        path = self._path(project)
+        fd = os.open(path + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.fernet.encrypt(json.dumps(payload).encode()))
+        os.replace(path + '.tmp', path)
+
+def fetch_project(url, project, cached=None, timeout=3.0):
+    """Fetch a project's payload, or return `cached` if the manager reports no change."""
+    request = urllib.request.Request(f"{url.rstrip('/')}/v1/secrets/{urllib.parse.quote(project, safe='')}")
+    if cached:
+        request.add_header('If-None-Match', f'"{cached["revision"]}"')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = json.load(response)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            cached['fetched_at'] = time.time()
+            return cached
+        if e.code == 404:
+            raise AgentError(f"Project '{project}' not found on {url}")
+        raise
+    payload['fetched_at'] = time.time()
+    return payload
+
+def load_secrets(args):
+    """Current payload for the project: fresh, revalidated or cached."""
+    cache = SecretCache(args.cache_dir)
+    cached = cache.load(args.project)
+    try:
+        payload = fetch_project(args.url, args.project, cached, args.timeout)
+        cache.save(args.project, payload)
+        if cached is None or payload['revision'] != cached['revision']:
+            logger.info("Fetched project %s at revision %s", args.project, payload['revision'])
+        return payload
+    except AgentError:
+        raise
+    except (OSError, ValueError) as e:  # URLError, timeouts and bad responses
+        if cached is None:
+            raise AgentError(f"Manager unreachable ({e}) and no cached copy of project '{args.project}'")
+        age = time.time() - cached.get('fetched_at', 0)
+        if args.max_stale is not None and age > args.max_stale:
+            raise AgentError(f"Manager unreachable ({e}) and the cached copy is {age:.0f}s old")
+        logger.warning("Manager unreachable (%s), using cached revision %s from %.0fs ago", e, cached['revision'], age)
+        return cached
+
+def build_environment(secrets, password=None):
+    """Map key names to plaintext values, decrypting encrypted keys in memory."""
+    env = {}
+    for secret in secrets:
+        value = secret['value']
+        if secret['encrypted']:
+            if password is None:
+                raise AgentError(f"Key {secret['name']} is encrypted; pass the password with --password-env")
+            value = decrypt_value(value, secret['salt'], password)
+        if '=' in secret['name'] or not secret['name']:
+            logger.warning("Skipping key %r: not a valid environment variable name", secret['name'])
+            continue
+        env[secret['name']] = value
+    return env
+
+def derive_key(password, salt):
+    """The Fernet key the manager derives from a password; same KDF and parameters as database.generate_key."""
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=100000)
+    return base64.urlsafe_b64encode(kdf.derive(password.encode()))
+
+def decrypt_value(value, salt, password):
+    key = derive_key(password, base64.b64decode(salt))
+    try:
+        return Fernet(key).decrypt(base64.b64decode(value)).decode('utf-8')
+    except InvalidToken:
+        raise AgentError('Wrong password for encrypted keys')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--project', required=True, help='Project whose keys are injected')
+    parser.add_argument('--url', default=DEFAULT_URL, help='Manager base URL (default: $API_KEY_MANAGER_URL)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Where the encrypted cache is kept')
+    parser.add_argument('--timeout', type=float, default=3.0, help='Seconds to wait for the manager')
+    parser.add_argument('--max-stale', type=float, default=None, help='Refuse a cached copy older than this many seconds')
+    parser.add_argument('--password-env', help='Environment variable holding the password for encrypted keys')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='Command to run, after --')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='agent: %(message)s', stream=sys.stderr)
+
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    password = os.environ.get(args.password_env) if args.password_env else None
+    try:
+        payload = load_secrets(args)
+        secrets = build_environment(payload['secrets'], password)
+    except AgentError as e:
+        logger.error(str(e))
+        return 1
+
+    if not command:
+        for name, value in secrets.items():
+            print(f"{name}={value}")
+        return 0
+
+    env = dict(os.environ)
+    if args.password_env:
+        # The child gets the decrypted keys, not the password that unlocks all of them
+        env.pop(args.password_env, None)
+    env.update(secrets)
+    try:
+        os.execvpe(command[0], command, env)
+    except OSError as e:
+        logger.error("Cannot run %s: %s", command[0], e)
+        return 127
+
+if __name__ == '__main__':
+    sys.exit(main())
+# Local secrets agent
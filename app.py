@@ -1,49 +1,241 @@
 import logging
-import logging.config
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, after_this_request
-from flask_migrate import Migrate
-from database import db, APIKey, Project
-from datetime import datetime
+import click
+from flask import Blueprint, Flask, Response, current_app, render_template, request, jsonify, redirect, url_for, after_this_request, stream_with_context
+from sqlalchemy.engine import make_url
+from config import get_config
+from log_pipeline import init_logging
+from query_stats import init_query_stats
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, export_rows, import_rows, init_metrics, render_metrics
+from database import db, APIKey, ChangeLog, DataRevision, Job, Project, current_revision, bump_revision, compact_change_log, generate_key
+from jobs import ACTIVE, JobPool, get_job, job_handler, job_pool
+from access_tracker import AccessTracker, access_tracker
+from secrets_index import SecretIndex, secret_index
+from export_cache import ExportCache, export_cache
+from fingerprints import fingerprint, init_fingerprints, refresh_fingerprints, register_sql_function
+from kdf_scheduler import KdfScheduler, kdf_limited, kdf_scheduler
+from storage import init_migrations, init_storage, read_pragmas, replace_database, upgrade_database_file
+from exporters import EXPORT_FORMATS, ExportRow, file_label, iter_export, iter_zip
+from backups import COMPRESSIONS, BackupScheduler, get_compressor, init_backups, iter_file, list_backups, read_backup_status, snapshot_database
+from datetime import datetime, timedelta
 import re
 import os
-import io
+import sys
 import json
-import yaml
 import tempfile
+import uuid
 import sqlite3
-import shutil
 
-logging.config.fileConfig('logging.conf')
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-# Ensure instance folder exists
-if not os.path.exists(app.instance_path):
-    os.makedirs(app.instance_path)
+bp = Blueprint('main', __name__, cli_group=None)
 
-# Use instance path for database
-db_path = os.path.join(app.instance_path, 'keys.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = True
-app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-fallback-secret')
+def create_app(config=None):
+    """Build the application.
 
-db.init_app(app)
-migrate = Migrate(app, db)
+    `config` is a config name from config.CONFIGS, a config class, or a dict
+    of overrides applied on top of the APP_CONFIG environment's class.
+    """
+    app = Flask(__name__)
+    if isinstance(config, dict):
+        app.config.from_object(get_config())
+        app.config.update(config)
+    else:
+        app.config.from_object(config if isinstance(config, type) else get_config(config))
 
-@app.route('/')
+    init_logging(app)
+    if not app.debug and app.config['SECRET_KEY'] == 'dev-fallback-secret':
+        logger.warning("FLASK_SECRET_KEY is not set; using the development fallback secret")
+    init_query_stats(app)
+
+    # Ensure instance folder exists
+    os.makedirs(app.instance_path, exist_ok=True)
+    init_fingerprints(app)
+    
+    # Use instance path for database unless told otherwise
+    if 'SQLALCHEMY_DATABASE_URI' in app.config and not app.config['DATABASE_PATH']:
+        app.config['DATABASE_PATH'] = make_url(app.config['SQLALCHEMY_DATABASE_URI']).database
+    app.config['DATABASE_PATH'] = app.config['DATABASE_PATH'] or os.path.join(app.instance_path, 'keys.db')
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', f"sqlite:///{app.config['DATABASE_PATH']}")
+
+    init_metrics(app)
+    init_storage(app)
+    db.init_app(app)
+    init_migrations(app, db)
+    # Each app gets its own; the module-level names resolve to those of current_app
+    AccessTracker(app)
+    ExportCache(app)
+    SecretIndex(app)
+    KdfScheduler(app)
+    JobPool(app)
+    init_backups(app, app.config['DATABASE_PATH'])
+    app.register_blueprint(bp)
+    return app
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/keys/<int:key_id>', methods=['GET'])
+@bp.route('/keys/<int:key_id>', methods=['GET'])
 def get_key(key_id):
     try:
         key = APIKey.query.get_or_404(key_id)
+        access_tracker.record([key.id])
         return jsonify(key.to_dict())
     except Exception as e:
-        logger.error(f"Error fetching key {key_id}: {str(e)}")
+        logger.error("Error fetching key %s: %s", key_id, e)
         return jsonify({'error': 'Key not found'}), 404
 
-@app.route('/keys', methods=['GET'])
+@bp.route('/keys/stale', methods=['GET'])
+def get_stale_keys():
+    """List keys not read in the last `days` days, least recently used first."""
+    try:
+        days = request.args.get('days', 90, type=int)
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        
+        # Pending reads count too, otherwise a busy key could look stale until the next flush
+        access_tracker.flush()
+        
+        keys = APIKey.query.filter(
+            db.or_(APIKey.last_accessed_at.is_(None), APIKey.last_accessed_at < cutoff)
+        ).order_by(APIKey.last_accessed_at).all()
+        
+        return jsonify({
+            'days': days,
+            'count': len(keys),
+            'keys': [{
+                'id': key.id,
+                'name': key.name,
+                'project_id': key.project_id,
+                'last_accessed_at': key.last_accessed_at.isoformat() if key.last_accessed_at else None,
+                'access_count': key.access_count
+            } for key in keys]
+        }), 200
+    except Exception as e:
+        logger.error("Error fetching stale keys: %s", e)
+        return jsonify({'error': f'Failed to fetch stale keys: {str(e)}'}), 500
+
+def key_summary(key):
+    return {
+        'id': key.id,
+        'name': key.name,
+        'project_id': key.project_id,
+        'encrypted': key.encrypted
+    }
+
+def unindexed_count():
+    """Keys lookups cannot see: encrypted before fingerprints existed and not decrypted since."""
+    return APIKey.query.filter(APIKey.fingerprint.is_(None)).count()
+
+@bp.route('/keys/lookup', methods=['POST'])
+def lookup_keys():
+    """Find the keys holding a value, encrypted or not, by its fingerprint. Body: {"value": ...}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        value = data.get('value')
+        if not isinstance(value, str) or not value:
+            return jsonify({'error': 'value is required'}), 400
+        
+        keys = APIKey.query.filter_by(fingerprint=fingerprint(value)).order_by(APIKey.id).all()
+        # Never log the value itself
+        logger.info("Lookup matched %s keys", len(keys))
+        return jsonify({
+            'count': len(keys),
+            'keys': [key_summary(key) for key in keys],
+            'unindexed': unindexed_count()
+        }), 200
+    except Exception as e:
+        logger.error("Error looking up keys: %s", e)
+        return jsonify({'error': 'Failed to look up keys'}), 500
+
+@bp.route('/keys/duplicates', methods=['GET'])
+def get_duplicate_keys():
+    """Groups of keys holding the same value, largest groups first."""
+    try:
+        groups = db.session.query(APIKey.fingerprint, db.func.count().label('count')).filter(
+            APIKey.fingerprint.isnot(None)
+        ).group_by(APIKey.fingerprint).having(db.func.count() > 1).subquery()
+        keys = APIKey.query.join(groups, APIKey.fingerprint == groups.c.fingerprint).order_by(
+            groups.c.count.desc(), APIKey.fingerprint, APIKey.id
+        ).all()
+        
+        duplicates = {}
+        for key in keys:
+            duplicates.setdefault(key.fingerprint, []).append(key_summary(key))
+        return jsonify({
+            'count': len(duplicates),
+            'duplicates': [{'fingerprint': fp, 'count': len(group), 'keys': group} for fp, group in duplicates.items()],
+            'unindexed': unindexed_count()
+        }), 200
+    except Exception as e:
+        logger.error("Error finding duplicate keys: %s", e)
+        return jsonify({'error': f'Failed to find duplicate keys: {str(e)}'}), 500
+
+@bp.route('/v1/secrets/<project_name>/<key_name>', methods=['GET'])
+def get_secret(project_name, key_name):
+    """Read one key by project and name from the in-memory index."""
+    try:
+        revision, (secret,) = secret_index.resolve([(project_name, key_name)])
+        if secret is None:
+            return jsonify({'error': 'Secret not found'}), 404
+        access_tracker.record([secret['id']])
+        response = jsonify(secret)
+        response.headers['X-Data-Revision'] = str(revision)
+        return response
+    except Exception as e:
+        logger.error("Error reading secret %s/%s: %s", project_name, key_name, e)
+        return jsonify({'error': 'Failed to read secret'}), 500
+
+@bp.route('/v1/secrets/<project_name>', methods=['GET'])
+def get_project_secrets(project_name):
+    """All keys of a project from the in-memory index.
+
+    The ETag is the data revision, so clients holding a copy can send
+    If-None-Match and get a 304 when nothing changed.
+    """
+    try:
+        revision, secrets = secret_index.project(project_name)
+        if secrets is None:
+            return jsonify({'error': 'Project not found'}), 404
+        
+        response = jsonify({'project': project_name, 'revision': revision, 'secrets': secrets})
+        response.headers['X-Data-Revision'] = str(revision)
+        response.set_etag(str(revision))
+        response = response.make_conditional(request)
+        if response.status_code == 200:
+            access_tracker.record([secret['id'] for secret in secrets])
+        return response
+    except Exception as e:
+        logger.error("Error reading secrets of project %s: %s", project_name, e)
+        return jsonify({'error': 'Failed to read secrets'}), 500
+
+@bp.route('/v1/secrets/resolve', methods=['POST'])
+def resolve_secrets():
+    """Read many keys at once. Body: {"secrets": [{"project": ..., "name": ...}, ...]}"""
+    try:
+        data = request.get_json()
+        refs = data.get('secrets') if data else None
+        if not isinstance(refs, list) or not all(isinstance(ref, dict) and 'project' in ref and 'name' in ref for ref in refs):
+            return jsonify({'error': 'secrets must be a list of {"project", "name"} objects'}), 400
+        if len(refs) > current_app.config['SECRETS_RESOLVE_LIMIT']:
+            return jsonify({'error': f"At most {current_app.config['SECRETS_RESOLVE_LIMIT']} secrets per request"}), 400
+        
+        pairs = [(ref['project'], ref['name']) for ref in refs]
+        revision, found = secret_index.resolve(pairs)
+        secrets = [secret for secret in found if secret is not None]
+        access_tracker.record([secret['id'] for secret in secrets])
+        
+        response = jsonify({
+            'revision': revision,
+            'secrets': secrets,
+            'missing': [{'project': project, 'name': name} for (project, name), secret in zip(pairs, found) if secret is None]
+        })
+        response.headers['X-Data-Revision'] = str(revision)
+        return response
+    except Exception as e:
+        logger.error("Error resolving secrets: %s", e)
+        return jsonify({'error': 'Failed to resolve secrets'}), 500
+
+@bp.route('/keys', methods=['GET'])
 def get_keys():
     try:
         logger.info("Fetching all keys from database...")
@@ -57,53 +249,223 @@ def get_keys():
         elif project_id is None and request.args.get('show_all') != 'true':
             # If no project specified and not showing all, show only unassigned keys
             query = query.filter_by(project_id=None)
+        else:
+            query = query.filter(not_being_deleted())
             
         # Order by position within each project
         keys = query.order_by(APIKey.project_id, APIKey.position).all()
         
-        logger.info(f"Found {len(keys)} keys")
+        logger.info("Found %s keys", len(keys))
         result = [key.to_dict() for key in keys]
         logger.info("Successfully serialized keys to JSON")
-        return jsonify(result)
+        response = jsonify(result)
+        response.headers['X-Data-Revision'] = str(current_revision())
+        return response
     except Exception as e:
-        logger.error(f"Error fetching keys: {str(e)}")
+        logger.error("Error fetching keys: %s", e)
         logger.exception("Full traceback:")
         return jsonify({'error': f'Failed to fetch keys: {str(e)}'}), 500
 
-@app.route('/keys', methods=['DELETE'])
+def delete_keys_in_chunks(*criteria, job=None):
+    """Delete matching keys a chunk at a time, committing after each chunk.
+
+    Each commit releases SQLite's write lock so other requests can run in between.
+    In a job, every chunk is a checkpoint and a resumed job counts on from it.
+    """
+    chunk_size = current_app.config['DELETE_CHUNK_SIZE']
+    deleted = job.done if job else 0
+    while True:
+        chunk = db.session.query(APIKey.id).filter(*criteria).limit(chunk_size)
+        count = APIKey.query.filter(APIKey.id.in_(chunk)).delete(synchronize_session=False)
+        deleted += count
+        if job:
+            job.checkpoint(deleted)
+        else:
+            db.session.commit()
+        if not count:
+            return deleted
+
+def not_being_deleted():
+    """Criterion for keys outside projects whose deletion is under way; those are gone as far as clients are concerned."""
+    deleting = db.session.query(Project.id).filter_by(deleting=True)
+    return db.or_(APIKey.project_id.is_(None), APIKey.project_id.notin_(deleting))
+
+class ProjectDeleting(Exception):
+    """Keys were about to be written to a project that is being deleted."""
+
+    def __init__(self):
+        super().__init__('Project is being deleted')
+
+    def response(self):
+        return jsonify({'error': str(self)}), 409
+
+def check_project_accepts_keys(project_id):
+    """Raise ProjectDeleting if the project is being deleted. Call after adding the keys.
+
+    The flush takes SQLite's write lock, so a concurrent delete has either
+    set its flag already, and it is seen here, or starts after this commit
+    and removes these keys along with the rest.
+    """
+    if project_id is None:
+        return
+    db.session.flush()
+    if db.session.query(Project.deleting).filter_by(id=project_id).scalar():
+        raise ProjectDeleting()
+
+def wants_background():
+    return request.args.get('background', 'false').lower() == 'true'
+
+@bp.route('/keys', methods=['DELETE'])
 def delete_all_keys():
     try:
         # Get count before deletion for logging
         count = APIKey.query.count()
         
+        if wants_background():
+            job = job_pool.submit('delete_all_keys', total=count)
+            return jsonify({'message': f'Deleting {count} keys', 'job': job.to_dict()}), 202
+        
         # Delete all keys
-        APIKey.query.delete()
-        db.session.commit()
+        count = delete_keys_in_chunks()
         
-        logger.info(f"Successfully deleted all {count} keys")
+        logger.info("Successfully deleted all %s keys", count)
         return jsonify({'message': f'Successfully deleted {count} keys', 'count': count}), 200
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error deleting all keys: {str(e)}")
+        logger.error("Error deleting all keys: %s", e)
         return jsonify({'error': 'Failed to delete all keys'}), 500
 
-@app.route('/projects/<int:project_id>/keys', methods=['DELETE'])
+@bp.route('/projects/<int:project_id>/keys', methods=['DELETE'])
 def delete_project_keys(project_id):
     try:
         # Get count before deletion for logging
         count = APIKey.query.filter_by(project_id=project_id).count()
         
+        if wants_background():
+            job = job_pool.submit('delete_project_keys', {'project_id': project_id}, total=count)
+            return jsonify({'message': f'Deleting {count} keys', 'job': job.to_dict()}), 202
+        
         # Delete project-specific keys
-        APIKey.query.filter_by(project_id=project_id).delete()
-        db.session.commit()
+        count = delete_keys_in_chunks(APIKey.project_id == project_id)
         
-        logger.info(f"Successfully deleted {count} keys from project {project_id}")
+        logger.info("Successfully deleted %s keys from project %s", count, project_id)
         return jsonify({'message': f'Successfully deleted {count} keys', 'count': count}), 200
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error deleting keys from project {project_id}: {str(e)}")
+        logger.error("Error deleting keys from project %s: %s", project_id, e)
         return jsonify({'error': f'Failed to delete keys from project {project_id}'}), 500
 
+@job_handler('delete_all_keys')
+def delete_all_keys_job(job):
+    return {'keys_deleted': delete_keys_in_chunks(job=job)}
+
+@job_handler('delete_project_keys')
+def delete_project_keys_job(job):
+    return {'keys_deleted': delete_keys_in_chunks(APIKey.project_id == job.params['project_id'], job=job)}
+
+@bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Recent jobs, newest first; `active=true` lists only queued, running and paused ones."""
+    query = Job.query
+    if request.args.get('active', 'false').lower() == 'true':
+        query = query.filter(Job.status.in_(ACTIVE))
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify([job.to_dict() for job in query.order_by(Job.created_at.desc()).limit(limit)]), 200
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+@bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a job; a running one stops after its current batch, keeping what it already committed."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status in ('completed', 'cancelled'):
+        return jsonify({'error': f'Job is already {job.status}'}), 409
+    job = job_pool.cancel(job_id)
+    return jsonify(job.to_dict()), 202 if job.status == 'running' else 200
+
+# Body fields a paused job needs again to resume; 'password' unless listed
+JOB_SECRETS = {'rotate_password': ('old_password', 'new_password')}
+
+@bp.route('/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    """Queue a paused or failed job again from its last checkpoint; password jobs need `password`."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status not in ('paused', 'failed'):
+        return jsonify({'error': f'Only paused or failed jobs can be resumed, this one is {job.status}'}), 409
+    secrets = None
+    if job.needs_secret:
+        data = request.get_json(silent=True) or {}
+        names = JOB_SECRETS.get(job.kind, ('password',))
+        secrets = {name: data.get(name) for name in names}
+        if not all(secrets.values()):
+            return jsonify({'error': f'Required to resume this job: {", ".join(names)}'}), 400
+    job = job_pool.resume(job_id, secrets)
+    return jsonify(job.to_dict()), 202
+
+@bp.route('/sync', methods=['GET'])
+def sync():
+    """Projects and keys changed since a revision, with tombstones for deletes.
+
+    Query params: `since` (the `revision` of the previous sync). Without it,
+    or when the log has been compacted past it, the response is a full
+    snapshot with `full: true` and the client should replace its copy.
+    """
+    try:
+        since = request.args.get('since', type=int)
+        # The reads below are separate statements and may see writes committed after `revision`.
+        # That only repeats them: their log entries are past `revision`, so the next sync sends them again.
+        revision, compacted = db.session.query(DataRevision.value, DataRevision.compacted_through).filter_by(id=1).one()
+        full = since is None or since < compacted or since > revision
+
+        keys = APIKey.query.options(db.joinedload(APIKey.project)).filter(not_being_deleted())
+        projects = Project.query.filter_by(deleting=False)
+        deleted = {'projects': [], 'keys': []}
+        if not full:
+            def changed(entity, op):
+                return db.session.query(ChangeLog.entity_id).filter(
+                    ChangeLog.entity == entity, ChangeLog.op == op,
+                    ChangeLog.revision > since, ChangeLog.revision <= revision)
+            keys = keys.filter(APIKey.id.in_(changed('key', 'upsert')))
+            projects = projects.filter(Project.id.in_(changed('project', 'upsert')))
+            deleted = {
+                # Projects being deleted, and the keys still in them, count as deleted already
+                'projects': sorted({row.entity_id for row in changed('project', 'delete')} |
+                                   {row.id for row in db.session.query(Project.id).filter_by(deleting=True)}),
+                'keys': sorted({row.entity_id for row in changed('key', 'delete')} |
+                               {row.id for row in db.session.query(APIKey.id).filter(db.not_(not_being_deleted()))})
+            }
+
+        return jsonify({
+            'revision': revision,
+            'since': since,
+            'full': full,
+            'projects': [project.to_dict() for project in projects.order_by(Project.position)],
+            'keys': [key.to_dict() for key in keys.order_by(APIKey.project_id, APIKey.position)],
+            'deleted': deleted
+        }), 200
+    except Exception as e:
+        logger.error("Error syncing changes: %s", e)
+        return jsonify({'error': f'Failed to sync changes: {str(e)}'}), 500
+
+def next_position(model, *criteria):
+    """Next free position as a subquery, so it is computed inside the INSERT itself.
+
+    SQLite evaluates it under the write lock taken by the INSERT, which keeps
+    concurrent writers from handing out the same position.
+    """
+    return db.session.query(
+        db.func.coalesce(db.func.max(model.position), -1) + 1
+    ).filter(*criteria).correlate(None).scalar_subquery()
+
 def generate_unique_name(base_name, project_id=None):
     """Generate a unique name by adding a numeric suffix if needed."""
     name = base_name
@@ -115,7 +477,7 @@ def generate_unique_name(base_name, project_id=None):
         name = f"{base_name}{counter}"
         counter += 1
 
-@app.route('/keys', methods=['POST'])
+@bp.route('/keys', methods=['POST'])
 def add_key():
     try:
         data = request.get_json()
@@ -124,45 +486,45 @@ def add_key():
         
         project_id = data.get('project_id')
         unique_name = generate_unique_name(data['name'], project_id)
-        
-        # Get the maximum position for the project
-        max_position = db.session.query(db.func.max(APIKey.position)).filter(
-            APIKey.project_id == project_id
-        ).scalar() or -1
             
         new_key = APIKey(
             name=unique_name,
             key=data['key'],
+            fingerprint=fingerprint(data['key']),
             description=data.get('description'),
             used_with=data.get('used_with'),
             project_id=project_id,
-            position=max_position + 1
+            position=next_position(APIKey, APIKey.project_id == project_id)
         )
         
         db.session.add(new_key)
+        check_project_accepts_keys(project_id)
         db.session.commit()
-        logger.info(f"Added new key: {unique_name}")
+        logger.info("Added new key: %s", unique_name)
         return jsonify(new_key.to_dict()), 201
         
+    except ProjectDeleting as e:
+        db.session.rollback()
+        return e.response()
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error adding key: {str(e)}")
+        logger.error("Error adding key: %s", e)
         return jsonify({'error': 'Failed to add key'}), 500
 
-@app.route('/keys/<int:key_id>', methods=['DELETE'])
+@bp.route('/keys/<int:key_id>', methods=['DELETE'])
 def delete_key(key_id):
     try:
         key = APIKey.query.get_or_404(key_id)
         db.session.delete(key)
         db.session.commit()
-        logger.info(f"Deleted key: {key.name}")
+        logger.info("Deleted key: %s", key.name)
         return jsonify({'message': 'Key deleted successfully'}), 200
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error deleting key: {str(e)}")
+        logger.error("Error deleting key: %s", e)
         return jsonify({'error': 'Failed to delete key'}), 500
 
-@app.route('/keys/<int:key_id>', methods=['PUT'])
+@bp.route('/keys/<int:key_id>', methods=['PUT'])
 def update_key(key_id):
     try:
         key = APIKey.query.get_or_404(key_id)
@@ -173,6 +535,7 @@ def update_key(key_id):
             key.name = unique_name
         if 'key' in data:
             key.key = data['key']
+            key.fingerprint = None if key.encrypted else fingerprint(key.key)
         if 'description' in data:
             key.description = data['description']
         if 'used_with' in data:
@@ -182,47 +545,50 @@ def update_key(key_id):
             # If project changed, check if name needs to be updated
             if key.project_id != data['project_id']:
                 key.name = generate_unique_name(key.name, data['project_id'])
+            check_project_accepts_keys(key.project_id)
             
         db.session.commit()
-        logger.info(f"Updated key: {key.name}")
+        logger.info("Updated key: %s", key.name)
         return jsonify(key.to_dict()), 200
+    except ProjectDeleting as e:
+        db.session.rollback()
+        return e.response()
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error updating key: {str(e)}")
+        logger.error("Error updating key: %s", e)
         return jsonify({'error': 'Failed to update key'}), 500
 
-@app.route('/projects', methods=['GET'])
+@bp.route('/projects', methods=['GET'])
 def get_projects():
     try:
-        projects = Project.query.order_by(Project.position).all()
-        return jsonify([project.to_dict() for project in projects])
+        projects = Project.query.filter_by(deleting=False).order_by(Project.position).all()
+        response = jsonify([project.to_dict() for project in projects])
+        response.headers['X-Data-Revision'] = str(current_revision())
+        return response
     except Exception as e:
-        logger.error(f"Error fetching projects: {str(e)}")
+        logger.error("Error fetching projects: %s", e)
         return jsonify({'error': 'Failed to fetch projects'}), 500
 
-@app.route('/projects', methods=['POST'])
+@bp.route('/projects', methods=['POST'])
 def create_project():
     try:
         data = request.get_json()
         if not data or 'name' not in data:
             return jsonify({'error': 'Project name required'}), 400
             
-        # Get the maximum position
-        max_position = db.session.query(db.func.max(Project.position)).scalar() or -1
-            
         new_project = Project(
             name=data['name'],
-            position=max_position + 1
+            position=next_position(Project)
         )
         db.session.add(new_project)
         db.session.commit()
         return jsonify(new_project.to_dict()), 201
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error creating project: {str(e)}")
+        logger.error("Error creating project: %s", e)
         return jsonify({'error': 'Failed to create project'}), 500
 
-@app.route('/projects/<int:project_id>', methods=['DELETE'])
+@bp.route('/projects/<int:project_id>', methods=['DELETE'])
 def delete_project(project_id):
     try:
         project = Project.query.get_or_404(project_id)
@@ -234,17 +600,28 @@ def delete_project(project_id):
         associated_keys_count = APIKey.query.filter_by(project_id=project_id).count()
         
         if delete_keys:
-            # Delete all associated keys first
-            APIKey.query.filter_by(project_id=project_id).delete()
-            logger.info(f"Deleted {associated_keys_count} keys associated with project {project_id}")
+            # Hide the project straight away, the keys are then removed in chunks
+            project.deleting = True
+            db.session.commit()
+            
+            if wants_background():
+                job = job_pool.submit('delete_project', {'project_id': project_id}, total=associated_keys_count)
+                return jsonify({
+                    'message': 'Project deletion started',
+                    'keys_affected': associated_keys_count,
+                    'action': 'deleted',
+                    'job': job.to_dict()
+                }), 202
+            
+            delete_project_with_keys(None, project_id)
         else:
             # If not deleting keys, unassign them from the project
             APIKey.query.filter_by(project_id=project_id).update({APIKey.project_id: None})
-            logger.info(f"Unassigned {associated_keys_count} keys from project {project_id}")
-        
-        # Delete the project
-        db.session.delete(project)
-        db.session.commit()
+            logger.info("Unassigned %s keys from project %s", associated_keys_count, project_id)
+            
+            # Delete the project
+            db.session.delete(project)
+            db.session.commit()
         
         response_message = {
             'message': 'Project deleted successfully',
@@ -254,23 +631,48 @@ def delete_project(project_id):
         return jsonify(response_message), 200
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error deleting project: {str(e)}")
+        logger.error("Error deleting project: %s", e)
         return jsonify({'error': 'Failed to delete project'}), 500
 
-@app.route('/keys/<int:key_id>/project', methods=['PATCH'])
+@job_handler('delete_project')
+def delete_project_job(job):
+    return delete_project_with_keys(job, job.params['project_id'])
+
+def delete_project_with_keys(job, project_id):
+    """Delete a hidden project's keys in chunks, then the project itself."""
+    try:
+        count = delete_keys_in_chunks(APIKey.project_id == project_id, job=job)
+        logger.info("Deleted %s keys associated with project %s", count, project_id)
+        Project.query.filter_by(id=project_id).delete()
+        db.session.commit()
+        return {'keys_deleted': count}
+    except Exception:
+        # Show the project again so the deletion can be retried
+        db.session.rollback()
+        Project.query.filter_by(id=project_id).update({Project.deleting: False, Project.name: Project.name})
+        # Sync clients were told it was deleted; rewriting a tracked column logs it and its keys again
+        APIKey.query.filter_by(project_id=project_id).update({APIKey.position: APIKey.position})
+        db.session.commit()
+        raise
+
+@bp.route('/keys/<int:key_id>/project', methods=['PATCH'])
 def update_key_project(key_id):
     try:
         key = APIKey.query.get_or_404(key_id)
         data = request.get_json()
         key.project_id = data.get('project_id')
+        check_project_accepts_keys(key.project_id)
         db.session.commit()
         return jsonify(key.to_dict()), 200
+    except ProjectDeleting as e:
+        db.session.rollback()
+        return e.response()
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error updating key project: {str(e)}")
+        logger.error("Error updating key project: %s", e)
         return jsonify({'error': 'Failed to update project'}), 500
 
-@app.route('/projects/<int:project_id>', methods=['PUT'])
+@bp.route('/projects/<int:project_id>', methods=['PUT'])
 def update_project(project_id):
     try:
         project = Project.query.get_or_404(project_id)
@@ -282,14 +684,14 @@ def update_project(project_id):
             project.name = data['name']
             
         db.session.commit()
-        logger.info(f"Updated project: {project.name}")
+        logger.info("Updated project: %s", project.name)
         return jsonify(project.to_dict()), 200
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error updating project: {str(e)}")
+        logger.error("Error updating project: %s", e)
         return jsonify({'error': 'Failed to update project'}), 500
 
-@app.route('/keys/<int:key_id>/reorder', methods=['PATCH'])
+@bp.route('/keys/<int:key_id>/reorder', methods=['PATCH'])
 def reorder_key(key_id):
     try:
         data = request.get_json()
@@ -301,8 +703,8 @@ def reorder_key(key_id):
         old_position = key.position
         target_project_id = data.get('project_id', key.project_id)  # Default to current project if not specified
 
-        logger.info(f"Reordering key {key.name} from position {old_position} to {new_position}")
-        logger.info(f"Project change: {key.project_id} -> {target_project_id}")
+        logger.info("Reordering key %s from position %s to %s (project %s -> %s)",
+                    key.name, old_position, new_position, key.project_id, target_project_id)
 
         with db.session.begin_nested():  # Create a savepoint
             if target_project_id == key.project_id and new_position >= 0:
@@ -315,7 +717,7 @@ def reorder_key(key_id):
                         APIKey.position > old_position,
                         APIKey.id != key_id
                     ).update({APIKey.position: APIKey.position - 1})
-                    logger.info(f"Updated {affected} keys moving forward")
+                    logger.info("Updated %s keys moving forward", affected)
                 else:
                     # Moving backward: update positions of keys between new and old position
                     affected = APIKey.query.filter(
@@ -324,7 +726,7 @@ def reorder_key(key_id):
                         APIKey.position < old_position,
                         APIKey.id != key_id
                     ).update({APIKey.position: APIKey.position + 1})
-                    logger.info(f"Updated {affected} keys moving backward")
+                    logger.info("Updated %s keys moving backward", affected)
             else:
                 # Moving to a different project or to the end of current project
                 # Close the gap in the old project if changing projects
@@ -333,7 +735,7 @@ def reorder_key(key_id):
                         APIKey.project_id == key.project_id,
                         APIKey.position > old_position
                     ).update({APIKey.position: APIKey.position - 1})
-                    logger.info(f"Updated {affected_old} keys in old project")
+                    logger.info("Updated %s keys in old project", affected_old)
 
                 # Get max position in target project
                 max_position = db.session.query(db.func.max(APIKey.position)).filter(
@@ -348,24 +750,31 @@ def reorder_key(key_id):
             db.session.flush()  # Ensure all position updates are applied
 
             # Normalize positions within the affected projects
+            fixed = 0
             for project_id in {key.project_id, target_project_id}:
                 if project_id is not None:
                     keys = APIKey.query.filter_by(project_id=project_id).order_by(APIKey.position).all()
                     for i, k in enumerate(keys):
                         if k.position != i:
                             k.position = i
-                            logger.info(f"Fixed position for key {k.name}: {k.position} -> {i}")
+                            fixed += 1
+            if fixed:
+                logger.debug("Fixed the positions of %d keys", fixed)
+            check_project_accepts_keys(target_project_id)
 
         db.session.commit()
-        logger.info(f"Successfully reordered key {key.name} to position {new_position}")
+        logger.info("Successfully reordered key %s to position %s", key.name, new_position)
         return jsonify(key.to_dict()), 200
+    except ProjectDeleting as e:
+        db.session.rollback()
+        return e.response()
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error reordering key: {str(e)}")
+        logger.error("Error reordering key: %s", e)
         logger.exception("Full traceback:")
         return jsonify({'error': f'Failed to reorder key: {str(e)}'}), 500
 
-@app.route('/projects/<int:project_id>/import-env', methods=['POST'])
+@bp.route('/projects/<int:project_id>/import-env', methods=['POST'])
 def import_env_file(project_id):
     try:
         if 'file' not in request.files:
@@ -386,7 +795,7 @@ def import_env_file(project_id):
             file_ext = os.path.splitext(filename)[1]
         
         # Log the file details for debugging
-        logger.info(f"Attempting to import file: {file.filename} (extension: {file_ext})")
+        logger.info("Attempting to import file: %s (extension: %s)", file.filename, file_ext)
         
         if file_ext not in allowed_extensions:
             return jsonify({'error': f'Invalid file type. Supported formats: {", ".join(allowed_extensions)}'}), 400
@@ -397,139 +806,156 @@ def import_env_file(project_id):
         except UnicodeDecodeError:
             return jsonify({'error': 'File encoding not supported. Please ensure the file is UTF-8 encoded.'}), 400
 
-        imported_keys = []
-        
-        if file_ext == '.json':
-            # Parse JSON file
-            try:
-                import json
-                data = json.loads(content)
-                if isinstance(data, dict):
-                    keys_to_import = flatten_json(data)
-                else:
-                    return jsonify({'error': 'Invalid JSON format. Expected object structure'}), 400
-            except json.JSONDecodeError as e:
-                return jsonify({'error': f'Invalid JSON format: {str(e)}'}), 400
-                
-        elif file_ext in {'.yaml', '.yml'}:
-            # Parse YAML file
-            try:
-                import yaml
-                data = yaml.safe_load(content)
-                if isinstance(data, dict):
-                    keys_to_import = flatten_json(data)
-                else:
-                    return jsonify({'error': 'Invalid YAML format. Expected object structure'}), 400
-            except yaml.YAMLError as e:
-                return jsonify({'error': f'Invalid YAML format: {str(e)}'}), 400
-                
-        else:  # .env, .properties, .conf, .config
-            # More lenient regex pattern for env files
-            # Supports various formats including:
-            # KEY=value
-            # KEY = value
-            # KEY: value
-            # KEY:value
-            # export KEY=value
-            # KEY='value'
-            # KEY="value"
-            # KEY=value # comment
-            pattern = r'^(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*[=:]\s*([\'\"]?.*?[\'\"]?)(?:\s*[#;].*)?$'
-            
-            keys_to_import = {}
-            line_number = 0
-            for line in content.split('\n'):
-                line_number += 1
-                line = line.strip()
-                if not line or line.startswith(('#', '//', ';')):  # Skip comments and empty lines
-                    continue
-                    
-                match = re.match(pattern, line)
-                if match:
-                    key_name = match.group(1)
-                    key_value = match.group(2).strip('\'"')  # Strip quotes if present
-                    keys_to_import[key_name] = key_value
-                else:
-                    logger.warning(f"Skipped invalid line {line_number} in {file.filename}: {line}")
-
-            if not keys_to_import:
-                return jsonify({'error': 'No valid key-value pairs found in the file. Please check the file format.'}), 400
+        try:
+            keys_to_import = parse_import_file(content, file_ext, file.filename)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if wants_background():
+            # Kept until the job finishes, so a restarted job can read it again
+            upload = os.path.join(job_pool.upload_dir, f"{uuid.uuid4().hex}{file_ext}")
+            with os.fdopen(os.open(upload, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w', encoding='utf-8') as f:
+                f.write(content)
+            job = job_pool.submit('import_file', {
+                'project_id': project_id, 'upload': upload, 'file_ext': file_ext, 'filename': file.filename
+            }, total=len(keys_to_import))
+            return jsonify({'message': f'Importing {len(keys_to_import)} keys', 'job': job.to_dict()}), 202
 
-        # Import the collected keys
-        for key_name, key_value in keys_to_import.items():
-            # Generate unique name if key already exists
-            unique_name = generate_unique_name(key_name, project_id)
-            
-            # Get the maximum position for the project
-            max_position = db.session.query(db.func.max(APIKey.position)).filter(
-                APIKey.project_id == project_id
-            ).scalar() or -1
-            
-            # Create new API key entry
-            new_key = APIKey(
-                name=unique_name,
-                key=str(key_value),  # Convert to string in case of numeric values
-                description=f"Imported from {file.filename}",
-                project_id=project_id,
-                position=max_position + 1
-            )
-            
-            db.session.add(new_key)
-            imported_keys.append(new_key)
-        
+        imported_keys = import_keys(keys_to_import.items(), project_id, f"Imported from {file.filename}")
         db.session.commit()
-        logger.info(f"Successfully imported {len(imported_keys)} keys from {file.filename}")
+        import_rows.inc('file', amount=len(imported_keys))
+        logger.info("Successfully imported %s keys from %s", len(imported_keys), file.filename)
         
         return jsonify({
             'message': f'Successfully imported {len(imported_keys)} keys',
             'keys': [key.to_dict() for key in imported_keys]
         }), 201
         
+    except ProjectDeleting as e:
+        db.session.rollback()
+        return e.response()
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error importing file: {str(e)}")
+        logger.error("Error importing file: %s", e)
         return jsonify({'error': f'Failed to import file: {str(e)}'}), 500
 
-@app.route('/projects/<int:project_id>/import-os-env', methods=['POST'])
+def parse_import_file(content, file_ext, filename):
+    """Key/value pairs from the text of an uploaded file.
+
+    Raises ValueError with a message for the user when nothing can be imported.
+    """
+    if file_ext == '.json':
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid JSON format: {str(e)}')
+        if not isinstance(data, dict):
+            raise ValueError('Invalid JSON format. Expected object structure')
+        return flatten_json(data)
+        
+    if file_ext in {'.yaml', '.yml'}:
+        import yaml
+        try:
+            data = yaml.safe_load(content)
+        except yaml.YAMLError as e:
+            raise ValueError(f'Invalid YAML format: {str(e)}')
+        if not isinstance(data, dict):
+            raise ValueError('Invalid YAML format. Expected object structure')
+        return flatten_json(data)
+        
+    # .env, .properties, .conf, .config
+    # More lenient regex pattern for env files
+    # Supports various formats including:
+    # KEY=value
+    # KEY = value
+    # KEY: value
+    # KEY:value
+    # export KEY=value
+    # KEY='value'
+    # KEY="value"
+    # KEY=value # comment
+    pattern = r'^(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)\s*[=:]\s*([\'\"]?.*?[\'\"]?)(?:\s*[#;].*)?$'
+    
+    keys_to_import = {}
+    line_number = 0
+    for line in content.split('\n'):
+        line_number += 1
+        line = line.strip()
+        if not line or line.startswith(('#', '//', ';')):  # Skip comments and empty lines
+            continue
+            
+        match = re.match(pattern, line)
+        if match:
+            key_name = match.group(1)
+            key_value = match.group(2).strip('\'"')  # Strip quotes if present
+            keys_to_import[key_name] = key_value
+        else:
+            logger.warning("Skipped invalid line %s in %s", line_number, filename)
+
+    if not keys_to_import:
+        raise ValueError('No valid key-value pairs found in the file. Please check the file format.')
+    return keys_to_import
+
+def import_keys(items, project_id, description):
+    """Add (name, value) pairs to the end of a project, renaming names already taken. Does not commit."""
+    imported_keys = []
+    for key_name, key_value in items:
+        # Generate unique name if key already exists
+        unique_name = generate_unique_name(key_name, project_id)
+        
+        # Create new API key entry
+        new_key = APIKey(
+            name=unique_name,
+            key=str(key_value),  # Convert to string in case of numeric values
+            fingerprint=fingerprint(str(key_value)),
+            description=description,
+            project_id=project_id,
+            position=next_position(APIKey, APIKey.project_id == project_id)
+        )
+        
+        db.session.add(new_key)
+        imported_keys.append(new_key)
+    check_project_accepts_keys(project_id)
+    return imported_keys
+
+@job_handler('import_file')
+def import_file_job(job):
+    """Import an uploaded file JOB_BATCH_SIZE keys per checkpoint, re-reading it on resume."""
+    params = job.params
+    with open(params['upload'], encoding='utf-8') as f:
+        items = list(parse_import_file(f.read(), params['file_ext'], params['filename']).items())
+    batch_size = current_app.config['JOB_BATCH_SIZE']
+    for start in range(job.done, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        import_keys(batch, params['project_id'], f"Imported from {params['filename']}")
+        import_rows.inc('file', amount=len(batch))
+        job.checkpoint(start + len(batch))
+    logger.info("Job %s imported %s keys from %s", job.id, len(items), params['filename'])
+    return {'imported': len(items)}
+
+@bp.route('/projects/<int:project_id>/import-os-env', methods=['POST'])
 def import_os_env(project_id):
     try:
         # Get all environment variables
         env_vars = os.environ
-        imported_keys = []
         
         # Import each environment variable as a key
-        for key_name, key_value in env_vars.items():
-            # Generate unique name if key already exists
-            unique_name = generate_unique_name(key_name, project_id)
-            
-            # Get the maximum position for the project
-            max_position = db.session.query(db.func.max(APIKey.position)).filter(
-                APIKey.project_id == project_id
-            ).scalar() or -1
-            
-            # Create new API key entry
-            new_key = APIKey(
-                name=unique_name,
-                key=str(key_value),  # Convert to string in case of numeric values
-                description="Imported from OS environment variables",
-                project_id=project_id,
-                position=max_position + 1
-            )
-            
-            db.session.add(new_key)
-            imported_keys.append(new_key)
-        
+        imported_keys = import_keys(env_vars.items(), project_id, "Imported from OS environment variables")
         db.session.commit()
-        logger.info(f"Successfully imported {len(imported_keys)} keys from OS environment variables")
+        import_rows.inc('os_env', amount=len(imported_keys))
+        logger.info("Successfully imported %s keys from OS environment variables", len(imported_keys))
         
         return jsonify({
             'message': f'Successfully imported {len(imported_keys)} keys',
             'keys': [key.to_dict() for key in imported_keys]
         }), 201
         
+    except ProjectDeleting as e:
+        db.session.rollback()
+        return e.response()
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error importing OS environment variables: {str(e)}")
+        logger.error("Error importing OS environment variables: %s", e)
         return jsonify({'error': f'Failed to import OS environment variables: {str(e)}'}), 500
 
 def flatten_json(data, parent_key='', sep='_'):
@@ -543,11 +969,11 @@ def flatten_json(data, parent_key='', sep='_'):
             items[new_key] = v
     return items
 
-@app.cli.command("check-db")
+@bp.cli.command("check-db")
 def check_db():
     """Check database tables and schema."""
     try:
-        with app.app_context():
+        with current_app.app_context():
             # Check if tables exist
             inspector = db.inspect(db.engine)
             tables = inspector.get_table_names()
@@ -560,6 +986,12 @@ def check_db():
                 for col in columns:
                     print(f"Column: {col['name']} ({col['type']})")
             
+            # Show the pragmas the storage profile applied
+            with db.engine.connect() as conn:
+                print(f"\nSQLite profile '{current_app.config['SQLITE_PROFILE']}':")
+                for name, value in read_pragmas(conn).items():
+                    print(f"Pragma: {name} = {value}")
+            
             # Count records
             keys_count = APIKey.query.count()
             projects_count = Project.query.count()
@@ -569,32 +1001,59 @@ def check_db():
         print(f"Error checking database: {str(e)}")
         raise
 
-@app.route('/export', methods=['GET'])
+@bp.route('/export', methods=['GET'])
+@kdf_limited(lambda: request.args.get('password'))
 def export_keys():
+    """Stream keys in one of EXPORT_FORMATS as rows are read.
+
+    Query params: `format`, `project_id`, `password` (for encrypted keys) and
+    `bundle=zip` for a zip with one file per project. Encrypted keys are
+    decrypted before anything is sent, so a wrong password still gets a 207
+    listing the failures instead of a truncated file.
+    """
     try:
         # Get parameters from query args
         export_format = request.args.get('format', 'env')
+        if export_format not in EXPORT_FORMATS:
+            export_format = 'env'
         project_id = request.args.get('project_id', type=int)
         password = request.args.get('password')  # Get password from query params
+        bundle = request.args.get('bundle')
+        if bundle not in (None, 'zip'):
+            return jsonify({'error': f"Unsupported bundle '{bundle}'. Supported: zip"}), 400
         
-        # Get keys with decryption
-        query = APIKey.query
+        criteria = [not_being_deleted()]
         if project_id is not None:
-            query = query.filter_by(project_id=project_id)
-        
-        # Ensure keys are ordered by project and position
-        keys = query.order_by(APIKey.project_id, APIKey.position).all()
+            criteria.append(APIKey.project_id == project_id)
         
-        decrypted_keys = []
+        # Determine the project name for the filename
+        project_name = 'all'
+        if project_id is not None:
+            project = Project.query.get(project_id)
+            project_name = project.name if project else f"project_{project_id}"
+        if bundle == 'zip':
+            mimetype = 'application/zip'
+            filename = f"api_keys_{file_label(project_name)}_{export_format}.zip"
+        else:
+            suffix, mimetype = EXPORT_FORMATS[export_format]
+            filename = f"api_keys_{file_label(project_name)}{suffix}"
+        
+        # Exports without encrypted keys are cached per data revision, which is also their ETag
+        revision = current_revision()
+        cache_key = (project_id, export_format, bundle, revision)
+        etag = f"{revision}-{export_format}{'-zip' if bundle else ''}"
+        cached = export_cache.get(cache_key)
+        if cached is not None:
+            access_tracker.record(cached.key_ids)
+            export_rows.inc('cache', amount=len(cached.key_ids))
+            return cached_export_response(cached, mimetype, filename, etag)
+        
+        # Only the encrypted keys are decrypted up front; plaintext ones are read while streaming
+        decrypted = {}
         failed_decrypts = []
-        
-        for key in keys:
+        for key in APIKey.query.filter(APIKey.encrypted.is_(True), *criteria).yield_per(100):
             try:
-                if key.encrypted:
-                    key.decrypt_key(password)
-                decrypted_keys.append(key.to_dict())
-                if key.encrypted:  # Re-encrypt immediately after export
-                    key.encrypt_key(password)
+                decrypted[key.id] = key.decrypted_value(password)
             except Exception as e:
                 failed_decrypts.append({
                     'id': key.id,
@@ -603,61 +1062,238 @@ def export_keys():
                 })
         
         if failed_decrypts:
+            failed_ids = {failure['id'] for failure in failed_decrypts}
             return jsonify({
                 'error': 'Partial decryption failure',
                 'failed': failed_decrypts,
-                'successful': [k['name'] for k in decrypted_keys]
+                'successful': [name for key_id, name in db.session.query(APIKey.id, APIKey.name).filter(*criteria)
+                               if key_id not in failed_ids]
             }), 207  # Multi-status code
-            
-        # Proceed with export formatting
-        return generate_export_file(decrypted_keys, export_format, project_id)
+        
+        # Anything that needed a password is never cached or given an ETag
+        cacheable = not decrypted
+        if cacheable and request.if_none_match.contains(etag):
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+        capture = export_cache.capture(cache_key) if cacheable else None
+        
+        rows = iter_export_rows(criteria, decrypted, on_read=capture.on_read if capture else None)
+        if bundle == 'zip':
+            body = iter_zip(rows, export_format)
+        else:
+            body = iter_export(rows, export_format, project_name if project_id is not None else None)
+        
+        response = Response(stream_with_context(capture.stream(body) if capture else body), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        if cacheable:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+        else:
+            response.headers['Cache-Control'] = 'no-store'
+        return response
         
     except Exception as e:
-        logger.error(f"Error exporting keys: {str(e)}")
+        logger.error("Error exporting keys: %s", e)
         return jsonify({'error': f'Failed to export keys: {str(e)}'}), 500
 
-@app.route('/download-db', methods=['GET'])
+def cached_export_response(cached, mimetype, filename, etag):
+    """Serve a cached export, gzip-encoded when the client accepts it."""
+    use_gzip = cached.gzip_body is not None and 'gzip' in request.accept_encodings
+    if use_gzip:
+        etag += '-gz'
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    
+    response = Response(cached.gzip_body if use_gzip else cached.body, mimetype=mimetype)
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.set_etag(etag)
+    return response
+
+def iter_export_rows(criteria, decrypted, batch_size=500, on_read=None):
+    """Yield ExportRows in project and position order, reading batch_size rows at a time.
+
+    on_read, if given, is called with each batch of key ids after it is read.
+    """
+    query = db.session.query(
+        APIKey.id, APIKey.project_id, Project.name, APIKey.name, APIKey.key,
+        APIKey.description, APIKey.used_with
+    ).outerjoin(Project, APIKey.project_id == Project.id).filter(*criteria).order_by(
+        APIKey.project_id, APIKey.position
+    ).yield_per(batch_size)
+    
+    read = []
+    for key_id, project_id, project, name, value, description, used_with in query:
+        yield ExportRow(project_id, project or 'Unassigned', name, decrypted.pop(key_id, value), description, used_with)
+        read.append(key_id)
+        if len(read) >= batch_size:
+            access_tracker.record(read)
+            export_rows.inc('database', amount=len(read))
+            if on_read:
+                on_read(read)
+            read = []
+    access_tracker.record(read)
+    export_rows.inc('database', amount=len(read))
+    if on_read:
+        on_read(read)
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Request, SQLite, key derivation and import/export metrics of this process in Prometheus format."""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+@bp.route('/download-db', methods=['GET'])
 def download_database():
-    """Download the entire SQLite database file."""
+    """Stream a consistent snapshot of the SQLite database.
+
+    Query params: `compression` (gzip or zstd). The SHA-256 of the
+    uncompressed snapshot is sent in the X-Content-SHA256 header.
+    """
+    temp_path = None
+    db_path = current_app.config['DATABASE_PATH']
     try:
         if not os.path.exists(db_path):
-            logger.error(f"Database file not found at path: {db_path}")
+            logger.error("Database file not found at path: %s", db_path)
             return jsonify({'error': 'Database file not found'}), 404
+        
+        compression = request.args.get('compression')
+        try:
+            compressor = get_compressor(compression)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
             
         # Get current timestamp in 12-hour format
         timestamp = datetime.now().strftime('%Y%m%d_%I%M%p').lower()
         filename = f"keys_{timestamp}.db"
-        
-        logger.info(f"Initiating database download with filename: {filename}")
-        
-        # Create a copy of the database to avoid locks
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as temp_file:
-            shutil.copy2(db_path, temp_file.name)
-            
-            try:
-                # Send the temporary file
-                return send_file(
-                    temp_file.name,
-                    mimetype='application/x-sqlite3',
-                    as_attachment=True,
-                    download_name=filename,
-                    max_age=0
-                )
-            finally:
-                # Schedule the temp file for deletion after response is sent
-                @after_this_request
-                def cleanup(response):
-                    try:
-                        os.unlink(temp_file.name)
-                    except Exception as e:
-                        logger.error(f"Error cleaning up temp file: {str(e)}")
-                    return response
+        mimetype = 'application/x-sqlite3'
+        if compressor:
+            suffix, mimetype = COMPRESSIONS[compression]
+            filename += suffix
+        
+        logger.info("Initiating database download with filename: %s", filename)
+        
+        # Snapshot with the online backup API; a plain file copy can catch a write half done
+        temp_fd, temp_path = tempfile.mkstemp(suffix='.db')
+        os.close(temp_fd)
+        checksum = snapshot_database(db_path, temp_path)
+        
+        response = Response(iter_file(temp_path, compressor), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+        response.headers['X-Content-SHA256'] = checksum
+        response.headers['Cache-Control'] = 'no-cache'
+        if not compressor:
+            response.headers['Content-Length'] = str(os.path.getsize(temp_path))
+        
+        # Runs once the response is closed, whether or not it was fully sent
+        cleanup_path = temp_path
+        response.call_on_close(lambda: remove_temp_file(cleanup_path))
+        temp_path = None
+        return response
         
     except Exception as e:
-        logger.error(f"Error downloading database: {str(e)}")
+        logger.error("Error downloading database: %s", e)
         return jsonify({'error': f'Failed to download database: {str(e)}'}), 500
+    finally:
+        if temp_path:
+            remove_temp_file(temp_path)
+
+@bp.route('/backups', methods=['GET'])
+def get_backups():
+    """Scheduled backup status and the backups currently kept."""
+    try:
+        directory = current_app.config['BACKUP_DIR']
+        return jsonify({
+            'interval': current_app.config['BACKUP_INTERVAL'],
+            'retention': current_app.config['BACKUP_RETENTION'],
+            'status': read_backup_status(directory),
+            'backups': [{
+                'name': os.path.basename(path),
+                'created_at': created.isoformat(),
+                'revision': revision,
+                'size': os.path.getsize(path)
+            } for created, revision, path in list_backups(directory)]
+        }), 200
+    except Exception as e:
+        logger.error("Error reading backup status: %s", e)
+        return jsonify({'error': f'Failed to read backup status: {str(e)}'}), 500
+
+@bp.cli.command("compact-changes")
+@click.option('--keep', type=int, default=10000, help='Revisions of change history to keep.')
+def compact_changes(keep):
+    """Drop old change log entries used by GET /sync."""
+    with db.engine.begin() as conn:
+        removed = compact_change_log(conn, keep)
+    print(f"Removed {removed} change log entries")
+
+@bp.cli.command("fingerprint-keys")
+def fingerprint_keys():
+    """Fingerprint keys stored before fingerprints existed, or under another pepper."""
+    with db.engine.begin() as conn:
+        register_sql_function(conn.connection)
+        updated = refresh_fingerprints(conn.connection)
+    print(f"Fingerprinted {updated} keys")
+    missing = unindexed_count()
+    if missing:
+        print(f"{missing} encrypted keys get their fingerprint when they are next decrypted or rotated")
+
+@bp.cli.command("seed")
+@click.option('--projects', type=int, default=10, show_default=True, help='Projects to create.')
+@click.option('--keys', type=int, default=100, show_default=True, help='Keys per project.')
+@click.option('--encrypted-ratio', type=click.FloatRange(0, 1), default=0.0, show_default=True,
+              help='Share of keys stored encrypted.')
+@click.option('--password', default='seed-password', show_default=True, help='Password for the encrypted keys.')
+@click.option('--seed', 'random_seed', type=int, default=None, help='Random seed, for the same data every run.')
+@click.option('--reset', is_flag=True, help='Delete all projects and keys first.')
+@click.option('--yes', is_flag=True, help='Do not ask before --reset deletes data.')
+def seed_command(projects, keys, encrypted_ratio, password, random_seed, reset, yes):
+    """Bulk-generate realistic projects and keys for load testing."""
+    from seed import seed_database
+    if reset and not yes:
+        click.confirm('Delete every project and key in the database?', abort=True)
+    with db.engine.begin() as conn:
+        if reset:
+            conn.execute(APIKey.__table__.delete())
+            conn.execute(Project.__table__.delete())
+        counts = seed_database(conn, projects, keys, encrypted_ratio, password, random_seed)
+    print(json.dumps(counts))
+
+@bp.cli.command("agent", context_settings={'ignore_unknown_options': True, 'help_option_names': []})
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def agent_command(args):
+    """Run a command with a project's keys as environment variables (see agent.py --help)."""
+    import agent
+    sys.exit(agent.main(list(args)))
+
+@bp.cli.command("backup-daemon")
+@click.option('--interval', type=int, default=None, help='Seconds between backups (default: BACKUP_INTERVAL or 3600).')
+@click.option('--once', is_flag=True, help='Take a single backup and exit.')
+def backup_daemon(interval, once):
+    """Take scheduled backups of the database outside the web process."""
+    scheduler = BackupScheduler.from_app(current_app, current_app.config['DATABASE_PATH'], interval or current_app.config['BACKUP_INTERVAL'] or 3600)
+    if once:
+        status = scheduler.run_once()
+        if status['last_result'] == 'success':
+            print(f"Wrote {status['last_backup']} in {status['last_duration_seconds']}s")
+        elif status['last_result'] == 'skipped':
+            print("No changes since the last backup, skipped")
+        else:
+            print(f"Backup failed: {status['last_error']}")
+        return
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        print("Backup daemon stopped")
+
+def remove_temp_file(path):
+    try:
+        if os.path.exists(path):
+            os.unlink(path)
+    except Exception as e:
+        logger.error("Error cleaning up temp file: %s", e)
 
-@app.route('/projects/<int:project_id>/reorder', methods=['PATCH'])
+@bp.route('/projects/<int:project_id>/reorder', methods=['PATCH'])
 def reorder_project(project_id):
     try:
         data = request.get_json()
@@ -668,7 +1304,7 @@ def reorder_project(project_id):
         new_position = max(0, int(data['new_position']))  # Ensure non-negative position
         old_position = project.position
 
-        logger.info(f"Reordering project {project.name} from position {old_position} to {new_position}")
+        logger.info("Reordering project %s from position %s to %s", project.name, old_position, new_position)
 
         with db.session.begin_nested():  # Create a savepoint
             # Get total number of projects
@@ -685,7 +1321,7 @@ def reorder_project(project_id):
                         Project.position > old_position,
                         Project.id != project_id
                     ).update({Project.position: Project.position - 1}, synchronize_session=False)
-                    logger.info(f"Updated {affected} projects moving forward")
+                    logger.info("Updated %s projects moving forward", affected)
                 else:
                     # Moving backward: update positions of projects between new and old position
                     affected = Project.query.filter(
@@ -693,29 +1329,136 @@ def reorder_project(project_id):
                         Project.position < old_position,
                         Project.id != project_id
                     ).update({Project.position: Project.position + 1}, synchronize_session=False)
-                    logger.info(f"Updated {affected} projects moving backward")
+                    logger.info("Updated %s projects moving backward", affected)
 
                 # Then update the position of the moved project
                 project.position = new_position
                 db.session.flush()  # Ensure all position updates are applied
 
                 # Finally normalize all positions to ensure they are sequential and start from 0
-                projects = Project.query.order_by(Project.position).all()
+                projects = Project.query.filter_by(deleting=False).order_by(Project.position).all()
+                fixed = 0
                 for i, p in enumerate(projects):
                     if p.position != i:
                         p.position = i
-                        logger.info(f"Fixed position for project {p.name}: {p.position} -> {i}")
+                        fixed += 1
+                if fixed:
+                    logger.debug("Fixed the positions of %d projects", fixed)
 
         db.session.commit()
-        logger.info(f"Successfully reordered project {project.name} to position {new_position}")
+        logger.info("Successfully reordered project %s to position %s", project.name, new_position)
         return jsonify(project.to_dict()), 200
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error reordering project: {str(e)}")
+        logger.error("Error reordering project: %s", e)
         logger.exception("Full traceback:")
         return jsonify({'error': f'Failed to reorder project: {str(e)}'}), 500
 
-@app.route('/import-db', methods=['POST'])
+def apply_order(model, ordered_ids, *criteria):
+    """Set positions from an ordered id list with a single UPDATE ... CASE statement.
+
+    Returns False if ordered_ids is not exactly the set of rows matching criteria.
+    """
+    if len(set(ordered_ids)) != len(ordered_ids):
+        return False
+
+    # Write first so SQLite takes the write lock before anything is validated
+    positions = db.case({row_id: i for i, row_id in enumerate(ordered_ids)}, value=model.id)
+    updated = model.query.filter(model.id.in_(ordered_ids), *criteria).update(
+        {model.position: positions}, synchronize_session=False
+    ) if ordered_ids else 0
+
+    total = model.query.filter(*criteria).count()
+    return updated == len(ordered_ids) == total
+
+def close_position_gaps(project_ids):
+    """Renumber the keys of these projects 0..n-1 in their current order, in one statement.
+
+    `project_ids` may include None for keys without a project.
+    """
+    def in_projects(table):
+        ids = [project_id for project_id in project_ids if project_id is not None]
+        criteria = [table.c.project_id.in_(ids)] if ids else []
+        if None in project_ids:
+            criteria.append(table.c.project_id.is_(None))
+        return db.or_(*criteria)
+
+    if not project_ids:
+        return
+    table = APIKey.__table__
+    source = table.alias()
+    ranked = db.select(
+        source.c.id,
+        (db.func.row_number().over(partition_by=source.c.project_id, order_by=(source.c.position, source.c.id))
+         - 1).label('position')
+    ).where(in_projects(source)).subquery()
+    db.session.execute(table.update().where(in_projects(table)).values(
+        position=db.select(ranked.c.position).where(ranked.c.id == table.c.id).scalar_subquery()
+    ))
+
+def check_revision(data):
+    """Return a 409 response if the client's revision is stale, otherwise None."""
+    if data.get('revision') is not None and data['revision'] != current_revision():
+        return jsonify({
+            'error': 'Data changed since it was loaded, please refresh and try again',
+            'revision': current_revision()
+        }), 409
+    return None
+
+@bp.route('/projects/<int:project_id>/order', methods=['PUT'])
+def set_key_order(project_id):
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('key_ids'), list):
+            return jsonify({'error': 'key_ids list is required'}), 400
+
+        Project.query.get_or_404(project_id)
+        key_ids = data['key_ids']
+
+        if not apply_order(APIKey, key_ids, APIKey.project_id == project_id):
+            db.session.rollback()
+            return jsonify({'error': 'key_ids must list every key in the project exactly once'}), 409
+
+        conflict = check_revision(data)
+        if conflict:
+            db.session.rollback()
+            return conflict
+
+        db.session.commit()
+        logger.info("Applied order of %s keys in project %s", len(key_ids), project_id)
+        return jsonify({'key_ids': key_ids, 'revision': current_revision()}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error ordering keys: %s", e)
+        return jsonify({'error': f'Failed to order keys: {str(e)}'}), 500
+
+@bp.route('/projects/order', methods=['PUT'])
+def set_project_order():
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('project_ids'), list):
+            return jsonify({'error': 'project_ids list is required'}), 400
+
+        project_ids = data['project_ids']
+
+        if not apply_order(Project, project_ids, Project.deleting.is_(False)):
+            db.session.rollback()
+            return jsonify({'error': 'project_ids must list every project exactly once'}), 409
+
+        conflict = check_revision(data)
+        if conflict:
+            db.session.rollback()
+            return conflict
+
+        db.session.commit()
+        logger.info("Applied order of %s projects", len(project_ids))
+        return jsonify({'project_ids': project_ids, 'revision': current_revision()}), 200
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error ordering projects: %s", e)
+        return jsonify({'error': f'Failed to order projects: {str(e)}'}), 500
+
+@bp.route('/import-db', methods=['POST'])
 def import_db():
     temp_db_path = None
     try:
@@ -726,10 +1469,11 @@ def import_db():
         if not file.filename.endswith('.db'):
             return jsonify({'error': 'Invalid file type. Only .db files are allowed'}), 400
         
-        import_mode = request.form.get('import-mode', 'overwrite')
+        # The web UI has always sent import_mode
+        import_mode = request.form.get('import-mode') or request.form.get('import_mode', 'overwrite')
         
-        # Create a temporary file
-        temp_fd, temp_db_path = tempfile.mkstemp(suffix='.db')
+        # Create a temporary file next to the live database, so it can be renamed over it
+        temp_fd, temp_db_path = tempfile.mkstemp(suffix='.db', dir=current_app.instance_path)
         os.close(temp_fd)  # Close the file descriptor immediately
         
         # Save the uploaded file
@@ -743,11 +1487,15 @@ def import_db():
             tables = cursor.fetchall()
             required_tables = {'api_key', 'project'}
             db_tables = {table[0] for table in tables}
+            cursor.execute("PRAGMA quick_check")
+            check_result = cursor.fetchone()[0]
             cursor.close()
             conn.close()
             
             if not required_tables.issubset(db_tables):
                 raise ValueError('Invalid database format')
+            if check_result != 'ok':
+                raise ValueError(f'Database is corrupt: {check_result}')
                 
         except (sqlite3.Error, ValueError) as e:
             if os.path.exists(temp_db_path):
@@ -755,90 +1503,51 @@ def import_db():
             return jsonify({'error': f'Invalid database file: {str(e)}'}), 400
         
         if import_mode == 'overwrite':
+            # Jobs would carry on against the new file, or lose their rows with the old one
+            if Job.query.filter(Job.status.in_(ACTIVE)).count():
+                return jsonify({'error': 'Wait for the background jobs to finish or cancel them first'}), 409
+            
+            # Bring the upload to the current schema before it goes live
+            try:
+                upgrade_database_file(current_app, temp_db_path)
+            except Exception as e:
+                logger.error("Error migrating uploaded database: %s", e)
+                return jsonify({'error': f'Invalid database file: could not migrate it ({str(e)})'}), 400
+            
+            # Jobs recorded in the upload belong to another installation and must not run here
+            conn = sqlite3.connect(temp_db_path)
+            with conn:
+                conn.execute('DELETE FROM job')
+                # Its fingerprints may come from another pepper, or predate fingerprints
+                register_sql_function(conn)
+                refresh_fingerprints(conn)
+            conn.close()
+            
             # Close the current database connection
             db.session.remove()
+            # Pending access counts refer to rows of the database being replaced
+            access_tracker.flush()
             
-            # Backup the current database
-            backup_path = os.path.join(app.instance_path, 'database_backup.db')
-            if os.path.exists(db_path):
-                shutil.copy2(db_path, backup_path)
+            # New requests wait at the gate while in-flight ones drain, then one rename swaps the file
+            with current_app.extensions['request_gate'].exclusive(timeout=current_app.config['DATABASE_SWAP_WAIT']):
+                replace_database(current_app, db.engine, temp_db_path, current_app.config['DATABASE_PATH'])
+                # The new file can carry the same revision number as the old one
+                secret_index.invalidate()
+                export_cache.clear()
+            logger.info("Replaced the database with an uploaded file")
             
-            try:
-                # Replace the current database with the imported one
-                shutil.copy2(temp_db_path, db_path)
-                if os.path.exists(backup_path):
-                    os.unlink(backup_path)
-            except Exception as e:
-                # Restore from backup if something goes wrong
-                if os.path.exists(backup_path):
-                    shutil.copy2(backup_path, db_path)
-                    os.unlink(backup_path)
-                raise e
+        elif wants_background():
+            upload = os.path.join(job_pool.upload_dir, f"{uuid.uuid4().hex}.db")
+            os.replace(temp_db_path, upload)
+            temp_db_path = None
+            job = job_pool.submit('merge_database', {'upload': upload}, total=1)
+            return jsonify({'message': 'Merging database', 'job': job.to_dict()}), 202
             
         else:  # merge mode
-            # Connect to the imported database
-            import_conn = sqlite3.connect(temp_db_path)
-            import_conn.row_factory = sqlite3.Row
-            
-            try:
-                # Get projects and keys from imported database
-                imported_projects = import_conn.execute('SELECT * FROM project').fetchall()
-                imported_keys = import_conn.execute('SELECT * FROM api_key').fetchall()
-                
-                # Close the connection before processing data
-                import_conn.close()
-                import_conn = None
-                
-                # Process imported data
-                with db.session.no_autoflush:
-                    # Import projects first
-                    project_id_map = {}  # Maps old project IDs to new ones
-                    for proj in imported_projects:
-                        existing_project = Project.query.filter_by(name=proj['name']).first()
-                        if existing_project:
-                            project_id_map[proj['id']] = existing_project.id
-                        else:
-                            new_project = Project(name=proj['name'])
-                            db.session.add(new_project)
-                            db.session.flush()  # Get the new ID
-                            project_id_map[proj['id']] = new_project.id
-                    
-                    # Import keys
-                    for key_data in imported_keys:
-                        # Map to new project ID if exists
-                        project_id = project_id_map.get(key_data['project_id'])
-                        
-                        # Generate unique name if needed
-                        base_name = key_data['name']
-                        name = base_name
-                        counter = 1
-                        
-                        while True:
-                            existing_key = APIKey.query.filter_by(
-                                name=name,
-                                project_id=project_id
-                            ).first()
-                            
-                            if not existing_key:
-                                break
-                                
-                            name = f"{base_name} ({counter})"
-                            counter += 1
-                        
-                        new_key = APIKey(
-                            name=name,
-                            key=key_data['key'],
-                            description=key_data['description'],
-                            used_with=key_data['used_with'],
-                            project_id=project_id
-                        )
-                        db.session.add(new_key)
-                
-                db.session.commit()
-            finally:
-                # Ensure the connection is closed
-                if import_conn is not None:
-                    import_conn.close()
+            counts = merge_database(temp_db_path)
+            import_rows.inc('database', amount=counts['inserted'])
+            logger.info("Merged database: %s", counts)
+            return jsonify({'message': 'Database merged successfully', **counts}), 200
         
         return jsonify({'message': 'Database imported successfully'}), 200
             
@@ -852,14 +1561,136 @@ def import_db():
             if temp_db_path and os.path.exists(temp_db_path):
                 os.unlink(temp_db_path)
         except Exception as e:
-            logger.error(f"Error cleaning up temporary file: {str(e)}")
+            logger.error("Error cleaning up temporary file: %s", e)
+
+@job_handler('merge_database')
+def merge_database_job(job):
+    """Merge an uploaded database; the merge is one transaction, so a resumed job simply runs it again."""
+    counts = merge_database(job.params['upload'])
+    import_rows.inc('database', amount=counts['inserted'])
+    logger.info("Job %s merged database: %s", job.id, counts)
+    return counts
+
+def merge_database(path):
+    """Merge the projects and keys of another keys.db into this one, set-based in SQL.
+
+    The file is attached to a pooled connection and merged in a single
+    transaction. Projects are matched by name. Keys identical to an existing
+    key (same project and value, same name or a renamed copy of it) are skipped. Colliding names get a
+    " (n)" suffix. Encrypted keys keep their ciphertext and salt and are
+    appended to their project in their original order.
+    Returns counts of created projects and inserted, renamed and skipped keys.
+    """
+    with db.engine.connect() as conn:
+        register_sql_function(conn.connection)
+        conn.execute(db.text('ATTACH DATABASE :path AS import_src'), {'path': path})
+        try:
+            # Older exports predate the encryption columns
+            src_columns = {row[1] for row in conn.exec_driver_sql('PRAGMA import_src.table_info(api_key)')}
+            encrypted = 's.encrypted' if 'encrypted' in src_columns else '0'
+            salt = 's.encryption_salt' if 'encryption_salt' in src_columns else 'NULL'
+            position = 's.position' if 'position' in src_columns else '0'
+            
+            with conn.begin():
+                projects_created = conn.exec_driver_sql("""
+                    INSERT INTO main.project (name, position)
+                    SELECT s.name,
+                           (SELECT COALESCE(MAX(position), -1) FROM main.project)
+                           + ROW_NUMBER() OVER (ORDER BY s.position, s.id)
+                    FROM import_src.project s
+                    WHERE s.name NOT IN (SELECT name FROM main.project)
+                """).rowcount
+                
+                # Stage every incoming key with its target project and candidate name
+                conn.exec_driver_sql('DROP TABLE IF EXISTS temp.merge_key')
+                conn.exec_driver_sql("""
+                    CREATE TEMP TABLE merge_key (
+                        src_id INTEGER PRIMARY KEY,
+                        project_id INTEGER,
+                        base_name TEXT NOT NULL,
+                        name TEXT NOT NULL,
+                        key_value TEXT NOT NULL,
+                        attempt INTEGER NOT NULL DEFAULT 0,
+                        src_position INTEGER
+                    )
+                """)
+                conn.exec_driver_sql('CREATE INDEX temp.ix_merge_key_name ON merge_key (name, project_id)')
+                conn.exec_driver_sql(f"""
+                    INSERT INTO temp.merge_key (src_id, project_id, base_name, name, key_value, src_position)
+                    SELECT s.id, p.id, s.name, s.name, s.key, {position}
+                    FROM import_src.api_key s
+                    LEFT JOIN import_src.project sp ON sp.id = s.project_id
+                    LEFT JOIN main.project p ON p.name = sp.name
+                """)
+                
+                # Exact copies, then copies a previous merge renamed to "name (n)";
+                # separate statements so both can use the (name, project_id) index
+                skipped = 0
+                for name_match in ("k.name = merge_key.name AND k.project_id IS merge_key.project_id",
+                                   # Unary + keeps the planner on the name range instead of the project index
+                                   "k.name > merge_key.name || ' (' AND k.name < merge_key.name || ' )'"
+                                   " AND k.name GLOB '* ([0-9]*)' AND +k.project_id IS merge_key.project_id"):
+                    skipped += conn.exec_driver_sql(f"""
+                        DELETE FROM temp.merge_key WHERE EXISTS (
+                            SELECT 1 FROM main.api_key k
+                            WHERE {name_match} AND k.key = merge_key.key_value
+                        )
+                    """).rowcount
+                
+                # Each round suffixes every name that still collides; rounds = deepest collision chain
+                while conn.exec_driver_sql("""
+                    UPDATE temp.merge_key
+                    SET attempt = attempt + 1, name = base_name || ' (' || (attempt + 1) || ')'
+                    WHERE EXISTS (
+                        SELECT 1 FROM main.api_key k
+                        WHERE k.name = merge_key.name AND k.project_id IS merge_key.project_id
+                    ) OR EXISTS (
+                        SELECT 1 FROM temp.merge_key o
+                        WHERE o.name = merge_key.name AND o.project_id IS merge_key.project_id
+                          AND o.src_id < merge_key.src_id
+                    )
+                """).rowcount:
+                    pass
+                renamed = conn.exec_driver_sql('SELECT COUNT(*) FROM temp.merge_key WHERE attempt > 0').scalar()
+                
+                inserted = conn.exec_driver_sql(f"""
+                    INSERT INTO main.api_key
+                        (name, key, encrypted, encryption_salt, fingerprint, description, used_with, project_id, position)
+                    SELECT m.name, m.key_value, {encrypted}, {salt},
+                           -- The source's own fingerprints may use another pepper
+                           CASE WHEN {encrypted} THEN NULL ELSE key_fingerprint(m.key_value) END,
+                           s.description, s.used_with, m.project_id,
+                           (SELECT COALESCE(MAX(k.position), -1) FROM main.api_key k WHERE k.project_id IS m.project_id)
+                           + ROW_NUMBER() OVER (PARTITION BY m.project_id ORDER BY m.src_position, m.src_id)
+                    FROM temp.merge_key m JOIN import_src.api_key s ON s.id = m.src_id
+                """).rowcount
+                
+                conn.exec_driver_sql('DROP TABLE temp.merge_key')
+                bump_revision(conn)
+        finally:
+            conn.exec_driver_sql('DETACH DATABASE import_src')
+    
+    return {
+        'projects_created': projects_created,
+        'inserted': inserted,
+        'renamed': renamed,
+        'skipped': skipped
+    }
+
+def key_selection(project_id=None, key_ids=None):
+    """Keys of a project, else the listed keys, else every key."""
+    query = APIKey.query
+    if project_id is not None:
+        query = query.filter_by(project_id=project_id)
+    elif key_ids:
+        query = query.filter(APIKey.id.in_(key_ids))
+    return query
 
-@app.route('/keys/encrypt', methods=['POST'])
+@bp.route('/keys/encrypt', methods=['POST'])
+@kdf_limited(lambda: not wants_background())
 def encrypt_keys():
     try:
         data = request.get_json()
-        logger.info(f"Received encryption request with data: {data}")
-        
         if not data or 'password' not in data:
             logger.error("Password missing from request")
             return jsonify({'error': 'Password is required'}), 400
@@ -868,18 +1699,17 @@ def encrypt_keys():
         project_id = data.get('project_id')
         key_ids = data.get('key_ids', [])
         
-        logger.info(f"Encrypting keys for project_id: {project_id}, key_ids: {key_ids}")
+        logger.info("Encrypting keys for project_id: %s, key_ids: %s", project_id, key_ids)
+        query = key_selection(project_id, key_ids).filter_by(encrypted=False)
         
-        # Build query
-        query = APIKey.query
-        if project_id is not None:
-            query = query.filter_by(project_id=project_id)
-        elif key_ids:
-            query = query.filter(APIKey.id.in_(key_ids))
+        if wants_background():
+            job = job_pool.submit('encrypt_keys', {'project_id': project_id, 'key_ids': key_ids}, total=query.count(),
+                                  secrets={'password': password})
+            return jsonify({'message': f'Encrypting {job.total} keys', 'job': job.to_dict()}), 202
             
         # Get keys to encrypt
-        keys = query.filter_by(encrypted=False).all()
-        logger.info(f"Found {len(keys)} unencrypted keys to process")
+        keys = query.all()
+        logger.info("Found %s unencrypted keys to process", len(keys))
         
         if not keys:
             return jsonify({'message': 'No unencrypted keys found to encrypt'}), 200
@@ -888,16 +1718,16 @@ def encrypt_keys():
         encrypted_count = 0
         for key in keys:
             try:
-                logger.info(f"Attempting to encrypt key: {key.name}")
+                logger.debug("Attempting to encrypt key: %s", key.name)
                 key.encrypt_key(password)
                 encrypted_count += 1
-                logger.info(f"Successfully encrypted key: {key.name}")
+                logger.debug("Successfully encrypted key: %s", key.name)
             except Exception as e:
-                logger.error(f"Error encrypting key {key.name}: {str(e)}")
+                logger.error("Error encrypting key %s: %s", key.name, e)
                 logger.exception("Full traceback:")
                 
         db.session.commit()
-        logger.info(f"Successfully encrypted {encrypted_count} keys")
+        logger.info("Successfully encrypted %s keys", encrypted_count)
         
         return jsonify({
             'message': f'Successfully encrypted {encrypted_count} keys',
@@ -906,16 +1736,15 @@ def encrypt_keys():
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error encrypting keys: {str(e)}")
+        logger.error("Error encrypting keys: %s", e)
         logger.exception("Full traceback:")
         return jsonify({'error': f'Failed to encrypt keys: {str(e)}'}), 500
 
-@app.route('/keys/decrypt', methods=['POST'])
+@bp.route('/keys/decrypt', methods=['POST'])
+@kdf_limited(lambda: not wants_background())
 def decrypt_keys():
     try:
         data = request.get_json()
-        logger.info(f"Received decryption request with data: {data}")
-        
         if not data or 'password' not in data:
             logger.error("Password missing from request")
             return jsonify({'error': 'Password is required'}), 400
@@ -924,18 +1753,17 @@ def decrypt_keys():
         project_id = data.get('project_id')
         key_ids = data.get('key_ids', [])
         
-        logger.info(f"Decrypting keys for project_id: {project_id}, key_ids: {key_ids}")
+        logger.info("Decrypting keys for project_id: %s, key_ids: %s", project_id, key_ids)
+        query = key_selection(project_id, key_ids).filter_by(encrypted=True)
         
-        # Build query
-        query = APIKey.query
-        if project_id is not None:
-            query = query.filter_by(project_id=project_id)
-        elif key_ids:
-            query = query.filter(APIKey.id.in_(key_ids))
+        if wants_background():
+            job = job_pool.submit('decrypt_keys', {'project_id': project_id, 'key_ids': key_ids}, total=query.count(),
+                                  secrets={'password': password})
+            return jsonify({'message': f'Decrypting {job.total} keys', 'job': job.to_dict()}), 202
             
         # Get keys to decrypt
-        keys = query.filter_by(encrypted=True).all()
-        logger.info(f"Found {len(keys)} encrypted keys to process")
+        keys = query.all()
+        logger.info("Found %s encrypted keys to process", len(keys))
         
         if not keys:
             return jsonify({'message': 'No encrypted keys found to decrypt'}), 200
@@ -946,18 +1774,18 @@ def decrypt_keys():
         
         for key in keys:
             try:
-                logger.info(f"Attempting to decrypt key: {key.name}")
+                logger.debug("Attempting to decrypt key: %s", key.name)
                 key.decrypt_key(password)
                 decrypted_count += 1
-                logger.info(f"Successfully decrypted key: {key.name}")
+                logger.debug("Successfully decrypted key: %s", key.name)
             except ValueError as e:
                 failed_keys.append({'id': key.id, 'name': key.name, 'error': str(e)})
-                logger.error(f"Error decrypting key {key.name}: {str(e)}")
+                logger.error("Error decrypting key %s: %s", key.name, e)
                 logger.exception("Full traceback:")
                 
         if decrypted_count > 0:
             db.session.commit()
-            logger.info(f"Successfully decrypted {decrypted_count} keys")
+            logger.info("Successfully decrypted %s keys", decrypted_count)
         
         response = {
             'message': f'Successfully decrypted {decrypted_count} keys',
@@ -971,11 +1799,145 @@ def decrypt_keys():
         
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error decrypting keys: {str(e)}")
+        logger.error("Error decrypting keys: %s", e)
         logger.exception("Full traceback:")
         return jsonify({'error': f'Failed to decrypt keys: {str(e)}'}), 500
 
-@app.route('/keys/status', methods=['GET'])
+@job_handler('encrypt_keys')
+@job_handler('decrypt_keys')
+def crypt_keys_job(job):
+    """Encrypt or decrypt the selected keys in id order, JOB_BATCH_SIZE per checkpoint.
+
+    Each derivation takes a KDF slot like a request would, so a vault-wide
+    job shares the CPU with interactive password operations.
+    """
+    encrypt = job.kind == 'encrypt_keys'
+    password = job.secrets['password']
+    query = key_selection(job.params.get('project_id'), job.params.get('key_ids')).filter(
+        APIKey.encrypted.is_(not encrypt)
+    ).order_by(APIKey.id)
+    batch_size = current_app.config['JOB_BATCH_SIZE']
+    last_id = job.state.get('last_id', 0)
+    count = job.state.get('count', 0)
+    failed = job.state.get('failed', [])
+    failed_count = job.state.get('failed_count', 0)
+
+    while True:
+        keys = query.filter(APIKey.id > last_id).limit(batch_size).all()
+        if not keys:
+            break
+        for key in keys:
+            try:
+                with kdf_scheduler.slot('jobs', retry=True):
+                    if encrypt:
+                        key.encrypt_key(password)
+                    else:
+                        key.decrypt_key(password)
+                count += 1
+            except ValueError as e:
+                failed_count += 1
+                # Enough to show what went wrong without growing the checkpoint
+                if len(failed) < 100:
+                    failed.append({'id': key.id, 'name': key.name, 'error': str(e)})
+        if failed_count and not count:
+            # Most likely the wrong password: stop before the checkpoint, so a resume starts over
+            raise ValueError(f'None of the {failed_count} keys could be {"encrypted" if encrypt else "decrypted"}; '
+                             'check the password')
+        last_id = keys[-1].id
+        job.checkpoint(job.done + len(keys), last_id=last_id, count=count, failed=failed, failed_count=failed_count)
+
+    logger.info("Job %s %s %s keys, %s failed", job.id, 'encrypted' if encrypt else 'decrypted', count, failed_count)
+    return {'count': count, 'failed_count': failed_count, 'failed_keys': failed}
+
+@bp.route('/keys/rotate-password', methods=['POST'])
+def rotate_password():
+    """Re-encrypt encrypted keys from one password to another as a background job."""
+    try:
+        data = request.get_json(silent=True) or {}
+        old_password = data.get('old_password')
+        new_password = data.get('new_password')
+        if not old_password or not new_password:
+            return jsonify({'error': 'old_password and new_password are required'}), 400
+        if old_password == new_password:
+            return jsonify({'error': 'The new password must differ from the old one'}), 400
+
+        project_id = data.get('project_id')
+        key_ids = data.get('key_ids', [])
+        query = key_selection(project_id, key_ids).filter_by(encrypted=True)
+        job = job_pool.submit('rotate_password', {'project_id': project_id, 'key_ids': key_ids}, total=query.count(),
+                              secrets={'old_password': old_password, 'new_password': new_password})
+        logger.info("Rotating the password of %s keys for project_id: %s, key_ids: %s", job.total, project_id, key_ids)
+        return jsonify({'message': f'Rotating the password of {job.total} keys', 'job': job.to_dict()}), 202
+    except Exception as e:
+        logger.error("Error starting password rotation: %s", e)
+        return jsonify({'error': f'Failed to rotate password: {str(e)}'}), 500
+
+@job_handler('rotate_password')
+def rotate_password_job(job):
+    """Move the selected keys from the old password to the new one, JOB_BATCH_SIZE per checkpoint.
+
+    Each batch is re-encrypted under one freshly salted new key, so it
+    costs one derivation plus one per distinct old salt; keys rotated
+    before share their batch's salt. Plaintext never leaves memory, and a
+    key the new password already opens was rotated by an earlier run and
+    is only counted.
+    """
+    old_password = job.secrets['old_password']
+    new_password = job.secrets['new_password']
+    query = key_selection(job.params.get('project_id'), job.params.get('key_ids')).filter(
+        APIKey.encrypted.is_(True)
+    ).order_by(APIKey.id)
+    batch_size = current_app.config['JOB_BATCH_SIZE']
+    last_id = job.state.get('last_id', 0)
+    count = job.state.get('count', 0)
+    already_rotated = job.state.get('already_rotated', 0)
+    failed = job.state.get('failed', [])
+    failed_count = job.state.get('failed_count', 0)
+
+    def derive(password, salt=None):
+        with kdf_scheduler.slot('jobs', retry=True):
+            return generate_key(password, salt)
+
+    while True:
+        keys = query.filter(APIKey.id > last_id).limit(batch_size).all()
+        if not keys:
+            break
+        new_key, new_salt = derive(new_password)
+        # Derived keys by salt, for this batch only
+        old_keys, new_keys = {}, {new_salt: new_key}
+        rotated = 0
+        for key in keys:
+            salt = key.salt()
+            if salt not in old_keys:
+                old_keys[salt] = derive(old_password, salt)[0]
+            try:
+                key.rotate_key(old_keys[salt], new_key, new_salt)
+                rotated += 1
+                continue
+            except ValueError as e:
+                error = str(e)
+            if salt not in new_keys:
+                new_keys[salt] = derive(new_password, salt)[0]
+            try:
+                key.rotate_key(new_keys[salt], new_key, new_salt)
+                already_rotated += 1
+            except ValueError:
+                failed_count += 1
+                if len(failed) < 100:
+                    failed.append({'id': key.id, 'name': key.name, 'error': error})
+        count += rotated
+        if failed_count and not count and not already_rotated:
+            # Most likely the wrong old password: stop before the checkpoint, so a resume starts over
+            raise ValueError(f'None of the {failed_count} keys could be decrypted; check the old password')
+        last_id = keys[-1].id
+        job.checkpoint(job.done + len(keys), last_id=last_id, count=count, already_rotated=already_rotated,
+                       failed=failed, failed_count=failed_count)
+
+    logger.info("Job %s rotated the password of %s keys, %s already rotated, %s failed",
+                job.id, count, already_rotated, failed_count)
+    return {'count': count, 'already_rotated': already_rotated, 'failed_count': failed_count, 'failed_keys': failed}
+
+@bp.route('/keys/status', methods=['GET'])
 def get_encryption_status():
     try:
         project_id = request.args.get('project_id', type=int)
@@ -997,155 +1959,118 @@ def get_encryption_status():
         }), 200
         
     except Exception as e:
-        logger.error(f"Error getting encryption status: {str(e)}")
+        logger.error("Error getting encryption status: %s", e)
         return jsonify({'error': f'Failed to get encryption status: {str(e)}'}), 500
 
-@app.route('/api/keys/move', methods=['POST'])
+def resolve_unique_names(names, project_id=None):
+    """Suffix names so they are unique within the project and among themselves.
+
+    Set-based counterpart of generate_unique_name: one query for the whole batch.
+    """
+    taken = {name for (name,) in db.session.query(APIKey.name).filter(APIKey.project_id == project_id)}
+    resolved = []
+    for base_name in names:
+        name = base_name
+        counter = 1
+        while name in taken:
+            name = f"{base_name}{counter}"
+            counter += 1
+        taken.add(name)
+        resolved.append(name)
+    return resolved
+
+@bp.route('/api/keys/move', methods=['POST'])
 def move_key():
     try:
         data = request.get_json()
-        if not data or 'key_id' not in data or 'target_project_id' not in data:
+        if not data or 'target_project_id' not in data or not (
+            'key_id' in data or 'key_ids' in data or 'source_project_id' in data
+        ):
             return jsonify({'error': 'Missing required fields'}), 400
+        if 'key_ids' in data and not isinstance(data['key_ids'], list):
+            return jsonify({'error': 'key_ids must be a list'}), 400
             
-        key_id = data['key_id']
         target_project_id = data['target_project_id']
         is_copy = data.get('is_copy', False)
-        password = data.get('password')
         
-        # Get the source key
-        key = APIKey.query.get_or_404(key_id)
+        # Select the keys to move, in their current display order
+        query = APIKey.query
+        if 'key_id' in data:
+            key = APIKey.query.get_or_404(data['key_id'])
+            query = query.filter(APIKey.id == key.id)
+        elif 'key_ids' in data:
+            query = query.filter(APIKey.id.in_(data['key_ids']))
+        else:
+            query = query.filter(APIKey.project_id == data['source_project_id'])
+        if not is_copy:
+            # Keys already in the target project have nowhere to move
+            query = query.filter(APIKey.project_id.is_distinct_from(target_project_id))
+        keys = query.order_by(APIKey.project_id, APIKey.position).all()
         
-        # If copying, create a new key
-        if is_copy:
-            # Get the maximum position for the target project
-            max_position = db.session.query(db.func.max(APIKey.position)).filter(
-                APIKey.project_id == target_project_id
-            ).scalar() or -1
-            
-            # Create a copy of the key
-            new_key = APIKey(
-                name=generate_unique_name(key.name, target_project_id),
-                key=key.key,
-                description=key.description,
-                used_with=key.used_with,
-                project_id=target_project_id,
-                position=max_position + 1,
-                encrypted=key.encrypted,
-                encryption_salt=key.encryption_salt
-            )
-            
-            db.session.add(new_key)
-            db.session.commit()
-            
-            logger.info(f"Successfully copied key {key.name} to project {target_project_id}")
-            return jsonify({
-                'message': 'Key copied successfully',
-                'key': new_key.to_dict()
-            }), 200
-            
+        key_ids = [key.id for key in keys]
+        new_names = resolve_unique_names([key.name for key in keys], target_project_id)
+        table = APIKey.__table__
+        
+        # Names and positions are written by CASE on id, so the whole batch is one statement
+        name_case = db.case({key_id: name for key_id, name in zip(key_ids, new_names)}, value=table.c.id)
+        offset_case = db.case({key_id: i for i, key_id in enumerate(key_ids)}, value=table.c.id)
+        base_position = db.select(
+            db.func.coalesce(db.func.max(table.c.position), -1) + 1
+        ).where(table.c.project_id == target_project_id).correlate(None).scalar_subquery()
+        
+        if key_ids and is_copy:
+            # Ciphertext and salt are copied as-is, no decrypt/re-encrypt needed
+            db.session.execute(table.insert().from_select(
+                ['name', 'key', 'encrypted', 'encryption_salt', 'fingerprint', 'description', 'used_with', 'project_id',
+                 'position'],
+                db.select(
+                    name_case, table.c.key, table.c.encrypted, table.c.encryption_salt, table.c.fingerprint,
+                    table.c.description, table.c.used_with,
+                    db.literal(target_project_id, db.Integer), base_position + offset_case
+                ).where(table.c.id.in_(key_ids))
+            ))
+            result_keys = APIKey.query.filter(APIKey.project_id == target_project_id).order_by(
+                APIKey.position.desc()
+            ).limit(len(key_ids)).all()[::-1]
+        elif key_ids:
+            db.session.execute(table.update().where(table.c.id.in_(key_ids)).values(
+                name=name_case,
+                position=base_position + offset_case,
+                project_id=target_project_id
+            ))
+            # Close the gaps the keys left behind
+            close_position_gaps({key.project_id for key in keys})
+            result_keys = APIKey.query.filter(APIKey.id.in_(key_ids)).order_by(APIKey.position).all()
         else:
-            # Moving the key
-            old_project_id = key.project_id
-            
-            # Update positions in old project
-            if old_project_id is not None:
-                APIKey.query.filter(
-                    APIKey.project_id == old_project_id,
-                    APIKey.position > key.position
-                ).update({
-                    APIKey.position: APIKey.position - 1
-                })
-            
-            # Get max position in target project
-            max_position = db.session.query(db.func.max(APIKey.position)).filter(
-                APIKey.project_id == target_project_id
-            ).scalar() or -1
-            
-            # Update the key
-            key.project_id = target_project_id
-            key.position = max_position + 1
-            key.name = generate_unique_name(key.name, target_project_id)
-            
-            db.session.commit()
-            
-            logger.info(f"Successfully moved key {key.name} to project {target_project_id}")
+            result_keys = []
+        if key_ids:
+            check_project_accepts_keys(target_project_id)
+        
+        db.session.commit()
+        
+        action = 'copied' if is_copy else 'moved'
+        logger.info("Successfully %s %s keys to project %s", action, len(result_keys), target_project_id)
+        
+        if 'key_id' in data:
             return jsonify({
-                'message': 'Key moved successfully',
-                'key': key.to_dict()
+                'message': f'Key {action} successfully',
+                'key': (result_keys[0] if result_keys else key).to_dict()
             }), 200
+        return jsonify({
+            'message': f'Successfully {action} {len(result_keys)} keys',
+            'count': len(result_keys),
+            'keys': [key.to_dict() for key in result_keys]
+        }), 200
             
+    except ProjectDeleting as e:
+        db.session.rollback()
+        return e.response()
     except Exception as e:
         db.session.rollback()
-        logger.error(f"Error moving/copying key: {str(e)}")
+        logger.error("Error moving/copying key: %s", e)
         logger.exception("Full traceback:")
         return jsonify({'error': f'Failed to move/copy key: {str(e)}'}), 500
 
-def generate_export_file(keys, export_format, project_id=None):
-    """Generate the export file based on format."""
-    try:
-        # Determine the project name for the filename
-        if project_id:
-            if keys and keys[0].get('project'):
-                project_name = keys[0]['project']['name'].replace(' ', '_')
-            else:
-                project_name = f"project_{project_id}"
-        else:
-            project_name = "all"
-
-        output = ""
-        mimetype = 'text/plain'
-        filename = f"api_keys_{project_name}.env"
-
-        if export_format == 'json':
-            # JSON export: formatted with indents for readability
-            output = json.dumps({k['name']: k['key'] for k in keys}, indent=2)
-            mimetype = 'application/json'
-            filename = f"api_keys_{project_name}.json"
-        elif export_format == 'yaml':
-            # YAML export: formatted in block style for clarity
-            output = yaml.dump({k['name']: k['key'] for k in keys}, default_flow_style=False)
-            mimetype = 'application/x-yaml'
-            filename = f"api_keys_{project_name}.yaml"
-        else:  # .env format
-            # Beautify .env output:
-            # If no specific project is provided (exporting all keys), group by project.
-            if project_id is None:
-                from collections import defaultdict
-                grouped_keys = defaultdict(list)
-                for k in keys:
-                    # Use "Unassigned" if no project info is available
-                    proj_name = "Unassigned"
-                    if k.get('project') and k['project'].get('name'):
-                        proj_name = k['project']['name']
-                    grouped_keys[proj_name].append(k)
-                lines = []
-                # Sort projects alphabetically for consistency
-                for proj in sorted(grouped_keys.keys()):
-                    lines.append(f"# Project: {proj}")  # Comment header for the project group
-                    for key in grouped_keys[proj]:
-                        lines.append(f"{key['name']}={key['key']}")
-                    lines.append("")  # Add a blank line between project groups
-                output = "\n".join(lines)
-            else:
-                # For a single project, add a header comment then list keys.
-                header = f"# API Keys for project: {project_name}"
-                keys_lines = "\n".join([f"{k['name']}={k['key']}" for k in keys])
-                output = header + "\n\n" + keys_lines
-
-        # Create in-memory file for sending
-        buffer = io.BytesIO()
-        buffer.write(output.encode('utf-8'))
-        buffer.seek(0)
-
-        return send_file(
-            buffer,
-            mimetype=mimetype,
-            as_attachment=True,
-            download_name=filename
-        )
-        
-    except Exception as e:
-        raise ValueError(f"Export generation failed: {str(e)}")
-
 if __name__ == '__main__':
-    app.run(host='localhost', port=5000, debug=True)# Main application file 
\ No newline at end of file
+    # Development server only; see serve.py for running under load
+    create_app('development').run(host='localhost', port=5000, debug=True)# Main application file 
\ No newline at end of file
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Compression formats for snapshots: file suffix and mimetype
+COMPRESSIONS = {
+    'gzip': ('.gz', 'application/gzip'),
+    'zstd': ('.zst', 'application/zstd'),
+}
+
+def snapshot_database(source_path, dest_path, pages=1024, sleep=0.005):
+    """Copy a live database to dest_path with SQLite's online backup API.
+
+    The copy is made `pages` pages at a time, sleeping between steps so
+    writers can get in. The result is a consistent snapshot that includes
+    anything still sitting in the -wal file. Returns the SHA-256 of the snapshot.
+    """
+    source = sqlite3.connect(source_path, timeout=30)
+    dest = sqlite3.connect(dest_path)
+    try:
+        source.backup(dest, pages=pages, sleep=sleep)
+        # The snapshot travels as a single file, so it must not expect a -wal beside it
+        dest.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        dest.close()
+        source.close()
+
+    digest = hashlib.sha256()
+    with open(dest_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_compressor(compression):
+    """Return a streaming compressor object with compress()/flush(), or None."""
+    if not compression:
+        return None
+    if compression == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('zstd compression requires the zstandard package')
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError(f"Unsupported compression '{compression}'. Supported: {', '.join(COMPRESSIONS)}")
+
+def iter_file(path, compressor=None):
+    """Yield a file's contents in chunks, compressed on the fly if a compressor is given."""
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            data = compressor.compress(chunk) if compressor else chunk
+            if data:
+                yield data
+    if compressor:
+        yield compressor.flush()
+
+BACKUP_NAME = re.compile(r'^keys_(\d{8}_\d{6})_r(\d+)\.db\.gz$')
+STATUS_FILE = 'backup_status.json'
+# Kept beside the database; a swapped-in file can carry the revision number of the one it replaced
+GENERATION_SUFFIX = '.generation'
+
+def init_backups(app, db_path):
+    """Configure scheduled backups and start them with the first request if enabled.
+
+    BACKUP_INTERVAL (seconds, 0 disables the in-process scheduler),
+    BACKUP_DIR and BACKUP_KEEP_HOURLY/DAILY/WEEKLY come from the environment.
+    """
+    app.config.setdefault('BACKUP_DIR', os.environ.get('BACKUP_DIR', os.path.join(app.instance_path, 'backups')))
+    app.config.setdefault('BACKUP_INTERVAL', int(os.environ.get('BACKUP_INTERVAL', 0)))
+    app.config.setdefault('BACKUP_RETENTION', {
+        'hourly': int(os.environ.get('BACKUP_KEEP_HOURLY', 24)),
+        'daily': int(os.environ.get('BACKUP_KEEP_DAILY', 7)),
+        'weekly': int(os.environ.get('BACKUP_KEEP_WEEKLY', 4)),
+    })
+
+    @app.before_first_request
+    def start_backup_scheduler():
+        if app.config['BACKUP_INTERVAL']:
+            BackupScheduler.from_app(app, db_path).start()
+
+def read_revision(path):
+    """Data revision stored in a database file, 0 if it predates the counter."""
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        row = conn.execute('SELECT value FROM data_revision WHERE id = 1').fetchone()
+        return row[0] if row else 0
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+def read_generation(path):
+    """How many times the database file at path has been swapped for another, 0 if never."""
+    try:
+        with open(path + GENERATION_SUFFIX) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def bump_generation(path):
+    """Record that the database file at path was swapped for another one."""
+    generation_path = path + GENERATION_SUFFIX
+    with open(generation_path + '.tmp', 'w') as f:
+        f.write(str(read_generation(path) + 1))
+    os.replace(generation_path + '.tmp', generation_path)
+
+def list_backups(directory):
+    """Backups in a directory as (created, revision, path), newest first."""
+    backups = []
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            match = BACKUP_NAME.match(name)
+            if match:
+                created = datetime.strptime(match.group(1), '%Y%m%d_%H%M%S')
+                backups.append((created, int(match.group(2)), os.path.join(directory, name)))
+    return sorted(backups, reverse=True)
+
+def apply_retention(directory, hourly=24, daily=7, weekly=4):
+    """Keep the newest backup of each of the last N hours, days and ISO weeks; delete the rest."""
+    backups = list_backups(directory)
+    keep = {backups[0][2]} if backups else set()
+    for bucket_format, count in (('%Y%m%d%H', hourly), ('%Y%m%d', daily), ('%G%V', weekly)):
+        seen = set()
+        for created, _, path in backups:
+            bucket = created.strftime(bucket_format)
+            if bucket not in seen and len(seen) < count:
+                seen.add(bucket)
+                keep.add(path)
+
+    removed = []
+    for _, _, path in backups:
+        if path not in keep:
+            os.unlink(path)
+            removed.append(os.path.basename(path))
+    return removed
+
+def read_backup_status(directory):
+    try:
+        with open(os.path.join(directory, STATUS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+class BackupScheduler(threading.Thread):
+    """Takes a compressed online backup every `interval` seconds.
+
+    Runs are skipped while the data revision matches the newest backup
+    and the database file has not been swapped since it was taken.
+    Results are written to backup_status.json in the backup directory, so
+    the web app can report on a scheduler running in another process.
+    """
+
+    def __init__(self, db_path, directory, interval, retention=None):
+        super().__init__(name='backup-scheduler', daemon=True)
+        self.db_path = db_path
+        self.directory = directory
+        self.interval = interval
+        self.retention = retention or {}
+        self.stopped = threading.Event()
+
+    @classmethod
+    def from_app(cls, app, db_path, interval=None):
+        return cls(db_path, app.config['BACKUP_DIR'], interval or app.config['BACKUP_INTERVAL'],
+                   app.config['BACKUP_RETENTION'])
+
+    def run(self):
+        logger.info("Backup scheduler started: every %ss into %s", self.interval, self.directory)
+        while True:
+            self.run_once()
+            if self.stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        self.stopped.set()
+
+    def run_once(self):
+        """Take one backup unless nothing changed. Returns the updated status."""
+        os.makedirs(self.directory, exist_ok=True)
+        status = read_backup_status(self.directory)
+        status['last_run_at'] = datetime.now().isoformat()
+        started = time.monotonic()
+        temp_path = None
+        try:
+            # Read before the revision, so a swap in between only costs an extra backup next run
+            generation = read_generation(self.db_path)
+            revision = read_revision(self.db_path)
+            backups = list_backups(self.directory)
+            if backups and backups[0][1] == revision and status.get('last_generation', 0) == generation:
+                status['skipped_runs'] = status.get('skipped_runs', 0) + 1
+                status['last_result'] = 'skipped'
+                return status
+
+            temp_fd, temp_path = tempfile.mkstemp(suffix='.db', dir=self.directory)
+            os.close(temp_fd)
+            checksum = snapshot_database(self.db_path, temp_path)
+
+            # Write under a temporary name so a half-written file never looks like a backup
+            name = f"keys_{datetime.now().strftime('%Y%m%d_%H%M%S')}_r{revision}.db.gz"
+            partial_path = os.path.join(self.directory, name + '.partial')
+            with open(partial_path, 'wb') as f:
+                for chunk in iter_file(temp_path, get_compressor('gzip')):
+                    f.write(chunk)
+            os.replace(partial_path, os.path.join(self.directory, name))
+
+            removed = apply_retention(self.directory, **self.retention)
+            duration = time.monotonic() - started
+            status.update({
+                'last_result': 'success',
+                'last_success_at': datetime.now().isoformat(),
+                'last_duration_seconds': round(duration, 3),
+                'last_backup': name,
+                'last_backup_sha256': checksum,
+                'last_backup_bytes': os.path.getsize(os.path.join(self.directory, name)),
+                'last_revision': revision,
+                'last_generation': generation,
+                'successful_runs': status.get('successful_runs', 0) + 1,
+                'removed_by_retention': removed,
+            })
+            logger.info("Backup %s written in %.2fs, %s old backups removed", name, duration, len(removed))
+        except Exception as e:
+            status.update({
+                'last_result': 'failed',
+                'last_error': str(e),
+                'failed_runs': status.get('failed_runs', 0) + 1,
+            })
+            logger.error("Error taking scheduled backup: %s", e)
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            self._write_status(status)
+        return status
+
+    def _write_status(self, status):
+        path = os.path.join(self.directory, STATUS_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(status, f, indent=2)
+        os.replace(path + '.tmp', path)
+# Database snapshots and scheduled backups
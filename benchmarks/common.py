@@ -0,0 +1,56 @@
+"""Shared setup for the benchmark scripts: a migrated throwaway database and server processes."""
+import http.client
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def create_temp_app(name='bench.db', **config):
+    """Create an app on a fresh database migrated to head, logging into the same temp directory."""
+    from flask_migrate import upgrade
+    from app import create_app
+
+    directory = tempfile.mkdtemp()
+    app = create_app({'DATABASE_PATH': os.path.join(directory, name), 'LOG_DIR': directory, **config})
+    with app.app_context():
+        upgrade()
+    # Alembic's logging config turns request logging back on
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    return app
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(server, port, env, workers=2, threads=4):
+    """Start the dev server or serve.py on `port` and wait until it answers."""
+    if server == 'dev':
+        code = (f"import sys; sys.path.insert(0, {ROOT!r}); from app import create_app; "
+                f"create_app('development').run(host='127.0.0.1', port={port}, debug=True, use_reloader=False)")
+        command = [sys.executable, '-c', code]
+    else:
+        command = [sys.executable, os.path.join(ROOT, 'serve.py'), '--server', server, '--bind', f'127.0.0.1:{port}',
+                   '--workers', str(workers), '--threads', str(threads)]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/projects')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{server} did not start')
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""Load-test the HTTP API on a seeded vault and report latency per route.
+
+The database is filled by `seed.seed_database`, the same generator behind
+`flask seed`, and served by the development server, gunicorn or waitress.
+Client processes then run a weighted mix of key listings, exports with
+decryption, reorders, .env imports and decrypt/re-encrypt round trips over
+keep-alive connections. Each client works on its own encrypted keys, so
+round trips don't collide.
+
+Usage: python benchmarks/load_test.py [--server gunicorn] [--seconds 20] [--clients 8]
+                                      [--projects 10] [--keys 500] [--encrypted-ratio 0.1]
+                                      [--output report.json]
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from common import create_temp_app, free_port, start_server
+
+PASSWORD = 'load-test-password'
+
+# Relative weight of each operation in the mix
+OPERATIONS = {
+    'list_keys': 50,
+    'export': 10,
+    'reorder': 20,
+    'import_env': 10,
+    'decrypt_encrypt': 10,
+}
+
+
+def seed(app, args):
+    from database import db, APIKey, Project
+    from seed import seed_database
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            summary = seed_database(connection, args.projects, args.keys, args.encrypted_ratio, PASSWORD, args.seed)
+        projects = [row.id for row in db.session.query(Project.id).order_by(Project.id)]
+        keys = [(row.id, row.project_id) for row in db.session.query(APIKey.id, APIKey.project_id)]
+        encrypted = [row.id for row in db.session.query(APIKey.id).filter_by(encrypted=True)]
+    return summary, projects, keys, encrypted
+
+
+def client(job):
+    port, seconds, projects, keys, encrypted, keys_per_project, seed_value = job
+    rng = random.Random(seed_value)
+    operations, weights = list(OPERATIONS), list(OPERATIONS.values())
+    if not encrypted:
+        weights[operations.index('decrypt_encrypt')] = 0
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    results = {}
+
+    def call(route, method, path, body=None, content_type='application/json'):
+        nonlocal connection
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers={'Content-Type': content_type})
+            response = connection.getresponse()
+            response.read()
+            failed = response.status >= 400
+        except (OSError, http.client.HTTPException):
+            failed = True
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        latencies, errors = results.setdefault(route, ([], [0]))
+        latencies.append(time.perf_counter() - started)
+        errors[0] += failed
+
+    deadline = time.time() + seconds
+    imports = 0
+    while time.time() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        project_id = rng.choice(projects)
+        if operation == 'list_keys':
+            call('GET /keys', 'GET', f'/keys?project_id={project_id}')
+        elif operation == 'export':
+            call('GET /export', 'GET', f'/export?project_id={project_id}&format=env&password={PASSWORD}')
+        elif operation == 'reorder':
+            key_id, key_project = rng.choice(keys)
+            call('PATCH /keys/<id>/reorder', 'PATCH', f'/keys/{key_id}/reorder',
+                 json.dumps({'new_position': rng.randrange(keys_per_project), 'project_id': key_project}))
+        elif operation == 'import_env':
+            imports += 1
+            lines = ''.join(f'LOAD_{seed_value}_{imports}_{i}={uuid.uuid4().hex}\n' for i in range(20))
+            boundary = uuid.uuid4().hex
+            body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename=".env"\r\n'
+                    f'Content-Type: text/plain\r\n\r\n{lines}\r\n--{boundary}--\r\n')
+            call('POST /projects/<id>/import-env', 'POST', f'/projects/{project_id}/import-env', body.encode(),
+                 f'multipart/form-data; boundary={boundary}')
+        else:
+            key_ids = rng.sample(encrypted, min(3, len(encrypted)))
+            body = json.dumps({'password': PASSWORD, 'key_ids': key_ids})
+            call('POST /keys/decrypt', 'POST', '/keys/decrypt', body)
+            call('POST /keys/encrypt', 'POST', '/keys/encrypt', body)
+    return {route: (latencies, errors[0]) for route, (latencies, errors) in results.items()}
+
+
+def summarize(latencies, errors, seconds):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2)
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_sec': round(len(latencies) / seconds, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', default='gunicorn', choices=['dev', 'gunicorn', 'waitress'])
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--projects', type=int, default=10)
+    parser.add_argument('--keys', type=int, default=500, help='Keys per project')
+    parser.add_argument('--encrypted-ratio', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the data and the request mix')
+    parser.add_argument('--output', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    if args.server != 'dev' and not importlib.util.find_spec(args.server):
+        print(f'{args.server} is not installed', file=sys.stderr)
+        return 1
+
+    app = create_temp_app('load.db')
+    summary, projects, keys, encrypted = seed(app, args)
+    env = dict(os.environ, DATABASE_PATH=app.config['DATABASE_PATH'], LOG_DIR=app.config['LOG_DIR'],
+               FLASK_SECRET_KEY='benchmark')
+
+    port = free_port()
+    # Each client round-trips its own slice of the encrypted keys
+    jobs = [(port, args.seconds, projects, keys, encrypted[i::args.clients], args.keys, args.seed * 1000 + i)
+            for i in range(args.clients)]
+    process = start_server(args.server, port, env, args.workers, args.threads)
+    try:
+        with multiprocessing.Pool(args.clients) as pool:
+            started = time.perf_counter()
+            results = pool.map(client, jobs)
+            duration = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+
+    routes = {}
+    for result in results:
+        for route, (latencies, errors) in result.items():
+            merged = routes.setdefault(route, ([], [0]))
+            merged[0].extend(latencies)
+            merged[1][0] += errors
+    everything = [latency for latencies, _ in routes.values() for latency in latencies]
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'server': args.server,
+        'clients': args.clients,
+        'workers': args.workers,
+        'threads': args.threads,
+        'seconds': round(duration, 1),
+        'seeded': summary,
+        'total': summarize(everything, sum(errors[0] for _, errors in routes.values()), duration),
+        'routes': {route: summarize(latencies, errors[0], duration)
+                   for route, (latencies, errors) in sorted(routes.items())},
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Measure request latency with logging off, written synchronously, and queued.
+
+Client threads add keys, reorder them and list a project through the Flask
+app, so every request logs a few INFO messages. Each mode gets its own app
+and log file; the DEBUG mode also logs the position fix-ups of reorders.
+
+Usage: python benchmarks/logging_overhead.py [--requests 1000] [--threads 4]
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+from common import create_temp_app
+
+MODES = {
+    'off': {'LOG_LEVEL': 'CRITICAL'},
+    'sync_text': {'LOG_ASYNC': False, 'LOG_FORMAT': 'text', 'LOG_SAMPLE_BURST': 0},
+    'sync_json': {'LOG_ASYNC': False, 'LOG_SAMPLE_BURST': 0},
+    'async_json': {'LOG_SAMPLE_BURST': 0},
+    'async_json_sampled': {},
+    'async_json_debug': {'LOG_LEVEL': 'DEBUG'},
+}
+
+
+def run(mode, config, args):
+    app = create_temp_app(f'{mode}.db', **config)
+    client = app.test_client()
+    project_id = client.post('/projects', json={'name': 'bench'}).get_json()['id']
+    key_ids = [client.post('/keys', json={'name': f'SEED_{i}', 'key': 'x', 'project_id': project_id}).get_json()['id']
+               for i in range(args.keys)]
+
+    latencies = []
+    lock = threading.Lock()
+    per_thread = args.requests // args.threads
+
+    def worker(n):
+        client = app.test_client()
+        rng = random.Random(n)
+        for i in range(per_thread):
+            roll = rng.random()
+            started = time.perf_counter()
+            if roll < 0.4:
+                client.post('/keys', json={'name': f'T{n}_{i}', 'key': 'x', 'project_id': project_id})
+            elif roll < 0.7:
+                client.patch(f'/keys/{rng.choice(key_ids)}/reorder', json={'new_position': rng.randrange(args.keys)})
+            else:
+                client.get(f'/keys?project_id={project_id}')
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests_per_sec': round(len(latencies) / duration, 1),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--keys', type=int, default=100, help='Keys in the project before the run')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    report = {mode: run(mode, MODES[mode], args) for mode in args.modes}
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
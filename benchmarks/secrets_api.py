@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Compare read throughput of GET /keys/<id> with the indexed /v1/secrets API.
+
+Client threads read random keys through the Flask app for a fixed time per
+path. A writer can be added to show the cost of index rebuilds.
+
+Usage: python benchmarks/secrets_api.py [--seconds 5] [--threads 8] [--writes-per-sec 0]
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from common import create_temp_app
+
+
+def seed(app, projects, keys_per_project):
+    from database import db, APIKey, Project
+
+    refs = []
+    with app.app_context():
+        for p in range(projects):
+            project = Project(name=f'service-{p}', position=p)
+            db.session.add(project)
+            db.session.flush()
+            db.session.add_all(
+                APIKey(name=f'SECRET_{i}', key='x' * 40, project_id=project.id, position=i)
+                for i in range(keys_per_project)
+            )
+            refs += [(project.name, f'SECRET_{i}') for i in range(keys_per_project)]
+        db.session.commit()
+        ids = [key_id for key_id, in db.session.query(APIKey.id)]
+    return ids, refs
+
+
+def run(app, name, request_for, args):
+    stop = threading.Event()
+    results = Counter()
+    latencies = []
+    lock = threading.Lock()
+
+    def client_loop():
+        client = app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            status = request_for(client).status_code
+            elapsed = time.perf_counter() - started
+            with lock:
+                results['ok' if status == 200 else 'errors'] += 1
+                latencies.append(elapsed)
+
+    def writer():
+        client = app.test_client()
+        i = 0
+        while not stop.wait(1 / args.writes_per_sec):
+            client.post('/keys', json={'name': f'{name}_W{i}', 'key': 'x'})
+            i += 1
+
+    threads = [threading.Thread(target=client_loop) for _ in range(args.threads)]
+    if args.writes_per_sec:
+        threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return {
+        'requests_per_sec': round(results['ok'] / args.seconds, 1),
+        'errors': results['errors'],
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--projects', type=int, default=20)
+    parser.add_argument('--keys', type=int, default=100, help='Keys per project')
+    parser.add_argument('--batch', type=int, default=50, help='Secrets per resolve request')
+    parser.add_argument('--writes-per-sec', type=float, default=0)
+    args = parser.parse_args()
+
+    app = create_temp_app('secrets.db')
+    ids, refs = seed(app, args.projects, args.keys)
+
+    def orm(client):
+        return client.get(f'/keys/{random.choice(ids)}')
+
+    def indexed(client):
+        project, name = random.choice(refs)
+        return client.get(f'/v1/secrets/{project}/{name}')
+
+    def resolve(client):
+        batch = random.sample(refs, args.batch)
+        return client.post('/v1/secrets/resolve', json={'secrets': [{'project': p, 'name': n} for p, n in batch]})
+
+    report = {
+        'orm_get_key': run(app, 'orm', orm, args),
+        'v1_secret': run(app, 'v1', indexed, args),
+        f'v1_resolve_batch_{args.batch}': run(app, 'resolve', resolve, args),
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Compare throughput of the development server with the production servers.
+
+Each server runs as a subprocess on the same seeded database. Client
+processes issue a mix of /v1/secrets lookups, key listings and key inserts
+over keep-alive connections for a fixed time.
+
+Usage: python benchmarks/server_throughput.py [--servers dev gunicorn waitress]
+                                              [--seconds 10] [--clients 8]
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from common import create_temp_app, free_port, start_server
+
+
+def seed(app, projects, keys_per_project):
+    from database import db, APIKey, Project
+
+    with app.app_context():
+        for p in range(projects):
+            project = Project(name=f'service-{p}', position=p)
+            db.session.add(project)
+            db.session.flush()
+            db.session.add_all(
+                APIKey(name=f'SECRET_{i}', key='x' * 40, project_id=project.id, position=i)
+                for i in range(keys_per_project)
+            )
+        db.session.commit()
+
+
+def client(job):
+    port, seconds, projects, keys, write_ratio, seed_value = job
+    rng = random.Random(seed_value)
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies, errors, writes = [], 0, 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        roll = rng.random()
+        if roll < write_ratio:
+            method, path = 'POST', '/keys'
+            body = json.dumps({'name': f'W{seed_value}_{writes}', 'key': 'x', 'project_id': rng.randint(1, projects)})
+            writes += 1
+        elif roll < 0.3:
+            method, path, body = 'GET', f'/keys?project_id={rng.randint(1, projects)}', None
+        else:
+            method, path, body = 'GET', f'/v1/secrets/service-{rng.randrange(projects)}/SECRET_{rng.randrange(keys)}', None
+
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+        latencies.append(time.perf_counter() - started)
+    return latencies, errors
+
+
+def run(server, port, args):
+    jobs = [(port, args.seconds, args.projects, args.keys, args.write_ratio, i) for i in range(args.clients)]
+    with multiprocessing.Pool(args.clients) as pool:
+        results = pool.map(client, jobs)
+    latencies = sorted(latency for result in results for latency in result[0])
+    return {
+        'requests_per_sec': round(len(latencies) / args.seconds, 1),
+        'errors': sum(result[1] for result in results),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', nargs='+', default=['dev', 'gunicorn', 'waitress'])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--projects', type=int, default=10)
+    parser.add_argument('--keys', type=int, default=100, help='Keys per project')
+    parser.add_argument('--write-ratio', type=float, default=0.05)
+    args = parser.parse_args()
+
+    app = create_temp_app('server.db')
+    seed(app, args.projects, args.keys)
+    env = dict(os.environ, DATABASE_PATH=app.config['DATABASE_PATH'], LOG_DIR=app.config['LOG_DIR'],
+               FLASK_SECRET_KEY='benchmark')
+
+    report = {}
+    for server in args.servers:
+        if server != 'dev' and not importlib.util.find_spec(server):
+            report[server] = 'not installed'
+            continue
+        port = free_port()
+        process = start_server(server, port, env, args.workers, args.threads)
+        try:
+            report[server] = run(server, port, args)
+        finally:
+            process.terminate()
+            process.wait()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
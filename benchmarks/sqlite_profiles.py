@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Compare read/write throughput of the SQLite pragma profiles under concurrency.
+
+Readers list a project's keys while writers add keys to it, all through the
+Flask app from separate threads, for a fixed time per profile.
+
+Usage: python benchmarks/sqlite_profiles.py [--profiles legacy default] [--seconds 5]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import Counter
+
+from common import create_temp_app
+
+
+def run_profile(profile, args):
+    from database import db, APIKey, Project
+
+    app = create_temp_app(f'{profile}.db', SQLITE_PROFILE=profile)
+    with app.app_context():
+        project = Project(name='bench', position=0)
+        db.session.add(project)
+        db.session.flush()
+        db.session.add_all(
+            APIKey(name=f'SEED_{i}', key='x' * 40, project_id=project.id, position=i)
+            for i in range(args.seed)
+        )
+        db.session.commit()
+        project_id = project.id
+
+    stop = threading.Event()
+    results = Counter()
+    lock = threading.Lock()
+
+    def reader():
+        client = app.test_client()
+        while not stop.is_set():
+            status = client.get(f'/keys?project_id={project_id}').status_code
+            with lock:
+                results['reads' if status == 200 else 'read_errors'] += 1
+
+    def writer(n):
+        client = app.test_client()
+        i = 0
+        while not stop.is_set():
+            status = client.post('/keys', json={'name': f'W{n}_{i}', 'key': 'x', 'project_id': project_id}).status_code
+            i += 1
+            with lock:
+                results['writes' if status == 201 else 'write_errors'] += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        'reads_per_sec': round(results['reads'] / args.seconds, 1),
+        'writes_per_sec': round(results['writes'] / args.seconds, 1),
+        'read_errors': results['read_errors'],
+        'write_errors': results['write_errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', nargs='+', default=['legacy', 'default'])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=200)
+    args = parser.parse_args()
+
+    report = {profile: run_profile(profile, args) for profile in args.profiles}
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Measure cold start: import time of the app and time to serve the first request.
+
+Each run is a fresh interpreter, like a new worker process. The import
+breakdown comes from `python -X importtime`. Exits with status 1 when the
+median time to the first response exceeds the budget, or when a module
+that should load lazily was imported by then.
+
+Usage: python benchmarks/startup.py [--runs 5] [--budget-ms 1000] [--top 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from common import ROOT, create_temp_app
+
+# Only specific routes and commands need these; importing them at startup is a regression
+LAZY_MODULES = ('flask_migrate', 'alembic', 'mako', 'yaml', 'cryptography')
+
+FIRST_REQUEST = f"""
+import json, sys, time
+sys.path.insert(0, {ROOT!r})
+from app import create_app
+response = create_app().test_client().get('/projects')
+served = time.time()
+print(json.dumps({{'served': served, 'status': response.status_code,
+                  'eager': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Return [(depth, module, self_us, cumulative_us)] from -X importtime output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, label = line[len('import time:'):].split('|')
+        depth = (len(label) - len(label.lstrip()) - 1) // 2
+        modules.append((depth, label.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def import_profile(env, runs, top):
+    best = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True)
+        modules = parse_importtime(result.stderr)
+        total = next(cumulative for depth, name, _, cumulative in modules if depth == 0 and name == 'app')
+        if best is None or total < best[0]:
+            best = (total, modules)
+    total, modules = best
+    direct = sorted((m for m in modules if m[0] == 1), key=lambda m: m[3], reverse=True)[:top]
+    return {
+        'import_app_ms': round(total / 1000, 1),
+        'slowest_imports_ms': {name: round(cumulative / 1000, 1) for _, name, _, cumulative in direct},
+        'lazy_modules_imported': sorted({name.split('.')[0] for _, name, _, _ in modules} & set(LAZY_MODULES)),
+    }
+
+
+def first_request(env, runs):
+    times, eager = [], set()
+    for _ in range(runs):
+        started = time.time()
+        result = subprocess.run([sys.executable, '-c', FIRST_REQUEST], env=env, capture_output=True, text=True,
+                                check=True)
+        report = json.loads(result.stdout.splitlines()[-1])
+        if report['status'] != 200:
+            raise RuntimeError(f"First request failed with status {report['status']}")
+        times.append((report['served'] - started) * 1000)
+        eager.update(report['eager'])
+    return {
+        'first_request_median_ms': round(statistics.median(times), 1),
+        'first_request_max_ms': round(max(times), 1),
+        'lazy_modules_after_first_request': sorted(eager),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='Slowest direct imports of app to list')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('STARTUP_BUDGET_MS', 1000)),
+                        help='Most a fresh process may take to serve its first request (median)')
+    args = parser.parse_args()
+
+    app = create_temp_app('startup.db')
+    env = dict(os.environ, DATABASE_PATH=app.config['DATABASE_PATH'], LOG_DIR=app.config['LOG_DIR'],
+               APP_CONFIG='production', FLASK_SECRET_KEY='benchmark')
+
+    report = import_profile(env, args.runs, args.top)
+    report.update(first_request(env, args.runs))
+    report['budget_ms'] = args.budget_ms
+
+    failures = []
+    if report['first_request_median_ms'] > args.budget_ms:
+        failures.append(f"first request took {report['first_request_median_ms']}ms, budget is {args.budget_ms}ms")
+    if report['lazy_modules_imported'] or report['lazy_modules_after_first_request']:
+        eager = sorted(set(report['lazy_modules_imported']) | set(report['lazy_modules_after_first_request']))
+        failures.append(f"imported at startup: {', '.join(eager)}")
+    report['passed'] = not failures
+    print(json.dumps(report, indent=2))
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
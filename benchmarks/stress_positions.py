@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Hammer the key and project insert routes from many threads and check that
+no two rows in the same project end up with the same position.
+
+Usage: python benchmarks/stress_positions.py [--threads 16] [--requests 400]
+"""
+import argparse
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from common import create_temp_app
+
+
+def post(base_url, path, payload):
+    request = urllib.request.Request(
+        base_url + path,
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=400)
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+    from database import db, APIKey, Project
+
+    app = create_temp_app('stress.db')
+    with app.app_context():
+        project = Project(name='stress', position=0)
+        db.session.add(project)
+        db.session.commit()
+        project_id = project.id
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    def work(i):
+        if i % 10 == 0:
+            return post(base_url, '/projects', {'name': f'stress-{i}'})
+        return post(base_url, '/keys', {'name': f'KEY_{i}', 'key': 'x', 'project_id': project_id})
+
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        statuses = Counter(pool.map(work, range(args.requests)))
+    server.shutdown()
+
+    with app.app_context():
+        key_positions = Counter(
+            (k.project_id, k.position) for k in APIKey.query.all()
+        )
+        project_positions = Counter(p.position for p in Project.query.all())
+
+    duplicates = [pos for pos, n in key_positions.items() if n > 1]
+    duplicates += [('project', pos) for pos, n in project_positions.items() if n > 1]
+
+    print(json.dumps({
+        'statuses': dict(statuses),
+        'keys': sum(key_positions.values()),
+        'projects': sum(project_positions.values()),
+        'duplicate_positions': duplicates
+    }, indent=2))
+    return 1 if duplicates else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class Config:
+    """Settings shared by every environment. Values can be overridden from the environment."""
+    SECRET_KEY = os.environ.get('FLASK_SECRET_KEY', 'dev-fallback-secret')
+    SQLALCHEMY_TRACK_MODIFICATIONS = True
+    # Defaults to keys.db in the instance folder; SQLALCHEMY_DATABASE_URI follows it
+    DATABASE_PATH = os.environ.get('DATABASE_PATH')
+    # logging.conf is resolved against the project, not the working directory
+    LOGGING_CONFIG = os.environ.get('LOGGING_CONFIG', os.path.join(BASE_DIR, 'logging.conf'))
+    LOG_DIR = os.environ.get('LOG_DIR', BASE_DIR)
+    # Overrides the root level from logging.conf, e.g. DEBUG or CRITICAL to silence it
+    LOG_LEVEL = os.environ.get('LOG_LEVEL')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    # Write log records from a background thread instead of the request thread
+    LOG_ASYNC = os.environ.get('LOG_ASYNC', '1') not in ('0', 'false', 'no')
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    # Identical INFO/DEBUG messages kept per second, 0 keeps all
+    LOG_SAMPLE_BURST = int(os.environ.get('LOG_SAMPLE_BURST', 20))
+    # Several worker processes rotate independently; set 0 and rotate externally instead
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+    # X-Query-Count and Server-Timing headers on every response
+    QUERY_STATS = os.environ.get('QUERY_STATS', '1') not in ('0', 'false', 'no')
+    # Statements at least this slow go to slow_queries.log, 0 disables
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+    # In debug mode, warn when one request runs the same statement more often than this
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 20))
+    # Rows deleted per transaction by bulk deletes, so the write lock is released between chunks
+    DELETE_CHUNK_SIZE = int(os.environ.get('DELETE_CHUNK_SIZE', 500))
+    # Most secrets one POST /v1/secrets/resolve may ask for
+    SECRETS_RESOLVE_LIMIT = int(os.environ.get('SECRETS_RESOLVE_LIMIT', 1000))
+    # Requests deriving keys from a password (encrypt, decrypt, export with a password) per process;
+    # more wait in a queue of KDF_QUEUE_SIZE for up to KDF_QUEUE_TIMEOUT seconds, then get a 503
+    KDF_CONCURRENCY = int(os.environ.get('KDF_CONCURRENCY', 2))
+    KDF_QUEUE_SIZE = int(os.environ.get('KDF_QUEUE_SIZE', 8))
+    KDF_QUEUE_TIMEOUT = float(os.environ.get('KDF_QUEUE_TIMEOUT', 10))
+    # Running or waiting per client address before it gets a 429, 0 for no limit
+    KDF_CLIENT_LIMIT = int(os.environ.get('KDF_CLIENT_LIMIT', 2))
+    # Background job threads per process, and keys handled per job checkpoint
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', 200))
+    # Seconds idle workers wait before looking for jobs queued by other processes
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+    # Running jobs whose process stopped updating them for this long are picked up again
+    JOB_STALE_AFTER = float(os.environ.get('JOB_STALE_AFTER', 60))
+    JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+    # Key for the HMAC fingerprints of key values; generated into the instance folder when unset
+    FINGERPRINT_PEPPER = os.environ.get('FINGERPRINT_PEPPER')
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+class ProductionConfig(Config):
+    DEBUG = False
+    # Every worker process has its own pool; keep the total number of SQLite connections modest
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': int(os.environ.get('SQLITE_POOL_SIZE', 4))}
+    # Waiting requests hold a server thread; leave at least one per worker for everything else
+    KDF_QUEUE_SIZE = int(os.environ.get('KDF_QUEUE_SIZE',
+                                        max(0, int(os.environ.get('WEB_THREADS', 4)) - Config.KDF_CONCURRENCY - 1)))
+
+class TestingConfig(Config):
+    TESTING = True
+    ACCESS_FLUSH_INTERVAL = 1
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+def get_config(name=None):
+    """Config class by name, defaulting to the APP_CONFIG environment variable."""
+    name = name or os.environ.get('APP_CONFIG', 'development')
+    if name not in CONFIGS:
+        raise ValueError(f"Unknown config '{name}'. Choose from: {', '.join(CONFIGS)}")
+    return CONFIGS[name]
+# Application configuration
@@ -1,13 +1,20 @@
 from flask_sqlalchemy import SQLAlchemy
-from cryptography.fernet import Fernet
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 import base64
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+import json
 import os
+import time
+from fingerprints import fingerprint
+from metrics import kdf_duration
 
 db = SQLAlchemy()
 
 def generate_key(password: str, salt: bytes = None) -> tuple[bytes, bytes]:
+    # cryptography is imported on first use; most requests and CLI commands never derive a key
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
     if salt is None:
         salt = os.urandom(16)
     kdf = PBKDF2HMAC(
@@ -16,13 +23,148 @@ def generate_key(password: str, salt: bytes = None) -> tuple[bytes, bytes]:
         salt=salt,
         iterations=100000,
     )
+    started = time.perf_counter()
     key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
+    kdf_duration.observe(time.perf_counter() - started)
     return key, salt
 
+class DataRevision(db.Model):
+    """Single-row counter bumped once by every commit that changes data."""
+    __tablename__ = 'data_revision'
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Change log entries at or below this revision have been compacted away
+    compacted_through = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+class ChangeLog(db.Model):
+    """Latest change to each project and key, written by SQLite triggers.
+
+    Rows are inserted with no revision; bump_revision stamps them with the
+    revision of the commit that made them, in the same transaction.
+    """
+    __tablename__ = 'change_log'
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # 'project' or 'key'
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # 'upsert' or 'delete'
+    revision = db.Column(db.Integer, nullable=True, index=True)
+
+    __table_args__ = (
+        db.Index('ix_change_log_entity', 'entity', 'entity_id'),
+    )
+
+class Job(db.Model):
+    """A background job, persisted so it can be followed, cancelled and resumed.
+
+    Written straight through the engine by jobs.py, like the access
+    statistics, so job bookkeeping never bumps the data revision. `params`
+    and `checkpoint` are JSON and never hold passwords.
+    """
+    __tablename__ = 'job'
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    # queued, running, paused, completed, failed or cancelled
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    params = db.Column(db.Text)
+    checkpoint = db.Column(db.Text)
+    # Needs a password that only the process it was submitted to holds
+    needs_secret = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+    total = db.Column(db.Integer)
+    done = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    result = db.Column(db.Text)
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+    # Worker thread running it; running jobs whose heartbeat stops are picked up again
+    owner = db.Column(db.String(100))
+    heartbeat_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'total': self.total,
+            'done': self.done,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+def current_revision() -> int:
+    """Return the revision of the last committed write."""
+    value = db.session.query(DataRevision.value).filter_by(id=1).scalar()
+    return value or 0
+
+def bump_revision(connection) -> None:
+    """Increment the data revision inside the caller's transaction."""
+    table = DataRevision.__table__
+    connection.execute(table.update().where(table.c.id == 1).values(value=table.c.value + 1))
+    # Changes the triggers logged in this transaction belong to the new revision
+    log = ChangeLog.__table__
+    revision = db.select(table.c.value).where(table.c.id == 1).scalar_subquery()
+    connection.execute(log.update().where(log.c.revision.is_(None)).values(revision=revision))
+
+def compact_change_log(connection, keep=10000) -> int:
+    """Drop change log entries more than `keep` revisions old.
+
+    Clients syncing from before the compacted revision get a full snapshot.
+    Returns the number of entries removed.
+    """
+    table = DataRevision.__table__
+    log = ChangeLog.__table__
+    current, compacted = connection.execute(
+        db.select(table.c.value, table.c.compacted_through).where(table.c.id == 1)
+    ).one()
+    through = current - keep
+    if through <= compacted:
+        return 0
+    removed = connection.execute(log.delete().where(log.c.revision <= through)).rowcount
+    connection.execute(table.update().where(table.c.id == 1).values(compacted_through=through))
+    return removed
+
+def mark_revision_dirty(session=None) -> None:
+    """Flag a session as having written data through raw SQL."""
+    (session or db.session).info['revision_dirty'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_writes(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info['revision_dirty'] = True
+
+@event.listens_for(Session, 'after_flush')
+def _track_flushed_writes(session, flush_context):
+    # Flushes before the commit empty new, dirty and deleted; remember that they wrote something
+    if session.new or session.deleted or any(session.is_modified(obj) for obj in session.dirty):
+        session.info['revision_dirty'] = True
+
+@event.listens_for(Session, 'before_commit')
+def _bump_revision(session):
+    dirty = session.info.get('revision_dirty') or bool(session.new) or bool(session.deleted) or any(
+        session.is_modified(obj) for obj in session.dirty
+    )
+    if dirty:
+        # Flush first so the change log rows for pending objects exist when the bump stamps them
+        session.flush()
+        bump_revision(session)
+    # Cleared after the bump, which is itself an UPDATE seen by _track_bulk_writes
+    session.info.pop('revision_dirty', None)
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_revision_flag(session):
+    session.info.pop('revision_dirty', None)
+
 class Project(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
-    position = db.Column(db.Integer, nullable=False, default=0)
+    position = db.Column(db.Integer, nullable=False, default=0, index=True)
+    # Set while a project's keys are deleted in the background; hidden from listings
+    deleting = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
 
@@ -48,15 +190,25 @@ class APIKey(db.Model):
     position = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
+    # Maintained in batches by AccessTracker, never on the read path
+    last_accessed_at = db.Column(db.DateTime, nullable=True, index=True)
+    access_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # HMAC of the plaintext, kept through encryption; missing for keys encrypted
+    # before fingerprints existed until they are next decrypted or rotated
+    fingerprint = db.Column(db.String(64), nullable=True, index=True)
 
     __table_args__ = (
         db.UniqueConstraint('name', 'project_id', name='unique_name_per_project'),
+        db.Index('ix_api_key_project_position', 'project_id', 'position'),
     )
 
     def encrypt_key(self, password: str) -> None:
         if self.encrypted:
             raise ValueError("Key is already encrypted")
             
+        from cryptography.fernet import Fernet
+        if self.fingerprint is None:
+            self.fingerprint = fingerprint(self.key)
         key, salt = generate_key(password)
         f = Fernet(key)
         encrypted_data = f.encrypt(self.key.encode())
@@ -65,24 +217,50 @@ class APIKey(db.Model):
         self.encrypted = True
 
     def decrypt_key(self, password: str) -> None:
+        self.key = self.decrypted_value(password)
+        self.fingerprint = fingerprint(self.key)
+        self.encrypted = False
+        self.encryption_salt = None
+
+    def decrypted_value(self, password: str) -> str:
+        """Return the plaintext of an encrypted key without modifying it."""
         if not self.encrypted:
             raise ValueError("Key is not encrypted")
             
         try:
-            # Ensure salt is bytes
-            salt = bytes(self.encryption_salt) if isinstance(self.encryption_salt, (bytearray, memoryview)) else self.encryption_salt
-            
-            key, _ = generate_key(password, salt)
+            from cryptography.fernet import Fernet
+            key, _ = generate_key(password, self.salt())
             f = Fernet(key)
             encrypted_data = base64.b64decode(self.key.encode('utf-8'))
-            decrypted_data = f.decrypt(encrypted_data)
-            self.key = decrypted_data.decode('utf-8')
-            self.encrypted = False
-            self.encryption_salt = None
+            return f.decrypt(encrypted_data).decode('utf-8')
         except Exception as e:
             # Add more specific error logging
             raise ValueError(f"Decryption failed: {str(e)}") from e
 
+    def salt(self) -> bytes:
+        # Ensure salt is bytes
+        salt = self.encryption_salt
+        return bytes(salt) if isinstance(salt, (bytearray, memoryview)) else salt
+
+    def rotate_key(self, old_key: bytes, new_key: bytes, new_salt: bytes) -> None:
+        """Re-encrypt under `new_key` with keys already derived by generate_key.
+
+        The plaintext only exists in memory here, so callers that derive each
+        key once can rotate many rows for the cost of a few derivations.
+        """
+        if not self.encrypted:
+            raise ValueError("Key is not encrypted")
+
+        from cryptography.fernet import Fernet, InvalidToken
+        try:
+            plaintext = Fernet(old_key).decrypt(base64.b64decode(self.key.encode('utf-8')))
+        except (InvalidToken, ValueError) as e:
+            raise ValueError("Decryption failed: wrong password or corrupted key") from e
+        self.key = base64.b64encode(Fernet(new_key).encrypt(plaintext)).decode('utf-8')
+        self.encryption_salt = new_salt
+        if self.fingerprint is None:
+            self.fingerprint = fingerprint(plaintext.decode('utf-8'))
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -94,5 +272,7 @@ class APIKey(db.Model):
             'project': self.project.to_dict() if self.project else None,
             'position': self.position,
             'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'updated_at': self.updated_at.isoformat(),
+            'last_accessed_at': self.last_accessed_at.isoformat() if self.last_accessed_at else None,
+            'access_count': self.access_count
         }# Database configuration and functions 
\ No newline at end of file
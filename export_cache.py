@@ -0,0 +1,113 @@
+import gzip
+import logging
+import os
+import threading
+from collections import OrderedDict
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+logger = logging.getLogger(__name__)
+
+class CachedExport:
+    def __init__(self, body, key_ids):
+        self.body = body
+        self.key_ids = key_ids
+        compressed = gzip.compress(body, compresslevel=6)
+        # Only worth keeping when it is actually smaller
+        self.gzip_body = compressed if len(compressed) < len(body) else None
+
+    @property
+    def size(self):
+        return len(self.body) + len(self.gzip_body or b'') + 8 * len(self.key_ids)
+
+class ExportCache:
+    """LRU of rendered exports keyed by (project, format, bundle, data revision).
+
+    Bounded by EXPORT_CACHE_BYTES in total and EXPORT_CACHE_MAX_ENTRY per
+    export. Entries for older revisions are dropped as soon as one for a
+    newer revision is stored. Exports that include encrypted keys must never
+    be passed in; the caller checks that.
+    """
+
+    def __init__(self, app=None):
+        self.max_bytes = 0
+        self.max_entry = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['export_cache'] = self
+        app.config.setdefault('EXPORT_CACHE_BYTES', int(os.environ.get('EXPORT_CACHE_BYTES', 64 * 1024 * 1024)))
+        app.config.setdefault('EXPORT_CACHE_MAX_ENTRY', int(os.environ.get('EXPORT_CACHE_MAX_ENTRY', 8 * 1024 * 1024)))
+        self.max_bytes = app.config['EXPORT_CACHE_BYTES']
+        self.max_entry = app.config['EXPORT_CACHE_MAX_ENTRY']
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        revision = key[-1]
+        with self._lock:
+            # A newer revision makes every older entry unreachable, so free them now
+            for stale in [k for k in self._entries if k[-1] < revision]:
+                self._size -= self._entries.pop(stale).size
+            if key in self._entries:
+                self._size -= self._entries.pop(key).size
+            self._entries[key] = entry
+            self._size += entry.size
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def capture(self, key):
+        """Start recording an export that should be stored under `key` once fully sent."""
+        return ExportCapture(self, key)
+
+class ExportCapture:
+    """Records a streamed export and stores it in the cache when the stream finishes.
+
+    Pass on_read to the row reader so cache hits can still be recorded as key
+    accesses. Bodies larger than the cache's max_entry are streamed but not kept.
+    """
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.body = []
+        self.key_ids = []
+        self.size = 0
+        self.keep = cache.max_entry > 0
+
+    def on_read(self, ids):
+        if self.keep:
+            self.key_ids.extend(ids)
+
+    def stream(self, chunks):
+        for chunk in chunks:
+            if self.keep:
+                self.size += len(chunk)
+                if self.size > self.cache.max_entry:
+                    self.keep = False
+                    self.body = []
+                    self.key_ids = []
+                else:
+                    self.body.append(chunk)
+            yield chunk
+        if self.keep:
+            self.cache.put(self.key, CachedExport(b''.join(self.body), tuple(self.key_ids)))
+            logger.debug("Cached export %s (%s bytes)", self.key, self.size)
+
+export_cache = LocalProxy(lambda: current_app.extensions['export_cache'])
+# Revision-keyed cache of rendered exports
@@ -0,0 +1,200 @@
+import base64
+import csv
+import io
+import json
+import re
+import shlex
+import zipfile
+from collections import namedtuple
+from itertools import groupby
+
+ExportRow = namedtuple('ExportRow', 'project_id project name value description used_with')
+
+# Export formats: file suffix and mimetype
+EXPORT_FORMATS = {
+    'env': ('.env', 'text/plain'),
+    'json': ('.json', 'application/json'),
+    'yaml': ('.yaml', 'application/x-yaml'),
+    'shell': ('.sh', 'text/x-shellscript'),
+    'docker': ('.env', 'text/plain'),
+    'k8s': ('.yaml', 'application/x-yaml'),
+    'csv': ('.csv', 'text/csv'),
+}
+
+BUFFER_SIZE = 64 * 1024
+SHELL_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+SECRET_DATA_NAME = re.compile(r'^[-._a-zA-Z0-9]+$')
+
+def group_rows(rows):
+    """Split rows ordered by project into (project name, rows) groups without buffering them."""
+    for _, group in groupby(rows, key=lambda row: row.project_id):
+        first = next(group)
+        yield first.project, _chain_first(first, group)
+
+def _chain_first(first, rest):
+    yield first
+    yield from rest
+
+def _env(groups, title):
+    if title is not None:
+        yield f"# API Keys for project: {title}\n\n"
+        separator = ''
+        for _, rows in groups:
+            for row in rows:
+                yield f"{separator}{row.name}={row.value}"
+                separator = '\n'
+        return
+    for i, (project, rows) in enumerate(groups):
+        yield ('\n' if i else '') + f"# Project: {project}\n"
+        for row in rows:
+            yield f"{row.name}={row.value}\n"
+
+def _json(groups, title):
+    # A flat mapping: a name taken by an earlier project keeps its first value
+    written = set()
+    separator = '{'
+    for _, rows in groups:
+        for row in rows:
+            if row.name in written:
+                continue
+            written.add(row.name)
+            yield f"{separator}\n  {json.dumps(row.name)}: {json.dumps(row.value)}"
+            separator = ','
+    yield '{}' if separator == '{' else '\n}'
+
+def _yaml(groups, title):
+    import yaml
+
+    written = set()
+    for project, rows in groups:
+        for row in rows:
+            if row.name in written:
+                yield f"# Skipped {row.name!r} from {project}: already exported\n"
+                continue
+            written.add(row.name)
+            yield yaml.safe_dump({row.name: row.value}, default_flow_style=False, allow_unicode=True)
+    if not written:
+        yield '{}\n'
+
+def _shell(groups, title):
+    yield '#!/bin/sh\n'
+    for project, rows in groups:
+        yield f"\n# Project: {project}\n"
+        for row in rows:
+            if SHELL_NAME.match(row.name):
+                yield f"export {row.name}={shlex.quote(row.value)}\n"
+            else:
+                yield f"# Skipped {row.name!r}: not a valid variable name\n"
+
+def _docker(groups, title):
+    # Docker env-files take values literally, with no quoting and no line breaks
+    for i, (project, rows) in enumerate(groups):
+        yield ('\n' if i else '') + f"# Project: {project}\n"
+        for row in rows:
+            if '\n' in row.value or '=' in row.name:
+                yield f"# Skipped {row.name!r}: docker env-files cannot hold this key\n"
+            else:
+                yield f"{row.name}={row.value}\n"
+
+def _k8s(groups, title):
+    for project, rows in groups:
+        yield (f"---\napiVersion: v1\nkind: Secret\nmetadata:\n  name: {k8s_name(project)}\n"
+               f"type: Opaque\n")
+        header = 'data:\n'
+        for row in rows:
+            if not SECRET_DATA_NAME.match(row.name):
+                yield f"# Skipped {row.name!r}: not a valid Secret data key\n"
+                continue
+            yield f"{header}  {row.name}: {base64.b64encode(row.value.encode()).decode()}\n"
+            header = ''
+        if header:
+            yield 'data: {}\n'
+
+def _csv(groups, title):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['project', 'name', 'value', 'description', 'used_with'])
+    for project, rows in groups:
+        for row in rows:
+            writer.writerow([project, row.name, row.value, row.description or '', row.used_with or ''])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+FORMATTERS = {
+    'env': _env,
+    'json': _json,
+    'yaml': _yaml,
+    'shell': _shell,
+    'docker': _docker,
+    'k8s': _k8s,
+    'csv': _csv,
+}
+
+def k8s_name(project):
+    """A valid Secret name (DNS subdomain) derived from a project name."""
+    name = re.sub(r'[^a-z0-9.-]+', '-', project.lower()).strip('-.')[:253]
+    return name or 'api-keys'
+
+def file_label(project):
+    return project.replace(' ', '_').replace('/', '_')
+
+def iter_export(rows, export_format, title=None):
+    """Encode an export as bytes in BUFFER_SIZE pieces as the rows are read.
+
+    `title` is the project name when exporting a single project.
+    """
+    pending = []
+    size = 0
+    for chunk in FORMATTERS[export_format](group_rows(rows), title):
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= BUFFER_SIZE:
+            yield ''.join(pending).encode('utf-8')
+            pending = []
+            size = 0
+    if pending:
+        yield ''.join(pending).encode('utf-8')
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands what was written back to a generator.
+
+    It cannot seek, so ZipFile writes data descriptors instead of going
+    back to patch sizes, which is what lets the archive stream.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_zip(rows, export_format):
+    """Stream a zip with one export file per project."""
+    suffix = EXPORT_FORMATS[export_format][0]
+    sink = _ChunkSink()
+    used = set()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for project, group in group_rows(rows):
+            name = f"api_keys_{file_label(project)}"
+            while name + suffix in used:
+                name += '_'
+            used.add(name + suffix)
+            with archive.open(name + suffix, 'w') as member:
+                for chunk in iter_export(group, export_format, project):
+                    member.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+    yield sink.drain()
+# Streaming export formats
@@ -0,0 +1,75 @@
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Name of the SQL function register_sql_function adds to a connection
+SQL_FUNCTION = 'key_fingerprint'
+
+def init_fingerprints(app):
+    """Load the pepper, creating instance/fingerprint_pepper on first start unless FINGERPRINT_PEPPER is set.
+
+    The pepper never goes into the database, so a copy of keys.db alone
+    cannot be used to test guesses against the fingerprints.
+    """
+    if app.config['FINGERPRINT_PEPPER']:
+        return
+    path = os.path.join(app.instance_path, 'fingerprint_pepper')
+    if not os.path.exists(path):
+        # Written aside and linked into place, so concurrent workers all end up with the same pepper
+        temp_path = f'{path}.{os.getpid()}'
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(temp_path, path)
+            logger.info("Created fingerprint pepper %s", path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temp_path)
+    with open(path) as f:
+        app.config['FINGERPRINT_PEPPER'] = f.read().strip()
+
+def compute(value: str, pepper: str) -> str:
+    return hmac.new(pepper.encode(), value.encode(), hashlib.sha256).hexdigest()
+
+def fingerprint(value: str) -> str:
+    """Keyed hash of a key's plaintext, for finding it again without decrypting anything."""
+    return compute(value, current_app.config['FINGERPRINT_PEPPER'])
+
+def register_sql_function(dbapi_connection, pepper=None):
+    """Make key_fingerprint(value) available to SQL run on a SQLite connection."""
+    pepper = pepper or current_app.config['FINGERPRINT_PEPPER']
+    dbapi_connection.create_function(SQL_FUNCTION, 1, lambda value: None if value is None else compute(value, pepper),
+                                     deterministic=True)
+
+def refresh_fingerprints(connection):
+    """Bring every fingerprint in line with the current pepper; returns the number of plaintext keys updated.
+
+    Plaintext keys are hashed again where their fingerprint is missing or
+    differs. If any differed, the file was fingerprinted with another
+    pepper, and the fingerprints of encrypted keys are cleared: they are
+    filled in again the next time those keys are decrypted or rotated.
+    `connection` is a DB-API sqlite3 connection with key_fingerprint
+    registered; the caller commits.
+    """
+    foreign = connection.execute(f"""
+        SELECT COUNT(*) FROM api_key
+        WHERE NOT encrypted AND fingerprint IS NOT NULL AND fingerprint != {SQL_FUNCTION}(key)
+    """).fetchone()[0]
+    updated = connection.execute(f"""
+        UPDATE api_key SET fingerprint = {SQL_FUNCTION}(key)
+        WHERE NOT encrypted AND fingerprint IS NOT {SQL_FUNCTION}(key)
+    """).rowcount
+    if foreign:
+        cleared = connection.execute(
+            'UPDATE api_key SET fingerprint = NULL WHERE encrypted AND fingerprint IS NOT NULL'
+        ).rowcount
+        logger.warning("Fingerprints were made with another pepper; cleared %s of encrypted keys", cleared)
+    return updated
+# Keyed fingerprints of key values for duplicate and leak lookups
@@ -0,0 +1,16 @@
+"""Gunicorn settings tuned for a SQLite-backed app. Each can be overridden from the environment."""
+import os
+
+bind = os.environ.get('WEB_BIND', '127.0.0.1:8000')
+# SQLite has a single writer, so a few processes with a few threads each go
+# further than many workers that would only queue on the write lock
+workers = int(os.environ.get('WEB_WORKERS', 2))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+# Build the app inside each worker so no SQLite connection is inherited across fork
+preload_app = False
+# Imports, exports and database downloads can take a while on large vaults
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+# Gunicorn server configuration
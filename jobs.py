@@ -0,0 +1,296 @@
+import atexit
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from flask import current_app
+from werkzeug.local import LocalProxy
+from database import db, Job
+
+logger = logging.getLogger(__name__)
+
+ACTIVE = ('queued', 'running', 'paused')
+FINISHED = ('completed', 'failed', 'cancelled')
+
+_handlers = {}
+
+def job_handler(kind):
+    """Register func(job) as the code that runs jobs of `kind`."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint once the job has been asked to stop."""
+
+class JobRun:
+    """What a job handler works with: its parameters, secrets and checkpoint.
+
+    Handlers process their work in batches and call checkpoint() after each,
+    which commits the batch together with the progress. A job that is
+    picked up again after a restart starts with the state and `done` of its
+    last checkpoint.
+    """
+
+    def __init__(self, row, secrets):
+        self.id = row.id
+        self.kind = row.kind
+        self.params = json.loads(row.params) if row.params else {}
+        self.state = json.loads(row.checkpoint) if row.checkpoint else {}
+        self.secrets = secrets or {}
+        self.total = row.total
+        self.done = row.done
+
+    def set_total(self, total):
+        self.total = total
+        with db.engine.begin() as conn:
+            conn.execute(Job.__table__.update().where(Job.id == self.id).values(total=total))
+
+    def checkpoint(self, done, **state):
+        """Commit the session's pending changes along with the progress made.
+
+        Raises JobCancelled afterwards if the job was cancelled meanwhile.
+        """
+        self.done = done
+        self.state.update(state)
+        # On the session's connection: same transaction, but not a data change of its own
+        db.session.connection().execute(Job.__table__.update().where(Job.id == self.id).values(
+            done=done, checkpoint=json.dumps(self.state), heartbeat_at=datetime.utcnow()
+        ))
+        db.session.commit()
+        if db.session.query(Job.cancel_requested).filter_by(id=self.id).scalar():
+            raise JobCancelled()
+
+class JobPool:
+    """Runs persisted jobs on JOB_WORKERS threads per process.
+
+    Jobs are claimed from the job table, so with several worker processes
+    each job runs in exactly one of them, and jobs left running by a process
+    that died are queued again once their heartbeat is JOB_STALE_AFTER
+    seconds old. Passwords stay in the memory of the process a job was
+    submitted to; such a job can only run there, and is paused if that
+    process goes away, until it is resumed with the password.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.owner = None
+        self._secrets = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['job_pool'] = self
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+        @app.before_first_request
+        def start_job_workers():
+            self.start()
+
+    @property
+    def upload_dir(self):
+        """Where uploads wait for the job that imports them."""
+        return os.path.join(self.app.instance_path, 'jobs')
+
+    def start(self):
+        with self._lock:
+            if self.owner is not None:
+                return
+            # Unique per process, even when a restarted container reuses the pid
+            self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        for n in range(self.app.config['JOB_WORKERS']):
+            threading.Thread(target=self._work, args=(f'{self.owner}/{n}',), name=f'job-worker-{n}', daemon=True).start()
+        threading.Thread(target=self._monitor, name='job-monitor', daemon=True).start()
+        atexit.register(self.stop)
+
+    def submit(self, kind, params=None, total=None, secrets=None):
+        """Queue a job and return it. `secrets` are kept in memory only."""
+        job_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        if secrets:
+            self._secrets[job_id] = secrets
+        with db.engine.begin() as conn:
+            conn.execute(Job.__table__.insert().values(
+                id=job_id, kind=kind, status='queued', params=json.dumps(params or {}), total=total,
+                needs_secret=bool(secrets), created_at=now, heartbeat_at=now
+            ))
+        logger.info("Queued job %s (%s)", job_id, kind)
+        self.start()
+        self._wake.set()
+        return Job.query.get(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job. Waiting and failed jobs stop at once, running ones at their next checkpoint."""
+        table = Job.__table__
+        with db.engine.begin() as conn:
+            stopped = conn.execute(table.update().where(Job.id == job_id, Job.status.in_(('queued', 'paused', 'failed'))).values(
+                status='cancelled', finished_at=datetime.utcnow()
+            )).rowcount
+            if not stopped:
+                conn.execute(table.update().where(Job.id == job_id, Job.status == 'running').values(cancel_requested=True))
+        if stopped:
+            self._discard(Job.query.get(job_id))
+        return Job.query.get(job_id)
+
+    def resume(self, job_id, secrets=None):
+        """Queue a paused or failed job again, from its last checkpoint."""
+        if secrets:
+            self._secrets[job_id] = secrets
+        with db.engine.begin() as conn:
+            conn.execute(Job.__table__.update().where(Job.id == job_id, Job.status.in_(('paused', 'failed'))).values(
+                status='queued', error=None, finished_at=None, owner=None, heartbeat_at=datetime.utcnow()
+            ))
+        self.start()
+        self._wake.set()
+        return Job.query.get(job_id)
+
+    def stop(self):
+        """Hand this process's running jobs back to the queue so they resume promptly elsewhere."""
+        self._stopped.set()
+        self._wake.set()
+        if self.owner is None:
+            return
+        try:
+            with self.app.app_context(), db.engine.begin() as conn:
+                self._requeue(conn, Job.owner.like(f'{self.owner}/%'))
+        except Exception as e:
+            logger.warning("Could not release running jobs: %s", e)
+
+    def _requeue(self, conn, *criteria):
+        table = Job.__table__
+        running = (Job.status == 'running', *criteria)
+        paused = conn.execute(table.update().where(*running, Job.needs_secret.is_(True)).values(
+            status='paused', owner=None, error='The password is needed to resume this job'
+        )).rowcount
+        queued = conn.execute(table.update().where(*running).values(status='queued', owner=None)).rowcount
+        return paused, queued
+
+    def _work(self, worker):
+        while not self._stopped.is_set():
+            try:
+                job_id = self._claim(worker)
+            except Exception as e:
+                logger.error("Could not claim a job: %s", e)
+                job_id = None
+            if job_id is None:
+                self._wake.wait(self.app.config['JOB_POLL_INTERVAL'])
+                self._wake.clear()
+                continue
+            self._run(job_id)
+
+    def _claim(self, worker):
+        table = Job.__table__
+        with self.app.app_context(), db.engine.begin() as conn:
+            # Jobs needing a password can only run in the process that holds it
+            runnable = db.or_(Job.needs_secret.is_(False), Job.id.in_(list(self._secrets)))
+            next_job = db.select(Job.id).where(Job.status == 'queued', runnable).order_by(Job.created_at).limit(1)
+            # One statement, so two workers can never claim the same job
+            now = datetime.utcnow()
+            claimed = conn.execute(table.update().where(Job.id == next_job.scalar_subquery(), Job.status == 'queued').values(
+                status='running', owner=worker, started_at=db.func.coalesce(Job.started_at, now), heartbeat_at=now
+            )).rowcount
+            if not claimed:
+                return None
+            return conn.execute(db.select(Job.id).where(Job.owner == worker, Job.status == 'running')).scalar()
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            row = Job.query.get(job_id)
+            job = JobRun(row, self._secrets.get(job_id))
+            db.session.rollback()
+            with self._lock:
+                self._running.add(job_id)
+            result, error = None, None
+            try:
+                handler = _handlers.get(job.kind)
+                if handler is None:
+                    raise ValueError(f"Unknown job kind '{job.kind}'")
+                logger.info("Running job %s (%s) from %s/%s", job_id, job.kind, job.done, job.total)
+                result = handler(job)
+                status = 'completed'
+            except JobCancelled:
+                db.session.rollback()
+                status = 'cancelled'
+            except Exception as e:
+                db.session.rollback()
+                status, error = 'failed', str(e)
+                logger.error("Job %s (%s) failed: %s", job_id, job.kind, e)
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+            self._finish(job_id, status, result, error)
+            logger.info("Job %s (%s) %s", job_id, job.kind, status)
+            db.session.remove()
+
+    def _finish(self, job_id, status, result, error):
+        values = dict(status=status, result=json.dumps(result) if result is not None else None, error=error,
+                      owner=None, finished_at=datetime.utcnow())
+        if status == 'completed':
+            # Handlers without batches never checkpoint; a finished job is all done either way
+            values['done'] = db.func.max(Job.done, db.func.coalesce(Job.total, 0))
+        with db.engine.begin() as conn:
+            conn.execute(Job.__table__.update().where(Job.id == job_id).values(**values))
+        self._secrets.pop(job_id, None)
+        # A failed job can be resumed, so it keeps its upload until it is cancelled or expires
+        if status != 'failed':
+            self._discard(Job.query.get(job_id))
+
+    def _discard(self, row):
+        """Forget a job's password and delete its upload."""
+        self._secrets.pop(row.id, None)
+        upload = json.loads(row.params or '{}').get('upload')
+        if upload and os.path.exists(upload):
+            os.unlink(upload)
+
+    def _monitor(self):
+        interval = self.app.config['JOB_STALE_AFTER'] / 4
+        while True:
+            try:
+                self._maintain()
+            except Exception as e:
+                logger.warning("Job maintenance failed: %s", e)
+            if self._stopped.wait(interval):
+                return
+
+    def _maintain(self):
+        now = datetime.utcnow()
+        table = Job.__table__
+        with self.app.app_context(), db.engine.begin() as conn:
+            # Jobs running here, and queued ones only this process can run, are alive
+            with self._lock:
+                alive = self._running | set(self._secrets)
+            if alive:
+                conn.execute(table.update().where(Job.id.in_(alive), Job.status.in_(('queued', 'running'))).values(
+                    heartbeat_at=now
+                ))
+            stale = Job.heartbeat_at < now - timedelta(seconds=self.app.config['JOB_STALE_AFTER'])
+            paused, queued = self._requeue(conn, stale)
+            # Waiting for a password nobody holds any more
+            paused += conn.execute(table.update().where(Job.status == 'queued', Job.needs_secret.is_(True), stale).values(
+                status='paused', error='The password is needed to resume this job'
+            )).rowcount
+            expired = Job.query.filter(
+                Job.status.in_(FINISHED), Job.finished_at < now - timedelta(days=self.app.config['JOB_RETENTION_DAYS'])
+            ).all()
+            for row in expired:
+                self._discard(row)
+            if expired:
+                conn.execute(table.delete().where(Job.id.in_([row.id for row in expired])))
+        if paused or queued:
+            logger.warning("Recovered abandoned jobs: %s queued again, %s paused for a password", queued, paused)
+            self._wake.set()
+
+job_pool = LocalProxy(lambda: current_app.extensions['job_pool'])
+
+def get_job(job_id):
+    return Job.query.get(job_id)
+# Persistent background jobs and the workers that run them
@@ -0,0 +1,162 @@
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from werkzeug.local import LocalProxy
+
+from metrics import kdf_queue_wait, kdf_rejections, kdf_waiting
+
+logger = logging.getLogger(__name__)
+
+class KdfBusy(Exception):
+    """No KDF slot for this request; `status` is 429 for a client over its share, else 503."""
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def response(self):
+        return jsonify({'error': str(self)}), self.status, {'Retry-After': str(self.retry_after)}
+
+class KdfScheduler:
+    """Bounded admission for requests that derive keys with PBKDF2.
+
+    At most KDF_CONCURRENCY such requests run at once per process. Up to
+    KDF_QUEUE_SIZE more wait, each for at most KDF_QUEUE_TIMEOUT seconds,
+    and beyond that callers get a 503 straight away. A client (by remote
+    address) may have KDF_CLIENT_LIMIT requests running or waiting; more get
+    a 429. Free slots go to waiting clients in turn rather than in arrival
+    order, so one client's burst cannot hold the queue. Waiting requests
+    still occupy a server thread, so KDF_CONCURRENCY plus KDF_QUEUE_SIZE
+    should stay below the threads per worker.
+    """
+
+    def __init__(self, app=None):
+        self.concurrency = 1
+        self.queue_size = 0
+        self.client_limit = 0
+        self.timeout = 0
+        self._running = 0
+        self._queued = 0
+        self._clients = Counter()
+        # Waiting requests per client, in the order clients get their next turn
+        self._waiting = OrderedDict()
+        # Seconds a slot is held, smoothed; used for Retry-After
+        self._hold = 1.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['kdf_scheduler'] = self
+        self.concurrency = max(1, app.config['KDF_CONCURRENCY'])
+        self.queue_size = app.config['KDF_QUEUE_SIZE']
+        self.client_limit = app.config['KDF_CLIENT_LIMIT']
+        self.timeout = app.config['KDF_QUEUE_TIMEOUT']
+        kdf_waiting.collect = lambda: self._queued
+
+    def _retry_after(self):
+        backlog = (self._running + self._queued) / self.concurrency
+        return max(1, math.ceil(backlog * self._hold))
+
+    def acquire(self, client):
+        """Take a slot for `client`, waiting in turn if needed; raises KdfBusy."""
+        with self._lock:
+            if self.client_limit and self._clients[client] >= self.client_limit:
+                raise KdfBusy(429, 'Too many password operations in progress for this client', self._retry_after())
+            if self._running < self.concurrency and not self._queued:
+                self._running += 1
+                self._clients[client] += 1
+                return
+            if self._queued >= self.queue_size:
+                raise KdfBusy(503, 'Server is busy with password operations, please retry', self._retry_after())
+            turn = threading.Event()
+            self._waiting.setdefault(client, deque()).append(turn)
+            self._queued += 1
+            self._clients[client] += 1
+
+        started = time.perf_counter()
+        granted = turn.wait(self.timeout)
+        with self._lock:
+            # A slot handed over just as the wait ran out still counts
+            if granted or turn.is_set():
+                kdf_queue_wait.observe(time.perf_counter() - started)
+                return
+            waiting = self._waiting[client]
+            waiting.remove(turn)
+            if not waiting:
+                del self._waiting[client]
+            self._queued -= 1
+            self._forget(client)
+            raise KdfBusy(503, 'Timed out waiting for a password operation slot, please retry', self._retry_after())
+
+    def release(self, client, held):
+        with self._lock:
+            self._hold = 0.8 * self._hold + 0.2 * held
+            self._forget(client)
+            if not self._waiting:
+                self._running -= 1
+                return
+            # The slot passes straight to the next client in turn, which then moves to the back
+            next_client, waiting = next(iter(self._waiting.items()))
+            turn = waiting.popleft()
+            if waiting:
+                self._waiting.move_to_end(next_client)
+            else:
+                del self._waiting[next_client]
+            self._queued -= 1
+            turn.set()
+
+    def _forget(self, client):
+        self._clients[client] -= 1
+        if self._clients[client] <= 0:
+            del self._clients[client]
+
+    @contextmanager
+    def slot(self, client, retry=False):
+        """Hold a slot for the block. With `retry`, rejections are waited out
+        instead of raised, for background jobs that have no caller to answer."""
+        while True:
+            try:
+                self.acquire(client)
+                break
+            except KdfBusy as e:
+                if not retry:
+                    raise
+                time.sleep(e.retry_after)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(client, time.perf_counter() - started)
+
+kdf_scheduler = LocalProxy(lambda: current_app.extensions['kdf_scheduler'])
+
+def kdf_limited(needs_slot=None):
+    """Run the view in a KDF slot, answering 429/503 with Retry-After when there is none.
+
+    `needs_slot`, if given, is called inside the request and decides whether
+    this request derives keys at all.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if needs_slot is not None and not needs_slot():
+                return view(*args, **kwargs)
+            client = request.remote_addr or '-'
+            try:
+                with kdf_scheduler.slot(client):
+                    return view(*args, **kwargs)
+            except KdfBusy as e:
+                kdf_rejections.inc(str(e.status))
+                logger.warning("Rejected %s %s from %s with %s: %s", request.method, request.path, client, e.status, e)
+                return e.response()
+        return wrapper
+    return decorator
+# Bounded scheduling for key-derivation work
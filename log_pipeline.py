@@ -0,0 +1,166 @@
+import atexit
+import copy
+import json
+import logging
+import logging.config
+import queue
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+_listeners = []
+
+def init_logging(app):
+    """Configure logging from LOGGING_CONFIG and keep log I/O off the request path.
+
+    With LOG_ASYNC (the default) the handlers declared in logging.conf run on
+    background threads fed by bounded queues of LOG_QUEUE_SIZE records;
+    when it is full, records are dropped and counted rather than blocking a
+    request. Every record carries the id of the request that logged it, and
+    INFO/DEBUG messages repeated more than LOG_SAMPLE_BURST times a second
+    are sampled.
+    """
+    stop_logging()
+
+    logging.config.fileConfig(app.config['LOGGING_CONFIG'], disable_existing_loggers=False, defaults={
+        'logdir': app.config['LOG_DIR'].replace('\\', '/'),
+        'logformat': app.config['LOG_FORMAT'],
+        'maxbytes': str(app.config['LOG_MAX_BYTES']),
+        'backups': str(app.config['LOG_BACKUP_COUNT']),
+    })
+    root = logging.getLogger()
+    if app.config['LOG_LEVEL']:
+        root.setLevel(app.config['LOG_LEVEL'])
+
+    # Every logger logging.conf gave handlers of its own gets its own queue and writer
+    configured = [root] + [logger for logger in logging.Logger.manager.loggerDict.values()
+                           if isinstance(logger, logging.Logger) and any(
+                               not isinstance(h, (logging.NullHandler, QueueHandler)) for h in logger.handlers)]
+    for logger in configured:
+        if app.config['LOG_ASYNC']:
+            handler = RequestQueueHandler(queue.Queue(app.config['LOG_QUEUE_SIZE']))
+            listener = QueueListener(handler.queue, *logger.handlers, respect_handler_level=True)
+            listener.start()
+            _listeners.append(listener)
+            logger.handlers = [handler]
+        for handler in logger.handlers:
+            handler.addFilter(RequestIdFilter())
+            handler.addFilter(SamplingFilter(app.config['LOG_SAMPLE_BURST']))
+
+    @app.before_request
+    def assign_request_id():
+        supplied = request.headers.get('X-Request-ID', '')
+        g.request_id = supplied if REQUEST_ID.match(supplied) else uuid.uuid4().hex[:16]
+
+    @app.after_request
+    def send_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
+
+def stop_logging():
+    """Write out queued records and stop the background writers."""
+    while _listeners:
+        _listeners.pop().stop()
+
+atexit.register(stop_logging)
+
+class RequestIdFilter(logging.Filter):
+    """Tags records with the current request's id, or '-' outside a request."""
+
+    def filter(self, record):
+        record.request_id = g.get('request_id', '-') if has_request_context() else '-'
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Passes at most `burst` INFO/DEBUG records per message template per second.
+
+    Templates are the unformatted %-style messages, so every "Updated %s keys"
+    counts together. Warnings and errors always pass. The next record of a
+    template after a sampled second carries the number dropped as `suppressed`.
+    """
+
+    MAX_TEMPLATES = 1024
+
+    def __init__(self, burst):
+        super().__init__()
+        self.burst = burst
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.burst or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        second = int(record.created)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or window[0] != second:
+                # Messages built without a template would each get an entry; don't let them pile up
+                if len(self._windows) >= self.MAX_TEMPLATES:
+                    self._windows.clear()
+                if window is not None and window[2]:
+                    record.suppressed = window[2]
+                self._windows[key] = [second, 1, 0]
+                return True
+            window[1] += 1
+            if window[1] <= self.burst:
+                return True
+            window[2] += 1
+            return False
+
+class RequestQueueHandler(QueueHandler):
+    """Queues records for the listener thread without ever blocking the caller.
+
+    Only the %-merge of the message happens here, since the arguments may
+    change once the call returns. Formatting, JSON encoding and the write
+    happen on the listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING', 'request_id': '-',
+                    'msg': f'Dropped {self.dropped} log records: the log queue was full',
+                }))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, request_id, message and exc if any."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'suppressed', 0):
+            entry['suppressed'] = record.suppressed
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+# Queued, structured logging
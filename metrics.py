@@ -0,0 +1,207 @@
+import bisect
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+WRITE_STATEMENT = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+REGISTRY = []
+
+class Metric:
+    """One metric family; each distinct tuple of label values is one series."""
+
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _label_text(self, values, extra=''):
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def samples(self):
+        with self._lock:
+            series = list(self._series.items())
+        for values, value in sorted(series):
+            yield f'{self.name}{self._label_text(values)} {_number(value)}'
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        if not labels:
+            # Scrapers should see 0 rather than no series at all
+            self._series[()] = 0
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+class Gauge(Metric):
+    """A value that goes up and down, or is read from `collect` at scrape time."""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), collect=None):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def samples(self):
+        if self.collect is not None:
+            value = self.collect()
+            if value is not None:
+                yield f'{self.name} {_number(value)}'
+            return
+        yield from super().samples()
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (the last is +Inf), sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(values, (list(counts), total)) for values, (counts, total) in self._series.items()]
+        for values, (counts, total) in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{_number(bound)}"'
+                yield f'{self.name}_bucket{self._label_text(values, le)} {cumulative}'
+            yield f'{self.name}_sum{self._label_text(values)} {_number(total)}'
+            yield f'{self.name}_count{self._label_text(values)} {cumulative}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+http_requests = Counter('http_requests_total', 'Requests handled, by route template and status.',
+                        ('method', 'route', 'status'))
+http_request_duration = Histogram('http_request_duration_seconds',
+                                  'Time until the response headers were ready, by route template.',
+                                  ('method', 'route'))
+http_in_flight = Gauge('http_requests_in_flight', 'Requests being handled right now.')
+sqlite_write_lock_wait = Histogram('sqlite_first_write_seconds',
+                                   "Duration of each transaction's first write statement, where SQLite "
+                                   'waits for the write lock.')
+sqlite_busy_errors = Counter('sqlite_busy_errors_total',
+                             'Statements that failed with "database is locked" after busy_timeout ran out.')
+kdf_duration = Histogram('kdf_derivation_seconds', 'PBKDF2 key derivations and their duration.',
+                         buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+kdf_waiting = Gauge('kdf_requests_waiting', 'Requests waiting for a key-derivation slot.')
+kdf_queue_wait = Histogram('kdf_queue_wait_seconds', 'Time requests waited for a key-derivation slot.')
+kdf_rejections = Counter('kdf_rejections_total', 'Requests turned away for lack of a key-derivation slot, by status.',
+                         ('status',))
+database_size = Gauge('sqlite_database_bytes', 'Size of the database file.')
+wal_size = Gauge('sqlite_wal_bytes', 'Size of the write-ahead log.')
+import_rows = Counter('import_rows_total', 'Keys added by imports, by source.', ('source',))
+export_rows = Counter('export_rows_total', 'Keys written to exports, by where the export came from.', ('source',))
+
+def init_metrics(app):
+    """Record request metrics and expose the database file sizes.
+
+    Values are kept per process; with several workers every scrape sees
+    the worker that answered it.
+    """
+    db_path = app.config['DATABASE_PATH']
+    database_size.collect = lambda: _file_size(db_path)
+    wal_size.collect = lambda: _file_size(db_path + '-wal') or 0
+
+    if not event.contains(Engine, 'after_cursor_execute', observe_first_write):
+        event.listen(Engine, 'after_cursor_execute', observe_first_write)
+        event.listen(Engine, 'commit', end_transaction)
+        event.listen(Engine, 'rollback', end_transaction)
+        event.listen(Pool, 'reset', lambda dbapi_connection, record: record.info.pop('wrote', None))
+        event.listen(Engine, 'handle_error', count_busy_error)
+
+    @app.before_request
+    def start_request_metrics():
+        http_in_flight.inc()
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = g.get('metrics_started')
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            http_requests.inc(request.method, route, str(response.status_code))
+            http_request_duration.observe(time.perf_counter() - started, request.method, route)
+        return response
+
+    @app.teardown_request
+    def end_request_metrics(exc):
+        if g.pop('metrics_started', None) is not None:
+            http_in_flight.dec()
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+def observe_first_write(conn, cursor, statement, parameters, context, executemany):
+    # query_stats.start_timer stamps the start time on the execution context
+    if conn.info.get('wrote') or not WRITE_STATEMENT.match(statement):
+        return
+    conn.info['wrote'] = True
+    started = getattr(context, '_query_started', None)
+    if started is not None:
+        sqlite_write_lock_wait.observe(time.perf_counter() - started)
+
+def end_transaction(conn):
+    conn.info.pop('wrote', None)
+
+def count_busy_error(context):
+    error = context.original_exception
+    if isinstance(error, sqlite3.OperationalError) and 'locked' in str(error):
+        sqlite_busy_errors.inc()
+# In-process metrics in Prometheus format
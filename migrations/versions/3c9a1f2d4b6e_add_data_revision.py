@@ -0,0 +1,31 @@
+"""Add data revision counter
+
+Revision ID: 3c9a1f2d4b6e
+Revises: fix_encryption_schema
+Create Date: 2025-02-10 10:12:31.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9a1f2d4b6e'
+down_revision = 'fix_encryption_schema'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('data_revision',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # The counter is a single row that every write increments
+    op.execute('INSERT INTO data_revision (id, value) VALUES (1, 0)')
+
+
+def downgrade():
+    op.drop_table('data_revision')
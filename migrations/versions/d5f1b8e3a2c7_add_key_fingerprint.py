@@ -0,0 +1,30 @@
+"""Add key fingerprint
+
+Revision ID: d5f1b8e3a2c7
+Revises: a6c3e9d27f14
+Create Date: 2025-02-18 09:26:14.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f1b8e3a2c7'
+down_revision = 'a6c3e9d27f14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ALTER TABLE rather than batch_alter_table: recreating api_key would
+    # drop its change_log triggers. Existing keys are fingerprinted by
+    # `flask fingerprint-keys`, since the pepper is not known here.
+    op.add_column('api_key', sa.Column('fingerprint', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_api_key_fingerprint'), 'api_key', ['fingerprint'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_api_key_fingerprint'), table_name='api_key')
+    # SQLite 3.35+ drops the column in place, keeping the triggers
+    op.execute('ALTER TABLE api_key DROP COLUMN fingerprint')
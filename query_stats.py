@@ -0,0 +1,99 @@
+import logging
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('slow_queries')
+
+# Expanded IN lists and multi-row VALUES differ only in their number of placeholders
+PLACEHOLDER_LIST = re.compile(r'\(\?(?:, \?)+\)')
+
+class QueryStats:
+    """Statements run by one request and the time spent in them."""
+
+    __slots__ = ('count', 'duration', 'shapes')
+
+    def __init__(self, track_shapes):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter() if track_shapes else None
+
+def init_query_stats(app):
+    """Count SQL statements and database time per request.
+
+    Responses get X-Query-Count and a Server-Timing header with the database
+    and total time; statements run while a streamed body is being sent come
+    after the headers and are not included. Statements slower than
+    SLOW_QUERY_MS go to the `slow_queries` log with the types of their
+    parameters, never the values. In debug mode a warning names any
+    statement a request ran more than N_PLUS_ONE_THRESHOLD times.
+    """
+    global _slow_query_seconds
+    _slow_query_seconds = app.config['SLOW_QUERY_MS'] / 1000
+    if not event.contains(Engine, 'before_cursor_execute', start_timer):
+        event.listen(Engine, 'before_cursor_execute', start_timer)
+        event.listen(Engine, 'after_cursor_execute', record_statement)
+
+    if not app.config['QUERY_STATS']:
+        return
+
+    @app.before_request
+    def start_query_stats():
+        g.request_started = time.perf_counter()
+        g.query_stats = QueryStats(app.debug and app.config['N_PLUS_ONE_THRESHOLD'] > 0)
+
+    @app.after_request
+    def add_timing_headers(response):
+        stats = g.get('query_stats')
+        if stats is not None:
+            total = (time.perf_counter() - g.request_started) * 1000
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['Server-Timing'] = (f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries", '
+                                                 f'total;dur={total:.1f}')
+        return response
+
+    @app.teardown_request
+    def report_repeated_statements(exc):
+        stats = g.pop('query_stats', None)
+        if stats is None or stats.shapes is None:
+            return
+        threshold = app.config['N_PLUS_ONE_THRESHOLD']
+        for shape, count in stats.shapes.most_common():
+            if count <= threshold:
+                break
+            logger.warning("Possible N+1 in %s %s: ran %d times: %s", request.method, request.path, count, shape)
+
+_slow_query_seconds = 0
+
+def start_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    if has_request_context():
+        stats = g.get('query_stats')
+        if stats is not None:
+            stats.count += 1
+            stats.duration += elapsed
+            if stats.shapes is not None:
+                stats.shapes[PLACEHOLDER_LIST.sub('(?...)', statement)] += 1
+    if _slow_query_seconds and elapsed >= _slow_query_seconds:
+        slow_logger.warning("%.1fms %s params=%s", elapsed * 1000, statement, bind_shape(parameters, executemany))
+
+def bind_shape(parameters, executemany=False):
+    """Describe parameters by type only; values may be secrets."""
+    if executemany:
+        return f"{len(parameters)} x {bind_shape(parameters[0])}" if parameters else '[]'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{name}: {type(value).__name__}' for name, value in parameters.items()) + '}'
+    return '(' + ', '.join(type(value).__name__ for value in parameters or ()) + ')'
+# Per-request SQL statement counts and timings
@@ -0,0 +1,87 @@
+import base64
+import logging
+import threading
+from flask import current_app
+from werkzeug.local import LocalProxy
+from database import db, APIKey, DataRevision, Project
+
+logger = logging.getLogger(__name__)
+
+class SecretIndex:
+    """In-memory map of (project name, key name) to the stored key value.
+
+    The index remembers the data revision it was built at. Every commit that
+    changes data bumps the revision, so a lookup that finds a newer revision
+    rebuilds the index first. This also covers writes made by other processes
+    or through raw SQL. Values are served as stored: ciphertext for
+    encrypted keys.
+    """
+
+    def __init__(self, app=None):
+        # (revision, entries by (project, name), entries by project), replaced as a whole
+        self._state = (None, {}, {})
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['secret_index'] = self
+
+    def invalidate(self):
+        """Force a rebuild, for changes that do not move the revision (a swapped database file)."""
+        with self._lock:
+            self._state = (None, {}, {})
+
+    def resolve(self, refs):
+        """Look up (project, name) pairs. Returns (revision, entries), None for misses."""
+        revision, entries, _ = self._load()
+        return revision, [entries.get(ref) for ref in refs]
+
+    def project(self, project_name):
+        """All keys of a project by position. Returns (revision, entries), entries None if no such project."""
+        revision, _, projects = self._load()
+        return revision, projects.get(project_name)
+
+    def _load(self):
+        table = DataRevision.__table__
+        with db.engine.connect() as conn:
+            revision = conn.execute(db.select(table.c.value).where(table.c.id == 1)).scalar()
+            state = self._state
+            if state[0] == revision:
+                return state
+
+            with self._lock:
+                # Another thread may have rebuilt it while this one waited
+                if self._state[0] == revision:
+                    return self._state
+
+                # Rows are read after the revision, so they are never older than the revision they are filed under
+                projects = {name: [] for name, in conn.execute(
+                    db.select(Project.name).where(Project.deleting.is_(False)))}
+                rows = conn.execute(
+                    db.select(APIKey.id, APIKey.name, APIKey.key, APIKey.encrypted, APIKey.encryption_salt,
+                              Project.name.label('project'))
+                    .join(Project, APIKey.project_id == Project.id)
+                    .where(Project.deleting.is_(False))
+                    .order_by(Project.id, APIKey.position)
+                )
+                entries = {}
+                for row in rows:
+                    entry = {
+                        'id': row.id,
+                        'project': row.project,
+                        'name': row.name,
+                        'value': row.key,
+                        'encrypted': row.encrypted,
+                        # Clients that hold the password need the salt to decrypt
+                        'salt': base64.b64encode(row.encryption_salt).decode() if row.encryption_salt else None
+                    }
+                    entries[(row.project, row.name)] = entry
+                    projects.setdefault(row.project, []).append(entry)
+
+                self._state = (revision, entries, projects)
+                logger.info("Secret index rebuilt at revision %s with %s keys", revision, len(entries))
+                return self._state
+
+secret_index = LocalProxy(lambda: current_app.extensions['secret_index'])
+# In-memory index behind the /v1/secrets API
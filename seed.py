@@ -0,0 +1,85 @@
+import base64
+import random
+import time
+
+from database import db, APIKey, Project, bump_revision, generate_key
+from fingerprints import fingerprint
+
+SERVICES = {
+    'STRIPE': 'sk_live_', 'GITHUB': 'ghp_', 'AWS': 'AKIA', 'OPENAI': 'sk-', 'SENDGRID': 'SG.',
+    'TWILIO': 'SK', 'SLACK': 'xoxb-', 'DATADOG': '', 'SENTRY': '', 'POSTGRES': '', 'REDIS': '',
+    'GOOGLE_MAPS': 'AIza', 'MAILGUN': 'key-', 'ALGOLIA': '', 'CLOUDFLARE': '', 'AUTH0': '',
+}
+SUFFIXES = ('API_KEY', 'SECRET_KEY', 'TOKEN', 'ACCESS_KEY_ID', 'WEBHOOK_SECRET', 'PASSWORD', 'CLIENT_SECRET')
+PROJECTS = ('payments', 'auth', 'search', 'billing', 'notifications', 'analytics', 'storefront', 'backoffice',
+            'mobile-api', 'data-pipeline', 'support', 'infra')
+USED_WITH = ('backend', 'worker', 'cron', 'frontend build', 'CI', 'staging')
+
+BATCH_SIZE = 5000
+
+def seed_database(connection, projects, keys_per_project, encrypted_ratio=0.0, password='seed-password',
+                  seed=None):
+    """Insert `projects` projects of `keys_per_project` keys each in the caller's transaction.
+
+    Names, values, descriptions and usage look like real vault contents.
+    About `encrypted_ratio` of the keys are encrypted with `password`.
+    Encrypted keys share one salt per project, so the seed derives one key
+    per project rather than one per key. They still decrypt like keys
+    encrypted through the API. Returns counts and the time taken.
+    """
+    from cryptography.fernet import Fernet
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    project_table, key_table = Project.__table__, APIKey.__table__
+    next_position = connection.execute(db.select(db.func.coalesce(db.func.max(project_table.c.position), -1))).scalar() + 1
+    offset = connection.execute(db.select(db.func.count()).select_from(project_table)).scalar()
+
+    encrypted = 0
+    pending = []
+    for p in range(projects):
+        name = f"{PROJECTS[(offset + p) % len(PROJECTS)]}-{offset + p + 1}"
+        project_id = connection.execute(
+            project_table.insert().values(name=name, position=next_position + p)
+        ).inserted_primary_key[0]
+
+        salt = rng.randbytes(16)
+        fernet = Fernet(generate_key(password, salt)[0]) if encrypted_ratio > 0 else None
+        for position, (key_name, value) in enumerate(_keys(rng, keys_per_project)):
+            row = {
+                'name': key_name, 'key': value, 'encrypted': False, 'encryption_salt': None,
+                'fingerprint': fingerprint(value),
+                'description': f"{key_name.split('_')[0].title()} credentials for {name}" if rng.random() < 0.4 else None,
+                'used_with': ', '.join(rng.sample(USED_WITH, rng.randint(1, 2))) if rng.random() < 0.5 else None,
+                'project_id': project_id, 'position': position,
+            }
+            if fernet and rng.random() < encrypted_ratio:
+                row.update(key=base64.b64encode(fernet.encrypt(value.encode())).decode(), encrypted=True,
+                           encryption_salt=salt)
+                encrypted += 1
+            pending.append(row)
+            if len(pending) >= BATCH_SIZE:
+                connection.execute(key_table.insert(), pending)
+                pending = []
+    if pending:
+        connection.execute(key_table.insert(), pending)
+    bump_revision(connection)
+
+    return {
+        'projects': projects,
+        'keys': projects * keys_per_project,
+        'encrypted': encrypted,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+def _keys(rng, count):
+    """Unique key names with values shaped like the service's real tokens."""
+    services = list(SERVICES)
+    for i in range(count):
+        service = services[i % len(services)]
+        suffix = SUFFIXES[(i // len(services)) % len(SUFFIXES)]
+        rounds = i // (len(services) * len(SUFFIXES))
+        name = f"{service}_{suffix}" + (f"_{rounds + 1}" if rounds else '')
+        token = base64.urlsafe_b64encode(rng.randbytes(rng.choice((24, 32, 48)))).decode().rstrip('=')
+        yield name, SERVICES[service] + token
+# Synthetic vault data for load testing
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Run the app under a production server: gunicorn where available, waitress otherwise.
+
+Usage: python serve.py [--server gunicorn|waitress] [--bind 127.0.0.1:8000]
+                       [--workers 2] [--threads 4] [--upgrade]
+
+Defaults come from WEB_BIND, WEB_WORKERS and WEB_THREADS and suit SQLite:
+a couple of processes, a few threads each, WAL journaling. waitress runs a
+single process, so --workers does not apply to it.
+"""
+import argparse
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def default_server():
+    if os.name != 'nt' and importlib.util.find_spec('gunicorn'):
+        return 'gunicorn'
+    return 'waitress'
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=['gunicorn', 'waitress'], default=default_server())
+    parser.add_argument('--bind', default=os.environ.get('WEB_BIND', '127.0.0.1:8000'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', 2)))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 4)))
+    parser.add_argument('--upgrade', action='store_true', help='Apply database migrations before starting')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('APP_CONFIG', 'production')
+    sys.path.insert(0, ROOT)
+    from app import create_app
+
+    app = create_app()
+    if app.config['SQLITE_PRAGMAS'].get('journal_mode', '').upper() != 'WAL' and args.workers > 1:
+        print("Warning: several workers without WAL journaling will serialize on the database lock", file=sys.stderr)
+
+    if args.upgrade:
+        # Once here, before any worker starts, rather than racing in every worker
+        from flask_migrate import upgrade
+        with app.app_context():
+            upgrade()
+
+    if args.server == 'gunicorn':
+        os.chdir(ROOT)
+        os.execvp(sys.executable, [
+            sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+            '--bind', args.bind, '--workers', str(args.workers), '--threads', str(args.threads), 'wsgi:app'
+        ])
+
+    from waitress import serve
+    host, _, port = args.bind.rpartition(':')
+    serve(app, host=host or '127.0.0.1', port=int(port), threads=args.threads)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
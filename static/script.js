@@ -5,6 +5,7 @@ let draggedKey = null;
 let draggedKeyRect = null;
 let draggedProject = null;
 let projectToDelete = null;
+let dataRevision = null;
 
 // Add these new functions for context menu
 let activeProjectId = null;
@@ -286,6 +287,7 @@ async function fetchProjects() {
     try {
         const response = await fetch('/projects');
         const projects = await response.json();
+        dataRevision = parseInt(response.headers.get('X-Data-Revision')) || dataRevision;
         renderProjects(projects);
         updateProjectSelect(projects);
     } catch (error) {
@@ -463,6 +465,7 @@ async function fetchKeys() {
             throw new Error(errorData.error || 'Failed to fetch keys');
         }
         const keys = await response.json();
+        dataRevision = parseInt(response.headers.get('X-Data-Revision')) || dataRevision;
         console.log('Received keys:', keys);
         if (!Array.isArray(keys)) {
             console.error('Expected array of keys but got:', typeof keys, keys);
@@ -811,14 +814,18 @@ async function handleKeyReorder(keyId, newPosition, droppedCard) {
         droppedCard.style.opacity = '0.7';
         droppedCard.style.pointerEvents = 'none';
         
-        const response = await fetch(`/keys/${keyId}/reorder`, {
-            method: 'PATCH',
+        // Send the whole visible order so the server can apply it in one statement
+        const container = document.getElementById('keys-container');
+        const keyIds = [...container.querySelectorAll('.key-card')].map(card => parseInt(card.dataset.keyId));
+        
+        const response = await fetch(`/projects/${selectedProject}/order`, {
+            method: 'PUT',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                new_position: newPosition,
-                project_id: selectedProject
+                key_ids: keyIds,
+                revision: dataRevision
             })
         });
         
@@ -826,6 +833,7 @@ async function handleKeyReorder(keyId, newPosition, droppedCard) {
             const error = await response.json();
             throw new Error(error.error || 'Failed to reorder key');
         }
+        dataRevision = (await response.json()).revision;
         
         // Add success animation
         droppedCard.style.transition = 'all 0.3s ease-in-out';
@@ -939,7 +947,8 @@ function hideDeleteProjectModal() {
 
 async function executeProjectDelete(deleteKeys) {
     try {
-        const response = await fetch(`/projects/${projectToDelete}?delete_keys=${deleteKeys}`, {
+        // Deleting the keys runs as a background job
+        const response = await fetch(`/projects/${projectToDelete}?delete_keys=${deleteKeys}&background=${deleteKeys}`, {
             method: 'DELETE'
         });
 
@@ -950,8 +959,12 @@ async function executeProjectDelete(deleteKeys) {
 
         const responseData = await response.json();
         
-        // Show a notification with what happened
-        showNotification(`Project deleted. ${responseData.keys_affected} keys ${responseData.action}`, 'success');
+        if (response.status === 202) {
+            trackJob(responseData.job, () => fetchProjects());
+        } else {
+            // Show a notification with what happened
+            showNotification(`Project deleted. ${responseData.keys_affected} keys ${responseData.action}`, 'success');
+        }
 
         if (selectedProject === projectToDelete) {
             showAllKeys();
@@ -1114,14 +1127,19 @@ async function handleEnvFileUpload(event) {
     const formData = new FormData();
     formData.append('file', file);
 
+    // Large files are imported in the background
+    const background = file.size > LARGE_IMPORT_BYTES;
+
     try {
-        const response = await fetch(`/projects/${selectedProject}/import-env`, {
+        const response = await fetch(`/projects/${selectedProject}/import-env?background=${background}`, {
             method: 'POST',
             body: formData
         });
 
         const result = await response.json();
-        if (response.ok) {
+        if (response.status === 202) {
+            trackJob(result.job);
+        } else if (response.ok) {
             showPostImportModal(result.keys);
             showNotification('File imported successfully', 'success');
         } else {
@@ -1332,7 +1350,7 @@ function hideClearKeysModal() {
 async function executeClearAllKeys() {
     try {
         const url = selectedProject ? `/projects/${selectedProject}/keys` : '/keys';
-        const response = await fetch(url, {
+        const response = await fetch(`${url}?background=true`, {
             method: 'DELETE'
         });
 
@@ -1341,6 +1359,10 @@ async function executeClearAllKeys() {
         }
 
         const result = await response.json();
+        if (response.status === 202) {
+            trackJob(result.job, () => fetchKeys());
+            return;
+        }
         const projectName = selectedProject ? 
             document.querySelector(`.project-item[data-project-id="${selectedProject}"]`)?.querySelector('.project-name')?.textContent : 
             'all projects';
@@ -2417,14 +2439,18 @@ async function handleDBImport(event) {
         submitBtn.disabled = true;
         submitBtn.innerHTML = '<svg class="animate-spin" xmlns="http://www.w3.org/2000/svg" width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><line x1="12" y1="2" x2="12" y2="6"/><line x1="12" y1="18" x2="12" y2="22"/><line x1="4.93" y1="4.93" x2="7.76" y2="7.76"/><line x1="16.24" y1="16.24" x2="19.07" y2="19.07"/><line x1="2" y1="12" x2="6" y2="12"/><line x1="18" y1="12" x2="22" y2="12"/><line x1="4.93" y1="19.07" x2="7.76" y2="16.24"/><line x1="16.24" y1="7.76" x2="19.07" y2="4.93"/></svg> Importing...';
         
-        const response = await fetch('/import-db', {
+        // Merges run as a background job; an overwrite replaces the file at once
+        const response = await fetch(`/import-db?background=${importMode === 'merge'}`, {
             method: 'POST',
             body: formData
         });
         
         const data = await response.json();
         
-        if (response.ok) {
+        if (response.status === 202) {
+            hideImportDBModal();
+            trackJob(data.job, () => setTimeout(() => window.location.reload(), 1500));
+        } else if (response.ok) {
             showNotification(data.message, 'success');
             hideImportDBModal();
             
@@ -2550,8 +2576,8 @@ function handleEncryption(event) {
         Processing...
     `;
     
-    // Send request
-    fetch(`/keys/${mode}`, {
+    // Send request; the keys are processed by a background job
+    fetch(`/keys/${mode}?background=true`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
@@ -2571,6 +2597,12 @@ function handleEncryption(event) {
             throw new Error(data.error);
         }
         
+        if (data.job) {
+            trackJob(data.job, () => fetchKeys());
+            hideEncryptionModal();
+            return;
+        }
+        
         // Show results
         let message = data.message;
         if (data.failed_keys && data.failed_keys.length > 0) {
@@ -2819,4 +2851,180 @@ async function handleKeyDrop(event, targetProjectId) {
     
     // Show the move/copy modal
     showKeyMoveModal(keyId, targetProjectId);
-}
\ No newline at end of file
+}
+// Background jobs: progress bars for work the server runs outside the request
+const JOB_LABELS = {
+    encrypt_keys: 'Encrypting keys',
+    decrypt_keys: 'Decrypting keys',
+    rotate_password: 'Changing password',
+    import_file: 'Importing file',
+    merge_database: 'Merging database',
+    delete_all_keys: 'Deleting keys',
+    delete_project_keys: 'Deleting keys',
+    delete_project: 'Deleting project'
+};
+const FINISHED_JOB_STATES = ['completed', 'failed', 'cancelled'];
+const trackedJobs = new Map();
+
+// Passwords a paused job asks for to resume, as [field, placeholder]
+const JOB_RESUME_FIELDS = {
+    rotate_password: [['old_password', 'Old password'], ['new_password', 'New password']]
+};
+const DEFAULT_RESUME_FIELDS = [['password', 'Password to resume']];
+
+// Files larger than this are imported as a background job
+const LARGE_IMPORT_BYTES = 64 * 1024;
+
+function getJobPanel() {
+    let panel = document.getElementById('job-progress-panel');
+    if (!panel) {
+        panel = document.createElement('div');
+        panel.id = 'job-progress-panel';
+        panel.className = 'job-progress-panel';
+        document.body.appendChild(panel);
+    }
+    return panel;
+}
+
+function trackJob(job, onFinish = null) {
+    if (trackedJobs.has(job.id)) {
+        return;
+    }
+    trackedJobs.set(job.id, { onFinish });
+
+    const item = document.createElement('div');
+    item.className = 'job-progress-item';
+    item.dataset.jobId = job.id;
+    item.innerHTML = `
+        <div class="job-progress-header">
+            <span class="job-progress-label">${JOB_LABELS[job.kind] || job.kind}</span>
+            <span class="job-progress-count"></span>
+            <button class="job-progress-cancel" title="Cancel" onclick="cancelJob('${job.id}')">
+                <svg xmlns="http://www.w3.org/2000/svg" width="14" height="14" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"><path d="M18 6 6 18"/><path d="m6 6 12 12"/></svg>
+            </button>
+        </div>
+        <div class="job-progress-track"><div class="job-progress-bar"></div></div>
+        <form class="job-progress-resume" onsubmit="resumeJob(event, '${job.id}')">
+            ${(JOB_RESUME_FIELDS[job.kind] || DEFAULT_RESUME_FIELDS).map(([field, placeholder]) =>
+                `<input type="password" name="${field}" placeholder="${placeholder}" required>`).join('')}
+            <button type="submit">Resume</button>
+        </form>
+    `;
+    getJobPanel().appendChild(item);
+    updateJobProgress(job);
+    pollJob(job.id);
+}
+
+function updateJobProgress(job) {
+    const item = document.querySelector(`.job-progress-item[data-job-id="${job.id}"]`);
+    if (!item) return;
+
+    const percent = job.status === 'completed' ? 100 : (job.total ? Math.min(100, Math.round(job.done / job.total * 100)) : 0);
+    item.querySelector('.job-progress-bar').style.width = `${percent}%`;
+    item.classList.toggle('indeterminate', job.status === 'running' && !job.total);
+    item.classList.toggle('paused', job.status === 'paused');
+
+    let status = job.total ? `${job.done} / ${job.total}` : '';
+    if (job.status === 'queued') {
+        status = 'Queued';
+    } else if (job.status === 'paused') {
+        status = 'Paused';
+    } else if (job.cancel_requested) {
+        status = 'Cancelling...';
+    }
+    item.querySelector('.job-progress-count').textContent = status;
+    item.title = job.error || '';
+}
+
+async function pollJob(jobId) {
+    try {
+        const response = await fetch(`/jobs/${jobId}`);
+        if (response.status === 404) {
+            // Gone with a replaced database
+            trackedJobs.delete(jobId);
+            document.querySelector(`.job-progress-item[data-job-id="${jobId}"]`)?.remove();
+            return;
+        }
+        const job = await response.json();
+        updateJobProgress(job);
+        if (FINISHED_JOB_STATES.includes(job.status)) {
+            finishJob(job);
+            return;
+        }
+    } catch (error) {
+        console.error('Error polling job:', error);
+    }
+    setTimeout(() => pollJob(jobId), 1000);
+}
+
+function finishJob(job) {
+    const tracked = trackedJobs.get(job.id);
+    trackedJobs.delete(job.id);
+
+    const label = JOB_LABELS[job.kind] || job.kind;
+    if (job.status === 'completed') {
+        const failed = job.result && job.result.failed_count;
+        showNotification(failed ? `${label} finished, ${failed} failed` : `${label} finished`, failed ? 'warning' : 'success');
+    } else if (job.status === 'failed') {
+        showNotification(`${label} failed: ${job.error}`, 'error');
+    } else {
+        showNotification(`${label} cancelled`, 'warning');
+    }
+
+    const item = document.querySelector(`.job-progress-item[data-job-id="${job.id}"]`);
+    setTimeout(() => item?.remove(), job.status === 'completed' ? 1500 : 0);
+
+    if (tracked && tracked.onFinish) {
+        tracked.onFinish(job);
+    } else {
+        fetchProjects();
+        fetchKeys();
+    }
+}
+
+async function cancelJob(jobId) {
+    try {
+        const response = await fetch(`/jobs/${jobId}/cancel`, { method: 'POST' });
+        const job = await response.json();
+        if (!response.ok) {
+            throw new Error(job.error || 'Failed to cancel job');
+        }
+        updateJobProgress(job);
+    } catch (error) {
+        console.error('Error cancelling job:', error);
+        showNotification(error.message, 'error');
+    }
+}
+
+async function resumeJob(event, jobId) {
+    event.preventDefault();
+    const inputs = [...event.target.querySelectorAll('input')];
+    try {
+        const response = await fetch(`/jobs/${jobId}/resume`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(Object.fromEntries(inputs.map(input => [input.name, input.value])))
+        });
+        const job = await response.json();
+        if (!response.ok) {
+            throw new Error(job.error || 'Failed to resume job');
+        }
+        inputs.forEach(input => { input.value = ''; });
+        updateJobProgress(job);
+    } catch (error) {
+        console.error('Error resuming job:', error);
+        showNotification(error.message, 'error');
+    }
+}
+
+// Pick up jobs that were still running when the page was loaded
+document.addEventListener('DOMContentLoaded', async () => {
+    try {
+        const response = await fetch('/jobs?active=true');
+        if (response.ok) {
+            (await response.json()).forEach(job => trackJob(job));
+        }
+    } catch (error) {
+        console.error('Error fetching jobs:', error);
+    }
+});
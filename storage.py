@@ -0,0 +1,371 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import cached_property
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from backups import bump_generation
+
+try:
+    import fcntl
+except ImportError:  # Windows, where only single-process servers run
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Connection-level pragmas, applied to every new SQLite connection in order.
+# WAL lets readers run alongside a writer, busy_timeout makes writers wait for
+# the lock instead of failing with "database is locked".
+PRAGMA_PROFILES = {
+    # SQLite's own defaults: rollback journal, no busy timeout
+    'legacy': {},
+    'default': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,        # KiB, i.e. 16 MB per connection
+        'mmap_size': 134217728,      # 128 MB
+        'temp_store': 'MEMORY',
+    },
+    # Fsync on every commit; survives power loss without losing the last transactions
+    'durable': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 10000,
+        'synchronous': 'FULL',
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+    },
+    # Larger caches for big vaults on machines with memory to spare
+    'performance': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+}
+
+def init_storage(app):
+    """Resolve the SQLite pragma profile and hook it into every new connection.
+
+    SQLITE_PROFILE selects a profile from PRAGMA_PROFILES, SQLITE_PRAGMAS
+    overrides individual pragmas and SQLITE_CHECKPOINT_INTERVAL (seconds,
+    0 disables) controls the background WAL checkpoint.
+    """
+    app.config.setdefault('SQLITE_PROFILE', os.environ.get('SQLITE_PROFILE', 'default'))
+    app.config.setdefault('SQLITE_CHECKPOINT_INTERVAL', int(os.environ.get('SQLITE_CHECKPOINT_INTERVAL', 300)))
+
+    profile = app.config['SQLITE_PROFILE']
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown SQLite profile '{profile}'. Choose from: {', '.join(PRAGMA_PROFILES)}")
+    pragmas = dict(PRAGMA_PROFILES[profile])
+    pragmas.update(app.config.get('SQLITE_PRAGMAS', {}))
+    app.config['SQLITE_PRAGMAS'] = pragmas
+
+    # SQLAlchemy 1.4 gives SQLite files a NullPool, which would reconnect and
+    # re-run the pragmas on every checkout; keep a pool of tuned connections instead
+    engine_options = app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    engine_options.setdefault('poolclass', QueuePool)
+    engine_options.setdefault('pool_size', int(os.environ.get('SQLITE_POOL_SIZE', 8)))
+    engine_options.setdefault('max_overflow', 8)
+    engine_options['connect_args'] = dict(engine_options.get('connect_args', {}))
+    engine_options['connect_args'].setdefault('check_same_thread', False)
+
+    # One listener on the Engine class serves every app in the process, and
+    # also reaches engines Flask-SQLAlchemy recreates when the URI changes
+    global _default_pragmas
+    _default_pragmas = pragmas
+    if not event.contains(Engine, 'connect', apply_pragmas):
+        event.listen(Engine, 'connect', apply_pragmas)
+
+    # Requests pass through the gate so the database file can be swapped under them
+    app.config.setdefault('DATABASE_SWAP_WAIT', 30)
+    gate = app.extensions['request_gate'] = RequestGate(app.config['DATABASE_PATH'])
+
+    @app.before_request
+    def enter_gate():
+        if not gate.enter(app.config['DATABASE_SWAP_WAIT']):
+            return {'error': 'Database is being replaced, please retry'}, 503, {'Retry-After': '5'}
+        g.entered_gate = True
+        gate.check_replaced(app)
+
+    @app.teardown_request
+    def leave_gate(exc):
+        if g.pop('entered_gate', False):
+            gate.leave()
+
+    @app.before_first_request
+    def start_checkpointer():
+        interval = app.config['SQLITE_CHECKPOINT_INTERVAL']
+        if interval and app.config['SQLITE_PRAGMAS'].get('journal_mode', '').upper() == 'WAL':
+            WalCheckpointer(app, interval).start()
+
+    logger.info("SQLite storage profile '%s': %s", profile, pragmas)
+
+_default_pragmas = {}
+
+def apply_pragmas(dbapi_connection, connection_record):
+    """Run the pragmas of the app in context, or of the last app configured, on a new connection."""
+    if type(dbapi_connection).__module__ != 'sqlite3':
+        return
+    pragmas = current_app.config.get('SQLITE_PRAGMAS', _default_pragmas) if has_app_context() else _default_pragmas
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+def read_pragmas(connection, names=('journal_mode', 'synchronous', 'busy_timeout', 'cache_size',
+                                    'mmap_size', 'temp_store')):
+    """Return the effective value of each pragma on a connection."""
+    return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name in names}
+
+def _flock(fd, operation, timeout=None):
+    """flock() with a timeout in seconds; returns False if it ran out."""
+    if timeout is None:
+        fcntl.flock(fd, operation)
+        return True
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+class RequestGate:
+    """Shared/exclusive gate around request handling, across worker processes.
+
+    Requests hold it shared. exclusive() stops new requests at the gate,
+    waits for the ones in flight to finish and then runs its block alone.
+    Requests that arrive meanwhile wait instead of failing.
+
+    Within a process a condition variable does this; across processes each
+    request also holds a shared flock() on `<database>.lock`, which
+    exclusive() takes exclusively. New requests first pass through
+    `<database>.lock-intent`, which exclusive() holds throughout, so they
+    queue behind a pending swap rather than starving it. Without fcntl
+    only the in-process gate applies.
+    """
+
+    def __init__(self, database_path):
+        self._cond = threading.Condition()
+        self._active = 0
+        self._closed = False
+        self._file_id = None
+        self._lock_path = f'{database_path}.lock'
+        self._intent_path = f'{database_path}.lock-intent'
+        # The lock file descriptor of the request each thread is handling
+        self._held = threading.local()
+
+    def _open(self, path):
+        return os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_CLOEXEC', 0), 0o600)
+
+    def _enter_file(self, timeout):
+        if fcntl is None:
+            return True
+        intent = self._open(self._intent_path)
+        try:
+            if not _flock(intent, fcntl.LOCK_SH, timeout):
+                return False
+            fd = self._open(self._lock_path)
+            if not _flock(fd, fcntl.LOCK_SH, timeout):
+                os.close(fd)
+                return False
+            self._held.fd = fd
+            return True
+        finally:
+            # Closing releases the lock
+            os.close(intent)
+
+    def _leave_file(self):
+        fd = getattr(self._held, 'fd', None)
+        if fd is not None:
+            self._held.fd = None
+            os.close(fd)
+
+    @contextmanager
+    def _exclusive_file(self, timeout):
+        if fcntl is None:
+            yield
+            return
+        intent = self._open(self._intent_path)
+        fd = self._open(self._lock_path)
+        try:
+            if not _flock(intent, fcntl.LOCK_EX, timeout):
+                raise TimeoutError('Timed out waiting for another database swap')
+            # The caller's own request holds the lock shared; flock() cannot convert it reliably, so drop it
+            self._leave_file()
+            if not _flock(fd, fcntl.LOCK_EX, timeout):
+                raise TimeoutError('Timed out waiting for requests in other workers to finish')
+            yield
+        finally:
+            os.close(fd)
+            os.close(intent)
+
+    def check_replaced(self, app):
+        """Drop pooled connections if another process swapped the database file.
+
+        replace_database renames a new file into place, so a changed inode
+        means this process's connections still point at the old one.
+        """
+        try:
+            stat = os.stat(app.config['DATABASE_PATH'])
+        except OSError:
+            return
+        file_id = (stat.st_dev, stat.st_ino)
+        if self._file_id is not None and file_id != self._file_id:
+            from database import db
+            db.engine.dispose()
+            logger.info("Database file was replaced by another process; reconnecting")
+        self._file_id = file_id
+
+    def enter(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: not self._closed, timeout):
+                return False
+            self._active += 1
+        if not self._enter_file(timeout):
+            self.leave()
+            return False
+        return True
+
+    def leave(self):
+        self._leave_file()
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self, timeout=None, holding=1):
+        """Run the block with no other request in flight.
+
+        `holding` is the number of gate slots held by the caller itself,
+        1 when called from inside a request.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: not self._closed)
+            self._closed = True
+            try:
+                if not self._cond.wait_for(lambda: self._active <= holding, timeout):
+                    raise TimeoutError('Timed out waiting for in-flight requests to finish')
+            except BaseException:
+                self._closed = False
+                self._cond.notify_all()
+                raise
+        try:
+            with self._exclusive_file(timeout):
+                yield
+        finally:
+            with self._cond:
+                self._closed = False
+                self._cond.notify_all()
+
+class LazyMigrateConfig:
+    """Stands in for Flask-Migrate's app.extensions['migrate'] entry.
+
+    flask_migrate imports alembic and mako, about half of the app's import
+    time, but only `flask db` and explicit upgrades need it. The Migrate
+    object is built the first time one of them asks for it.
+    """
+
+    def __init__(self, db, directory):
+        self.db = db
+        self.directory = directory
+        self.configure_args = {}
+
+    @property
+    def metadata(self):
+        return self.db.metadata
+
+    @cached_property
+    def migrate(self):
+        from flask_migrate import Migrate
+        return Migrate(db=self.db, directory=self.directory)
+
+def init_migrations(app, db):
+    app.extensions['migrate'] = LazyMigrateConfig(db, os.path.join(app.root_path, 'migrations'))
+
+def upgrade_database_file(app, path):
+    """Bring a standalone database file to the latest migration.
+
+    Files without an alembic_version table are stamped with the revision
+    their columns match before upgrading.
+    """
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import create_engine, inspect
+    from sqlalchemy.pool import NullPool
+
+    config = Config()
+    config.set_main_option('script_location', os.path.join(app.root_path, 'migrations'))
+
+    engine = create_engine(f'sqlite:///{path}', poolclass=NullPool)
+    try:
+        with engine.begin() as conn:
+            config.attributes['connection'] = conn
+            inspector = inspect(conn)
+            if 'alembic_version' not in inspector.get_table_names():
+                columns = {c['name'] for c in inspector.get_columns('api_key')}
+                command.stamp(config, 'fix_encryption_schema' if 'encrypted' in columns else 'e8f95c844ef0')
+            command.upgrade(config, 'head')
+    finally:
+        # Closing the last connection folds the file's -wal back into it
+        engine.dispose()
+
+def replace_database(app, engine, source_path, dest_path):
+    """Atomically swap source_path in as the live database at dest_path.
+
+    Must run inside RequestGate.exclusive(), which also holds off requests
+    in other worker processes. The pool is emptied so no
+    connection stays on the old file, then one rename does the swap.
+    """
+    with engine.connect() as conn:
+        conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+    engine.dispose()
+
+    os.replace(source_path, dest_path)
+    # Scheduled backups compare it as well as the revision, which the new file may share
+    bump_generation(dest_path)
+    # Leftover -wal/-shm files belong to the old database and would corrupt the new one
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(dest_path + suffix):
+            os.unlink(dest_path + suffix)
+    # Anything that connected while the rename happened points at the old inode
+    engine.dispose()
+
+class WalCheckpointer(threading.Thread):
+    """Runs a PASSIVE WAL checkpoint every few minutes.
+
+    SQLite only auto-checkpoints on commit, so a quiet period after a burst
+    of writes would otherwise leave a large -wal file behind.
+    """
+
+    def __init__(self, app, interval):
+        super().__init__(name='wal-checkpoint', daemon=True)
+        self.app = app
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        from database import db
+
+        while not self.stopped.wait(self.interval):
+            try:
+                with self.app.app_context(), db.engine.connect() as conn:
+                    busy, log_pages, checkpointed = conn.exec_driver_sql('PRAGMA wal_checkpoint(PASSIVE)').one()
+                    logger.debug("WAL checkpoint: %s/%s pages (busy=%s)", checkpointed, log_pages, busy)
+            except Exception as e:
+                logger.error("Error checkpointing WAL: %s", e)
+
+    def stop(self):
+        self.stopped.set()
+# SQLite storage tuning
@@ -0,0 +1,23 @@
+import pytest
+from flask_migrate import upgrade
+from app import create_app
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE_PATH': str(tmp_path / 'keys.db'),
+        'BACKUP_DIR': str(tmp_path / 'backups'),
+        'LOG_DIR': str(tmp_path),
+        'FINGERPRINT_PEPPER': 'test-pepper',
+    })
+    # Uploads are written here and renamed over the database, so keep them on its filesystem
+    app.instance_path = str(tmp_path)
+    with app.app_context():
+        upgrade()
+    yield app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+# Shared fixtures: an app on a migrated database in a temporary directory
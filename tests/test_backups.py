@@ -0,0 +1,32 @@
+import io
+import sqlite3
+from backups import BackupScheduler, snapshot_database
+
+def test_backup_is_skipped_when_nothing_changed(app, client):
+    client.post('/keys', json={'name': 'K', 'key': 'v'})
+    scheduler = BackupScheduler.from_app(app, app.config['DATABASE_PATH'], interval=1)
+
+    assert scheduler.run_once()['last_result'] == 'success'
+    assert scheduler.run_once()['last_result'] == 'skipped'
+
+def test_database_swapped_in_at_the_same_revision_is_backed_up(app, client, tmp_path):
+    client.post('/keys', json={'name': 'K', 'key': 'v'})
+    scheduler = BackupScheduler.from_app(app, app.config['DATABASE_PATH'], interval=1)
+    assert scheduler.run_once()['last_result'] == 'success'
+
+    # Same revision number, different data
+    upload = str(tmp_path / 'upload.db')
+    snapshot_database(app.config['DATABASE_PATH'], upload)
+    conn = sqlite3.connect(upload)
+    with conn:
+        conn.execute("UPDATE api_key SET key = 'changed'")
+    conn.close()
+    with open(upload, 'rb') as f:
+        response = client.post('/import-db', data={'file': (io.BytesIO(f.read()), 'upload.db'), 'import-mode': 'overwrite'},
+                               content_type='multipart/form-data')
+    assert response.status_code == 200
+
+    status = scheduler.run_once()
+    assert status['last_result'] == 'success'
+    assert scheduler.run_once()['last_result'] == 'skipped'
+# Scheduled backups and when they are skipped
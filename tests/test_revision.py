@@ -0,0 +1,26 @@
+from database import current_revision
+
+def revision(app):
+    with app.app_context():
+        return current_revision()
+
+def test_adding_a_key_to_a_project_bumps_the_revision(app, client):
+    project = client.post('/projects', json={'name': 'Backend'}).get_json()
+    before = revision(app)
+
+    response = client.post('/keys', json={'name': 'K', 'key': 'v', 'project_id': project['id']})
+
+    assert response.status_code == 201
+    assert revision(app) == before + 1
+
+def test_export_is_not_served_from_cache_after_adding_a_key(client):
+    project = client.post('/projects', json={'name': 'Backend'}).get_json()
+    client.post('/keys', json={'name': 'K', 'key': 'v', 'project_id': project['id']})
+    first = client.get('/export?format=env')
+
+    client.post('/keys', json={'name': 'L', 'key': 'w', 'project_id': project['id']})
+    second = client.get('/export?format=env', headers={'If-None-Match': first.headers['ETag']})
+
+    assert second.status_code == 200
+    assert b'L=w' in second.data
+# Data revision bumps for writes made through the ORM
@@ -0,0 +1,6 @@
+"""WSGI entrypoint for production servers, e.g. `gunicorn -c gunicorn.conf.py wsgi:app`."""
+import os
+from app import create_app
+
+app = create_app(os.environ.get('APP_CONFIG', 'production'))
+# Production WSGI entrypoint